@@ -0,0 +1,470 @@
+"""Vectorized circulation analytics over the loan history (requires NumPy).
+
+The loan history is loaded into column arrays, with dates as days since
+1970-01-01 and member IDs and ISBNs as integer codes into sorted category
+arrays. Each report is then a few array operations (``bincount``,
+``histogram``), not a Python loop over the loans.
+
+    python analytics.py --data-dir ./data all --top 10
+"""
+import argparse
+import csv
+import io
+import json
+import os
+from dataclasses import dataclass, fields, replace
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from models import Loan
+from storage import open_storage
+
+# loans.csv is parsed this many bytes at a time, which bounds the memory
+# used by the intermediate arrays
+CHUNK_BYTES = 32 << 20
+
+# Loan columns saved in the data directory, so that the next run only
+# parses the loans appended since
+COLUMNS_CACHE = 'loans.columns.npz'
+
+# Rows longer than this are parsed by the csv module
+MAX_FIELD_BYTES = 256
+
+# Day number marking a loan that has not been returned
+OPEN = np.iinfo(np.int32).min
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Days late, as histogram edges: on time, 1-7, 8-14, 15-30 and over 30
+LATENESS_EDGES = (-np.inf, 0.5, 7.5, 14.5, 30.5, np.inf)
+LATENESS_LABELS = ('on time', '1-7 days', '8-14 days', '15-30 days', 'over 30 days')
+
+# 64-bit FNV-1a, to match loan IDs without keeping them (see _keys)
+FNV_OFFSET = np.uint64(14695981039346656037)
+FNV_PRIME = np.uint64(1099511628211)
+
+
+@dataclass
+class LoanColumns:
+    """The loan history as arrays; ``members[member_codes[i]]`` is loan i's member."""
+    member_codes: np.ndarray
+    members: np.ndarray
+    isbn_codes: np.ndarray
+    isbns: np.ndarray
+    issue_days: np.ndarray
+    due_days: np.ndarray
+    # OPEN for loans not yet returned
+    return_days: np.ndarray
+    # Hashes of the loan IDs, to apply returns recorded in returns.csv
+    loan_keys: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.issue_days)
+
+
+@dataclass
+class BookColumns:
+    isbns: np.ndarray
+    titles: List[str]
+    copies_total: np.ndarray
+    copies_available: np.ndarray
+
+
+def _field(buf: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Cut ``buf[starts[i]:ends[i]]`` out for every i as the rows of a byte matrix.
+
+    Shorter fields are padded with NUL bytes, as in a fixed-width bytes
+    array. ``buf`` must extend at least the widest field past the last start.
+    """
+    lengths = ends - starts
+    width = int(lengths.max(initial=0)) or 1
+    chars = sliding_window_view(buf, width)[starts]
+    chars[np.arange(width) >= lengths[:, None]] = 0
+    return chars
+
+
+def _matrix(values: np.ndarray) -> np.ndarray:
+    """The byte matrix of a fixed-width bytes array."""
+    return np.ascontiguousarray(values).view(np.uint8).reshape(len(values), -1)
+
+
+def _keys(chars: np.ndarray) -> np.ndarray:
+    """FNV-1a hashes of the rows of a byte matrix, NUL padding ignored."""
+    keys = np.full(len(chars), FNV_OFFSET)
+    for column in chars.T:
+        keys = np.where(column != 0, (keys ^ column) * FNV_PRIME, keys)
+    return keys
+
+
+def _days_from_civil(year: np.ndarray, month: np.ndarray, day: np.ndarray) -> np.ndarray:
+    # Days since 1970-01-01 in the proleptic Gregorian calendar
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def _days(chars: np.ndarray) -> np.ndarray:
+    """Days since 1970 of ``YYYY-MM-DD`` fields; empty fields are OPEN."""
+    chars = chars[:, :10] if chars.shape[1] >= 10 else np.pad(chars, ((0, 0), (0, 10 - chars.shape[1])))
+    empty = chars[:, 0] == 0
+    digits = chars[:, [0, 1, 2, 3, 5, 6, 8, 9]].astype(np.int32) - ord('0')
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 4] * 10 + digits[:, 5]
+    day = digits[:, 6] * 10 + digits[:, 7]
+    valid = empty | (((digits >= 0) & (digits <= 9)).all(axis=1)
+                     & (chars[:, 4] == ord('-')) & (chars[:, 7] == ord('-'))
+                     & (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31))
+    if not valid.all():
+        bad = bytes(chars[~valid][0]).rstrip(b'\0').decode(errors='replace')
+        raise ValueError(f'Invalid date {bad!r} in the loan history')
+    return np.where(empty, OPEN, _days_from_civil(year, month, day)).astype(np.int32)
+
+
+def _parse_chunk(data: bytes) -> Tuple[np.ndarray, ...]:
+    """Parse whole loan rows into (member ID bytes, ISBN bytes, issue, due, return days, loan keys)."""
+    # Padded so that every field can be cut out at its full width
+    buf = np.frombuffer(data + bytes(MAX_FIELD_BYTES), np.uint8)
+    ends = np.flatnonzero(buf[:len(data)] == ord('\n'))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    line_ends = ends - (buf[np.maximum(ends - 1, 0)] == ord('\r'))
+    commas = np.flatnonzero(buf[:len(data)] == ord(','))
+    # Rows written by the storage have exactly five commas and no quotes;
+    # anything else (quoted fields, blank lines) goes through the csv module
+    if (b'"' in data or len(commas) != 5 * len(ends)
+            or (line_ends - starts).max(initial=0) > MAX_FIELD_BYTES):
+        return _parse_rows(data)
+    commas = commas.reshape(-1, 5)
+    if not ((commas[:, 0] > starts).all() and (commas[:, 4] < line_ends).all()):
+        return _parse_rows(data)
+    return (_field(buf, commas[:, 0] + 1, commas[:, 1]),
+            _field(buf, commas[:, 1] + 1, commas[:, 2]),
+            _days(_field(buf, commas[:, 2] + 1, commas[:, 3])),
+            _days(_field(buf, commas[:, 3] + 1, commas[:, 4])),
+            _days(_field(buf, commas[:, 4] + 1, line_ends)),
+            _keys(_field(buf, starts, commas[:, 0])))
+
+
+def _parse_rows(data: bytes) -> Tuple[np.ndarray, ...]:
+    rows = [row for row in csv.reader(io.StringIO(data.decode())) if row]
+    columns = list(zip(*rows)) or [()] * 6
+    chars = [_matrix(np.array([value.encode() for value in column] or [b''], dtype=bytes))
+             for column in columns]
+    if not rows:
+        chars = [c[:0] for c in chars]
+    return chars[1], chars[2], _days(chars[3]), _days(chars[4]), _days(chars[5]), _keys(chars[0])
+
+
+def _categorical(chunks: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Integer codes and sorted categories for byte matrices split over chunks.
+
+    Each value is packed into big-endian 64-bit words, so sorting the words
+    sorts the values; integer sorts are many times faster than string sorts.
+    """
+    width = -(-max((c.shape[1] for c in chunks), default=1) // 8) * 8
+    chars = np.zeros((sum(len(c) for c in chunks), width), np.uint8)
+    row = 0
+    for chunk in chunks:
+        chars[row:row + len(chunk), :chunk.shape[1]] = chunk
+        row += len(chunk)
+    words = chars.view('>u8').astype(np.uint64)
+    if width == 8:
+        keys, codes = np.unique(words[:, 0], return_inverse=True)
+        categories = keys.astype('>u8')[:, None]
+    else:
+        order = np.lexsort(words.T[::-1])
+        ordered = words[order]
+        first = np.ones(len(ordered), bool)
+        first[1:] = (ordered[1:] != ordered[:-1]).any(axis=1)
+        codes = np.empty(len(ordered), np.intp)
+        codes[order] = np.cumsum(first) - 1
+        categories = ordered[first].astype('>u8')
+    values = np.ascontiguousarray(categories).view(f'S{width}').ravel()
+    return codes.astype(np.int32).ravel(), np.char.decode(values)
+
+
+def _merge(codes: np.ndarray, categories: np.ndarray, new_codes: np.ndarray,
+           new_categories: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Append coded values to coded values, re-coding both into one category array."""
+    merged = np.union1d(categories, new_categories)
+    return (np.concatenate([np.searchsorted(merged, categories).astype(np.int32)[codes],
+                            np.searchsorted(merged, new_categories).astype(np.int32)[new_codes]]),
+            merged)
+
+
+def _columns(chunks: List[Tuple[np.ndarray, ...]], base: Optional[LoanColumns] = None) -> LoanColumns:
+    member_codes, members = _categorical([c[0] for c in chunks])
+    isbn_codes, isbns = _categorical([c[1] for c in chunks])
+
+    def column(i, dtype=np.int32):
+        return np.concatenate([c[i] for c in chunks]) if chunks else np.zeros(0, dtype)
+    loans = LoanColumns(member_codes, members, isbn_codes, isbns, column(2), column(3), column(4),
+                        column(5, np.uint64))
+    if base is None:
+        return loans
+    member_codes, members = _merge(base.member_codes, base.members, loans.member_codes, loans.members)
+    isbn_codes, isbns = _merge(base.isbn_codes, base.isbns, loans.isbn_codes, loans.isbns)
+    return LoanColumns(member_codes, members, isbn_codes, isbns,
+                       np.concatenate([base.issue_days, loans.issue_days]),
+                       np.concatenate([base.due_days, loans.due_days]),
+                       np.concatenate([base.return_days, loans.return_days]),
+                       np.concatenate([base.loan_keys, loans.loan_keys]))
+
+
+def _read_cache(cache_path: str, inode: int, size: int) -> Tuple[Optional[LoanColumns], int]:
+    """Columns saved for the same loans.csv, and the offset they cover."""
+    try:
+        with np.load(cache_path) as saved:
+            if int(saved['inode']) != inode or int(saved['offset']) > size:
+                return None, 0
+            return LoanColumns(*(saved[f.name] for f in fields(LoanColumns))), int(saved['offset'])
+    except (OSError, KeyError, ValueError):
+        return None, 0
+
+
+def _write_cache(cache_path: str, loans: LoanColumns, inode: int, offset: int) -> None:
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, inode=inode, offset=offset,
+                     **{f.name: getattr(loans, f.name) for f in fields(LoanColumns)})
+        os.replace(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_loans(path: str, chunk_bytes: int = CHUNK_BYTES,
+               cache_path: Optional[str] = None) -> LoanColumns:
+    """Load a loans.csv file into columns, ``chunk_bytes`` at a time.
+
+    With ``cache_path`` the columns are saved there, and the next call
+    parses only the rows appended since (loans.csv is append-only); a
+    replaced or truncated file is parsed afresh. A last line without its
+    newline may still be being written, so it is skipped, as the cached
+    storage does.
+    """
+    chunks = []
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        base, offset = _read_cache(cache_path, st.st_ino, st.st_size) if cache_path else (None, 0)
+        if offset:
+            f.seek(offset)
+        else:
+            f.readline()
+        offset = f.tell()
+        rest = b''
+        while True:
+            data = f.read(chunk_bytes)
+            if not data:
+                break
+            data = rest + data
+            end = data.rfind(b'\n') + 1
+            rest = data[end:]
+            if end:
+                chunks.append(_parse_chunk(data[:end]))
+                offset += end
+    if base is not None and not chunks:
+        return base
+    loans = _columns(chunks, base)
+    if cache_path:
+        _write_cache(cache_path, loans, st.st_ino, offset)
+    return loans
+
+
+def apply_returns(loans: LoanColumns, path: str) -> LoanColumns:
+    """Fill in the return dates recorded in a returns.csv file.
+
+    Returns are appended there rather than written into loans.csv (see
+    ``Storage.return_loan``), so the cached columns stay valid; the file
+    holds only loans returned since they were issued, and is read afresh.
+    """
+    with open(path, 'r', newline='') as f:
+        rows = [row for row in csv.reader(f) if row][1:]
+    if not rows:
+        return loans
+    ids, dates = zip(*rows)
+    keys = _keys(_matrix(np.char.encode(np.array(ids, dtype=str))))
+    days = _days(_matrix(np.char.encode(np.array(dates, dtype=str))))
+    order = np.argsort(keys)
+    keys, days = keys[order], days[order]
+    pos = np.minimum(np.searchsorted(keys, loans.loan_keys), len(keys) - 1)
+    hit = (keys[pos] == loans.loan_keys) & (loans.return_days == OPEN)
+    return_days = loans.return_days.copy()
+    return_days[hit] = days[pos[hit]]
+    return replace(loans, return_days=return_days)
+
+
+def loans_from_records(loans: Iterable[Loan]) -> LoanColumns:
+    """Columns from Loan objects, for storage engines without a loans.csv."""
+    loan_ids, members, isbns, issued, due, returned = [], [], [], [], [], []
+    for loan in loans:
+        loan_ids.append(loan.loan_id)
+        members.append(loan.member_id)
+        isbns.append(loan.isbn)
+        issued.append(loan.issue_date.toordinal() - EPOCH_ORDINAL)
+        due.append(loan.due_date.toordinal() - EPOCH_ORDINAL)
+        returned.append(loan.return_date.toordinal() - EPOCH_ORDINAL if loan.return_date else OPEN)
+    member_codes, member_values = _categorical([_matrix(np.char.encode(np.array(members, dtype=str)))])
+    isbn_codes, isbn_values = _categorical([_matrix(np.char.encode(np.array(isbns, dtype=str)))])
+    return LoanColumns(member_codes, member_values, isbn_codes, isbn_values,
+                       np.array(issued, np.int32), np.array(due, np.int32),
+                       np.array(returned, np.int32),
+                       _keys(_matrix(np.char.encode(np.array(loan_ids, dtype=str)))))
+
+
+def load_books(storage) -> BookColumns:
+    """Current copy counts of every book, journal included."""
+    books = list(storage.iter_books())
+    return BookColumns(np.array([b.isbn for b in books], dtype=str), [b.title for b in books],
+                       np.array([b.copies_total for b in books], np.int32),
+                       np.array([b.copies_available for b in books], np.int32))
+
+
+def load(data_dir: str, cache: bool = True) -> Tuple[LoanColumns, BookColumns]:
+    """Load the loans and books of a data directory.
+
+    The loan columns of a CSV directory are cached in ``COLUMNS_CACHE``
+    there unless ``cache`` is false; returns.csv is applied on top.
+    """
+    storage = open_storage(data_dir)
+    loans_file = getattr(storage, 'loans_file', None)
+    # A partitioned history is streamed: its loans_file has only open loans
+    if hasattr(storage, 'partitions'):
+        loans_file = None
+    if loans_file is not None and os.path.exists(loans_file):
+        cache_path = os.path.join(data_dir, COLUMNS_CACHE) if cache else None
+        loans = load_loans(loans_file, cache_path=cache_path)
+        if os.path.exists(storage.returns_file):
+            loans = apply_returns(loans, storage.returns_file)
+    else:
+        loans = loans_from_records(storage.iter_loans())
+    return loans, load_books(storage)
+
+
+def _top(labels: np.ndarray, counts: np.ndarray, top: Optional[int]) -> List[Tuple[str, int]]:
+    # Highest count first; ties in label order
+    order = np.argsort(-counts, kind='stable')
+    if top is not None:
+        order = order[:top]
+    return [(str(labels[i]), int(counts[i])) for i in order]
+
+
+def loans_per_isbn(loans: LoanColumns, top: Optional[int] = None) -> List[Tuple[str, int]]:
+    return _top(loans.isbns, np.bincount(loans.isbn_codes, minlength=len(loans.isbns)), top)
+
+
+def loans_per_member(loans: LoanColumns, top: Optional[int] = None) -> List[Tuple[str, int]]:
+    return _top(loans.members, np.bincount(loans.member_codes, minlength=len(loans.members)), top)
+
+
+def loans_per_month(loans: LoanColumns) -> List[Tuple[str, int]]:
+    """Loans issued in each calendar month, oldest first, as ('YYYY-MM', count)."""
+    if not len(loans):
+        return []
+    months = loans.issue_days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    first = months.min()
+    counts = np.bincount(months - first)
+    labels = (first + np.arange(len(counts))).astype('datetime64[M]')
+    return [(str(label), int(count)) for label, count in zip(labels, counts) if count]
+
+
+def loan_duration(loans: LoanColumns) -> Dict[str, float]:
+    """Days from issue to return over returned loans."""
+    returned = loans.return_days != OPEN
+    days = loans.return_days[returned] - loans.issue_days[returned]
+    if not len(days):
+        return {'returned': 0, 'mean_days': 0.0, 'median_days': 0.0, 'max_days': 0}
+    return {'returned': int(len(days)), 'mean_days': float(days.mean()),
+            'median_days': float(np.median(days)), 'max_days': int(days.max())}
+
+
+def lateness(loans: LoanColumns, as_of: Optional[datetime] = None) -> Dict[str, int]:
+    """Returned loans by days late, plus open loans overdue on ``as_of``."""
+    as_of = as_of or datetime.now()
+    returned = loans.return_days != OPEN
+    late = loans.return_days[returned] - loans.due_days[returned]
+    counts, _ = np.histogram(late, LATENESS_EDGES)
+    report = dict(zip(LATENESS_LABELS, (int(c) for c in counts)))
+    today = as_of.toordinal() - EPOCH_ORDINAL
+    report['open, overdue'] = int(np.count_nonzero(loans.due_days[~returned] < today))
+    report['open, not yet due'] = int(np.count_nonzero(~returned)) - report['open, overdue']
+    return report
+
+
+def utilization(books: BookColumns, top: Optional[int] = None) -> List[Tuple[str, str, int, int, float]]:
+    """Books by the share of their copies on loan: (isbn, title, on loan, total, share)."""
+    on_loan = books.copies_total - books.copies_available
+    share = np.divide(on_loan, books.copies_total, out=np.zeros(len(on_loan)),
+                      where=books.copies_total > 0)
+    order = np.lexsort((-on_loan, -share))
+    if top is not None:
+        order = order[:top]
+    return [(str(books.isbns[i]), books.titles[i], int(on_loan[i]), int(books.copies_total[i]),
+             float(share[i])) for i in order]
+
+
+REPORTS = ('by-isbn', 'by-member', 'by-month', 'duration', 'lateness', 'utilization')
+
+
+def run_report(name: str, loans: LoanColumns, books: BookColumns, top: Optional[int],
+               as_of: Optional[datetime] = None):
+    if name == 'by-isbn':
+        return loans_per_isbn(loans, top)
+    if name == 'by-member':
+        return loans_per_member(loans, top)
+    if name == 'by-month':
+        return loans_per_month(loans)
+    if name == 'duration':
+        return loan_duration(loans)
+    if name == 'lateness':
+        return lateness(loans, as_of)
+    if name == 'utilization':
+        return utilization(books, top)
+    raise ValueError(f'Unknown report {name!r}')
+
+
+def _print_report(name: str, result) -> None:
+    print(f'\n=== {name} ===')
+    if isinstance(result, dict):
+        for key, value in result.items():
+            print(f'{key:<20} {value:>12.2f}' if isinstance(value, float) else f'{key:<20} {value:>12}')
+    elif name == 'utilization':
+        for isbn, title, on_loan, total, share in result:
+            print(f'{isbn:<15} {title[:40]:<40} {on_loan:>4}/{total:<4} {share:>6.0%}')
+    else:
+        for label, count in result:
+            print(f'{label:<15} {count:>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Circulation reports over the loan history')
+    parser.add_argument('reports', nargs='+', choices=REPORTS + ('all',))
+    parser.add_argument('--data-dir', default='./data',
+                        help='Directory for CSV files, or sqlite:///path.db for SQLite')
+    parser.add_argument('--top', type=int, default=20,
+                        help='Rows shown for the per-ISBN, per-member and utilization reports')
+    parser.add_argument('--as-of', type=lambda s: datetime.strptime(s, '%Y-%m-%d'),
+                        help='Date for the overdue counts (default: today), YYYY-MM-DD')
+    parser.add_argument('--json', action='store_true', help='Print the reports as JSON')
+    parser.add_argument('--no-cache', action='store_true',
+                        help=f'Parse all of loans.csv instead of updating {COLUMNS_CACHE}')
+    args = parser.parse_args()
+
+    loans, books = load(args.data_dir, cache=not args.no_cache)
+    names = REPORTS if 'all' in args.reports else args.reports
+    results = {name: run_report(name, loans, books, args.top, args.as_of) for name in names}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f'{len(loans)} loans, {len(books.isbns)} books')
+        for name, result in results.items():
+            _print_report(name, result)
+
+if __name__ == '__main__':
+    main()
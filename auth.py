@@ -1,65 +1,185 @@
-import bcrypt
-from typing import Optional, Dict, Literal
-from datetime import datetime
-from models import Member
-from storage import Storage
-
-Role = Literal['librarian', 'member']
-
-class Auth:
-    def __init__(self, storage: Storage):
-        self.storage = storage
-        self.current_session: Dict[str, str] = {}
-        # Initialize with secure default admin account
-        self._admin_username = 'admin'
-        self._admin_password_hash = bcrypt.hashpw('LibAdmin@2024'.encode(), bcrypt.gensalt())
-
-    def register_member(self, member_id: str, name: str, password: str, email: str) -> bool:
-        """Register a new member with hashed password."""
-        if self.storage.get_member_by_id(member_id):
-            return False
-
-        password_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
-        new_member = Member(
-            member_id=member_id,
-            name=name,
-            password_hash=password_hash.decode(),
-            email=email,
-            join_date=datetime.now()
-        )
-        self.storage.add_member(new_member)
-        return True
-
-    def login(self, role: Role, username: str, password: str) -> bool:
-        """Login as either librarian or member."""
-        if role == 'librarian':
-            if username == self._admin_username and bcrypt.checkpw(
-                password.encode(), self._admin_password_hash
-            ):
-                self.current_session['role'] = 'librarian'
-                self.current_session['user_id'] = username
-                return True
-            return False
-
-        member = self.storage.get_member_by_id(username)
-        if member and bcrypt.checkpw(password.encode(), member.password_hash.encode()):
-            self.current_session['role'] = 'member'
-            self.current_session['user_id'] = username
-            return True
-        return False
-
-    def logout(self) -> None:
-        """Clear the current session."""
-        self.current_session.clear()
-
-    def get_current_user(self) -> Optional[Dict[str, str]]:
-        """Get the current logged-in user's information."""
-        return self.current_session if self.current_session else None
-
-    def is_librarian(self) -> bool:
-        """Check if the current user is a librarian."""
-        return self.current_session.get('role') == 'librarian'
-
-    def is_member(self) -> bool:
-        """Check if the current user is a member."""
-        return self.current_session.get('role') == 'member'
\ No newline at end of file
+import bcrypt
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Dict, Iterable, List, Literal
+from datetime import datetime
+from models import Member
+from storage import Storage
+from sessions import SessionStore
+
+Role = Literal['librarian', 'member']
+
+# bcrypt's own default cost factor
+DEFAULT_ROUNDS = 12
+
+def hash_password(password: str, rounds: int = DEFAULT_ROUNDS) -> str:
+    """Hash one password (module level so worker processes can run it)."""
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+def hash_passwords(passwords: List[str], rounds: int = DEFAULT_ROUNDS,
+                   workers: Optional[int] = None, use_threads: bool = False) -> List[str]:
+    """Hash passwords in parallel, returning hashes in input order.
+
+    Work is spread over ``workers`` processes (default: one per CPU), or
+    threads with ``use_threads``; bcrypt releases the GIL while hashing.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(passwords) <= 1:
+        return [hash_password(p, rounds) for p in passwords]
+    pool_class = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+    with pool_class(max_workers=workers) as pool:
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(pool.map(hash_password, passwords, [rounds] * len(passwords),
+                             chunksize=chunksize))
+
+@dataclass
+class RegistrationResult:
+    member_id: str
+    registered: bool
+    error: str = ''
+
+class Auth:
+    def __init__(self, storage: Storage, rounds: int = DEFAULT_ROUNDS,
+                 hash_workers: Optional[int] = None,
+                 sessions: Optional[SessionStore] = None):
+        self.storage = storage
+        self.rounds = rounds
+        self.hash_workers = hash_workers
+        self.sessions = sessions or SessionStore()
+        self.current_session: Dict[str, str] = {}
+        self.current_token: Optional[str] = None
+        # Librarian hashes live in storage and are read on first login
+        self._librarian_hashes: Dict[str, bytes] = {}
+
+    def register_member(self, member_id: str, name: str, password: str, email: str) -> bool:
+        """Register a new member with hashed password."""
+        if self.storage.get_member_by_id(member_id):
+            return False
+
+        new_member = Member(
+            member_id=member_id,
+            name=name,
+            password_hash=hash_password(password, self.rounds),
+            email=email,
+            join_date=datetime.now()
+        )
+        self.storage.add_member(new_member)
+        return True
+
+    def register_librarian(self, username: str, password: str) -> bool:
+        """Add a librarian account with a hashed password."""
+        if self.storage.get_librarian_hash(username):
+            return False
+        self.storage.add_librarian(username, hash_password(password, self.rounds))
+        return True
+
+    def _librarian_hash(self, username: str) -> Optional[bytes]:
+        if username not in self._librarian_hashes:
+            password_hash = self.storage.get_librarian_hash(username)
+            if password_hash is None:
+                return None
+            self._librarian_hashes[username] = password_hash.encode()
+        return self._librarian_hashes[username]
+
+    def hash_passwords(self, passwords: List[str]) -> List[str]:
+        """Hash a batch of passwords in parallel, e.g. for a bulk member import."""
+        return hash_passwords(passwords, self.rounds, self.hash_workers)
+
+    def register_members(self, entries: Iterable[Dict[str, str]]) -> List[RegistrationResult]:
+        """Register many members at once.
+
+        Each entry has ``member_id``, ``name``, ``password`` and ``email``.
+        Passwords are hashed in parallel and all new members are written
+        with a single append. Returns one result per entry, in order.
+        """
+        entries = list(entries)
+        taken = set(self.storage.get_members_by_ids(e.get('member_id', '') for e in entries))
+        results = []
+        accepted = []
+        for entry in entries:
+            member_id = entry.get('member_id', '')
+            if not all(entry.get(k) for k in ('member_id', 'name', 'password', 'email')):
+                results.append(RegistrationResult(member_id, False, 'Missing required field'))
+            elif member_id in taken:
+                results.append(RegistrationResult(member_id, False, 'Member ID already exists'))
+            else:
+                taken.add(member_id)
+                accepted.append(entry)
+                results.append(RegistrationResult(member_id, True))
+
+        if not accepted:
+            return results
+        hashes = self.hash_passwords([e['password'] for e in accepted])
+        join_date = datetime.now()
+        self.storage.add_members([
+            Member(member_id=e['member_id'], name=e['name'], password_hash=password_hash,
+                   email=e['email'], join_date=join_date)
+            for e, password_hash in zip(accepted, hashes)
+        ])
+        return results
+
+    @staticmethod
+    def _checkpw(password: str, password_hash: bytes) -> bool:
+        return bcrypt.checkpw(password.encode(), password_hash)
+
+    def _check_credentials(self, role: Role, username: str, password: str) -> bool:
+        if role == 'librarian':
+            password_hash = self._librarian_hash(username)
+            return bool(password_hash) and self._checkpw(password, password_hash)
+
+        member = self.storage.get_member_by_id(username)
+        return bool(member) and self._checkpw(password, member.password_hash.encode())
+
+    def authenticate(self, role: Role, username: str, password: str) -> Optional[str]:
+        """Check credentials and return a new session token, or None.
+
+        Unlike login, this leaves current_session alone, so one Auth can
+        serve many users at once by passing the token to the checks below.
+        """
+        if not self._check_credentials(role, username, password):
+            return None
+        return self.sessions.create(role, username)
+
+    def login(self, role: Role, username: str, password: str) -> bool:
+        """Login as either librarian or member."""
+        token = self.authenticate(role, username, password)
+        if token is None:
+            return False
+        if self.current_token:
+            self.sessions.revoke(self.current_token)
+        self.current_token = token
+        self.current_session['role'] = role
+        self.current_session['user_id'] = username
+        return True
+
+    def logout(self, token: Optional[str] = None) -> None:
+        """End the given session, or clear the current session.
+
+        Buffered members and loans are written out first, so whatever the
+        user did is on disk when they leave.
+        """
+        self.storage.flush()
+        if token is not None:
+            self.sessions.revoke(token)
+            return
+        if self.current_token:
+            self.sessions.revoke(self.current_token)
+            self.current_token = None
+        self.current_session.clear()
+
+    def get_current_user(self, token: Optional[str] = None) -> Optional[Dict[str, str]]:
+        """Get the logged-in user's information for a token or the current session."""
+        if token is not None:
+            return self.sessions.get(token)
+        return self.current_session if self.current_session else None
+
+    def is_librarian(self, token: Optional[str] = None) -> bool:
+        """Check if the current user (or the token's user) is a librarian."""
+        user = self.get_current_user(token)
+        return bool(user) and user.get('role') == 'librarian'
+
+    def is_member(self, token: Optional[str] = None) -> bool:
+        """Check if the current user (or the token's user) is a member."""
+        user = self.get_current_user(token)
+        return bool(user) and user.get('role') == 'member'
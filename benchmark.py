@@ -0,0 +1,970 @@
+"""Benchmarks for the library system.
+
+Run ``python benchmark.py <benchmark> --help`` for each benchmark's options.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+from auth import hash_passwords
+from groupcommit import DURABILITY_MODES, FLUSH_MS, FLUSH_RECORDS
+from metrics import Metrics
+from models import Book, Loan, LibraryError
+from storage import open_storage
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def bench_hashing(args):
+    """Password hashing throughput as the number of workers grows."""
+    passwords = [f'password{i}' for i in range(args.count)]
+    mode = 'threads' if args.threads else 'processes'
+    print(f'Hashing {args.count} passwords at cost {args.rounds} using {mode}')
+    print(f'{"workers":>8} {"seconds":>9} {"hashes/s":>10} {"speedup":>8}')
+    baseline = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        hash_passwords(passwords, args.rounds, workers, use_threads=args.threads)
+        elapsed = time.perf_counter() - start
+        rate = args.count / elapsed
+        baseline = baseline or rate
+        print(f'{workers:>8} {elapsed:>9.2f} {rate:>10.1f} {rate / baseline:>7.2f}x')
+
+
+def _time_command(command, stdin='', repeat=5):
+    """Median wall time of ``command``, or the error if it fails."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(command, input=stdin, capture_output=True, text=True, cwd=HERE)
+        times.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            lines = result.stderr.strip().splitlines() or ['exit status %d' % result.returncode]
+            return None, lines[-1]
+    return statistics.median(times), ''
+
+
+def bench_startup(args):
+    """Time from process start to a usable CLI and GUI."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        # The first run creates the data files
+        from main import LibrarySystem
+        start = time.perf_counter()
+        LibrarySystem(data_dir)
+        print(f'LibrarySystem() in-process: {(time.perf_counter() - start) * 1000:8.1f} ms')
+
+        entry_points = [
+            ('main.py (start, exit)', [sys.executable, 'main.py', '--data-dir', data_dir], '4\n'),
+            ('gui.py (first frame)', [sys.executable, '-c',
+                                      'import sys, gui; app = gui.LibraryApp(sys.argv[1]); '
+                                      'app.update(); app.destroy()', data_dir], ''),
+        ]
+        for name, command, stdin in entry_points:
+            median, error = _time_command(command, stdin, args.repeat)
+            if median is None:
+                print(f'{name:<27} skipped: {error}')
+            else:
+                print(f'{name:<27} {median * 1000:8.1f} ms (median of {args.repeat})')
+
+
+def _checkout_worker(data_dir, cached, journal, worker, count):
+    storage = open_storage(data_dir, cached=cached, journal=journal)
+    taken = 0
+    for i in range(count):
+        issue_date = datetime.now()
+        loan = Loan(loan_id=f'bench-{worker}-{i}', member_id=f'M{worker}', isbn='BENCH',
+                    issue_date=issue_date, due_date=issue_date + timedelta(days=14))
+        taken += storage.checkout(loan)
+    return taken
+
+
+def bench_concurrency(args):
+    """Checkout throughput with several processes writing one data directory."""
+    print(f'{"writers":>8} {"checkouts":>10} {"seconds":>9} {"per sec":>9}  consistent')
+    for writers in args.writers:
+        with tempfile.TemporaryDirectory() as data_dir:
+            storage = open_storage(data_dir, cached=args.cached, journal=args.journal)
+            total = writers * args.checkouts
+            storage.add_book(Book('BENCH', 'Benchmark', 'Nobody', total, total))
+            for i in range(args.books):
+                storage.add_book(Book(f'FILLER{i}', f'Filler {i}', 'Nobody', 1, 1))
+
+            with multiprocessing.Pool(writers) as pool:
+                start = time.perf_counter()
+                taken = pool.starmap(_checkout_worker, [
+                    (data_dir, args.cached, args.journal, w, args.checkouts)
+                    for w in range(writers)])
+                elapsed = time.perf_counter() - start
+
+            book = open_storage(data_dir).get_book_by_isbn('BENCH')
+            consistent = sum(taken) == total and book.copies_available == 0
+            print(f'{writers:>8} {sum(taken):>10} {elapsed:>9.2f} {sum(taken) / elapsed:>9.1f}  {consistent}')
+
+
+async def _http_client(host, port, paths, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line == b'\r\n':
+                    break
+                name, _, value = line.decode().partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def _http_load(host, port, paths, clients, seconds):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*[_http_client(host, port, paths[c:] + paths[:c], deadline, latencies, errors)
+                           for c in range(clients)])
+    return latencies, errors, time.perf_counter() - start
+
+
+def _start_test_server(data_dir, books, max_concurrency):
+    """Serve a seeded temporary library from a background thread; returns the port."""
+    from main import LibrarySystem
+    from server import LibraryServer
+
+    library = LibrarySystem(data_dir, cached=True)
+    for i in range(books):
+        library.storage.add_book(Book(f'HTTP{i}', f'Volume {i} of the series', f'Author {i % 100}', 3, 3))
+    server = LibraryServer(library, port=0, max_concurrency=max_concurrency)
+    started = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(server.start())
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait()
+    return server.port
+
+
+def bench_http(args):
+    """Latency and throughput of the HTTP service under concurrent keep-alive clients."""
+    paths = [f'/books?q=author+{i}&limit=10' for i in range(100)]
+    with tempfile.TemporaryDirectory() as data_dir:
+        if args.url:
+            url = urlsplit(args.url)
+            host, port = url.hostname, url.port or 80
+        else:
+            host, port = '127.0.0.1', _start_test_server(data_dir, args.books, args.max_concurrency)
+        print(f'{"clients":>8} {"requests":>9} {"errors":>7} {"p50 ms":>8} {"p99 ms":>8} {"req/s":>9}')
+        for clients in args.clients:
+            latencies, errors, elapsed = asyncio.run(
+                _http_load(host, port, paths, clients, args.seconds))
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+            print(f'{clients:>8} {len(latencies):>9} {len(errors):>7} {p50:>8.2f} {p99:>8.2f} '
+                  f'{len(latencies) / elapsed:>9.1f}')
+
+
+def _time_op(func, repeat):
+    """Run ``func`` ``repeat`` times; returns milliseconds per run."""
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(i)
+        times.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': statistics.median(times), 'min_ms': min(times), 'runs': repeat}
+
+
+def _suite_operations(library, books, members, rng):
+    """The timed operations, each taking the run number."""
+    from datagen import MEMBER_PASSWORD, REFERENCE_DATE, isbn_for, member_id_for
+
+    storage = library.storage
+    words = ['river', 'garden winter', 'crown', 'ada', 'tanaka', 'silent empire']
+
+    def checkout(i):
+        # Skip books with no copy left, as a desk would
+        while True:
+            try:
+                return library.lend_book(member_id_for(rng.randrange(members)),
+                                         isbn_for(rng.randrange(books)))
+            except LibraryError:
+                pass
+
+    return [
+        ('get_all_books', lambda i: storage.get_all_books()),
+        ('get_book_by_isbn', lambda i: storage.get_book_by_isbn(isbn_for(rng.randrange(books)))),
+        ('get_member_by_id', lambda i: storage.get_member_by_id(member_id_for(rng.randrange(members)))),
+        ('get_member_loans', lambda i: storage.get_member_loans(member_id_for(rng.randrange(members)))),
+        ('get_overdue_loans', lambda i: storage.get_overdue_loans(REFERENCE_DATE)),
+        ('search_catalogue', lambda i: library.catalogue.search(words[i % len(words)])),
+        ('add_book', lambda i: storage.add_book(
+            Book(f'SUITE{i}', f'Suite Volume {i}', 'Bench Author', 2, 2))),
+        ('add_loan', lambda i: storage.add_loan(Loan(
+            f'SUITE-LOAN-{i}', member_id_for(0), isbn_for(0), REFERENCE_DATE,
+            REFERENCE_DATE + timedelta(days=14)))),
+        ('login', lambda i: library.auth.authenticate(
+            'member', member_id_for(rng.randrange(members)), MEMBER_PASSWORD)),
+        ('checkout', checkout),
+    ]
+
+
+def run_suite(args):
+    """Time every operation for each size and engine; returns the results dict."""
+    from datagen import SIZES, generate
+    from main import LibrarySystem
+
+    results = {}
+    cache_dir = args.cache_dir or tempfile.mkdtemp(prefix='library-bench-')
+    try:
+        for size in args.sizes:
+            books, members, loans = SIZES[size]
+            if args.loans is not None:
+                loans = args.loans
+            source = os.path.join(cache_dir, f'{size}-{loans}-seed{args.seed}')
+            if not os.path.exists(os.path.join(source, 'books.csv')):
+                print(f'Generating {size}: {books} books, {members} members, {loans} loans')
+                generate(source, books, members, loans, args.seed)
+
+            for engine in args.engines:
+                # Work on a copy so that writes never leak into the cached data
+                with tempfile.TemporaryDirectory() as work_dir:
+                    if engine == 'sqlite':
+                        from sqlite_storage import SQLiteStorage
+                        db_path = os.path.join(work_dir, 'library.db')
+                        SQLiteStorage(db_path).migrate_from_csv(source)
+                        data_dir = f'sqlite:///{db_path}'
+                    else:
+                        data_dir = os.path.join(work_dir, 'data')
+                        shutil.copytree(source, data_dir)
+
+                    opened = []
+                    key = f'{size}/{engine}'
+                    metrics = Metrics() if args.metrics else None
+                    results[f'{key}/open'] = _time_op(lambda i: opened.append(
+                        LibrarySystem(data_dir, cached=engine == 'cached', metrics=metrics)), 1)
+                    library = opened[0]
+                    rng = random.Random(args.seed)
+                    for name, func in _suite_operations(library, books, members, rng):
+                        repeat = args.login_repeat if name == 'login' else args.repeat
+                        results[f'{key}/{name}'] = _time_op(func, repeat)
+                    for name, result in results.items():
+                        if name.startswith(key + '/'):
+                            print(f'{name:<36} {result["median_ms"]:>10.3f} ms '
+                                  f'(min {result["min_ms"]:.3f}, {result["runs"]} runs)')
+    finally:
+        if not args.cache_dir:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    return results
+
+
+def compare_results(baseline, current, threshold):
+    """Print median changes against ``baseline``; returns the regressed keys."""
+    regressions = []
+    print(f'{"operation":<36} {"baseline":>10} {"current":>10} {"change":>8}')
+    for key, result in current.items():
+        old = baseline.get(key)
+        if old is None:
+            print(f'{key:<36} {"-":>10} {result["median_ms"]:>10.3f}      new')
+            continue
+        change = result['median_ms'] / old['median_ms'] - 1 if old['median_ms'] else 0.0
+        flag = ''
+        if change > threshold:
+            regressions.append(key)
+            flag = '  REGRESSION'
+        print(f'{key:<36} {old["median_ms"]:>10.3f} {result["median_ms"]:>10.3f} {change:>+8.0%}{flag}')
+    return regressions
+
+
+def bench_suite(args):
+    """Time storage, search, login and checkout on generated catalogues."""
+    results = run_suite(args)
+    document = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f'Results written to {args.output}')
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare_results(baseline, results, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} operation(s) more than {args.threshold:.0%} slower than the baseline')
+            sys.exit(1)
+
+
+def bench_compare(args):
+    """Compare two saved suite results and flag regressions."""
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    with open(args.current) as f:
+        current = json.load(f)['results']
+    if compare_results(baseline, current, args.threshold):
+        sys.exit(1)
+
+
+# Run in a fresh interpreter per measurement so each peak RSS stands alone
+_MEMORY_PROBE = """
+import resource, sys, time
+from storage import open_storage
+storage = open_storage(sys.argv[1])
+method = sys.argv[2]
+start = time.perf_counter()
+if method == 'import':
+    count = 0
+elif method == 'list':
+    count = len(storage.get_all_loans())
+elif method == 'stream':
+    count = sum(1 for _ in storage.iter_loans())
+else:
+    count = len(storage.page_loans(50).items)
+try:
+    # VmHWM starts afresh at exec, unlike ru_maxrss on Linux
+    with open('/proc/self/status') as f:
+        peak = next(int(l.split()[1]) * 1024 for l in f if l.startswith('VmHWM'))
+except OSError:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(count, time.perf_counter() - start, peak)
+"""
+
+
+def bench_memory(args):
+    """Peak RSS of listing all loans versus streaming or paging them."""
+    from datagen import generate
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        print(f'Generating {args.loans} loans')
+        generate(data_dir, args.books, args.members, args.loans, args.seed)
+        specs = {'csv': data_dir}
+        if 'sqlite' in args.engines:
+            from sqlite_storage import SQLiteStorage
+            db_path = os.path.join(data_dir, 'library.db')
+            SQLiteStorage(db_path).migrate_from_csv(data_dir)
+            specs['sqlite'] = f'sqlite:///{db_path}'
+
+        print(f'{"engine":<8} {"path":<18} {"loans":>10} {"seconds":>9} {"peak RSS MB":>12}')
+        for engine in args.engines:
+            for method, label in [('import', 'baseline'), ('list', 'get_all_loans'),
+                                  ('stream', 'iter_loans'), ('page', 'page_loans(50)')]:
+                result = subprocess.run([sys.executable, '-c', _MEMORY_PROBE, specs[engine], method],
+                                        capture_output=True, text=True, cwd=HERE, check=True)
+                count, seconds, peak = result.stdout.split()
+                print(f'{engine:<8} {label:<18} {int(count):>10} {float(seconds):>9.2f} '
+                      f'{int(peak) / 2**20:>12.1f}')
+
+
+def bench_typeahead(args):
+    """Latency of type-ahead suggestions, keystroke by keystroke, on a large catalogue."""
+    from datagen import generate
+    from search import CatalogueIndex
+
+    # Every prefix of each query, as typed
+    queries = ['river', 'silent empire', 'golden is', 'ada tan', 'zoe', 'the', '978000001', 'xyzzy']
+    with tempfile.TemporaryDirectory() as data_dir:
+        generate(data_dir, args.books, 1, 0, args.seed)
+        start = time.perf_counter()
+        index = CatalogueIndex()
+        for book in open_storage(data_dir).iter_books():
+            index.add(book)
+        print(f'Indexed {len(index)} books in {time.perf_counter() - start:.1f}s')
+        # The first suggestion sorts the word list, unless prepare_suggestions
+        # ran in the background (as the GUI does)
+        start = time.perf_counter()
+        index.suggest(queries[0][0], args.limit)
+        print(f'First keystroke: {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    latencies = []
+    for query in queries:
+        for end in range(1, len(query) + 1):
+            start = time.perf_counter()
+            index.suggest(query[:end], args.limit)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f'Then {len(latencies)} keystrokes, top {args.limit}: p50 {p50:.3f} ms, p99 {p99:.3f} ms, '
+          f'max {latencies[-1]:.3f} ms (frame budget 16 ms)')
+
+
+_LOAN_CACHE_PROBE = """
+import sys, time
+from storage import CachedStorage
+
+def status(field):
+    with open('/proc/self/status') as f:
+        return next(int(l.split()[1]) * 1024 for l in f if l.startswith(field))
+
+before = status('VmRSS')
+start = time.perf_counter()
+storage = CachedStorage(sys.argv[1], compact=sys.argv[2] if sys.argv[2] != 'objects' else None)
+seconds = time.perf_counter() - start
+print(len(storage._loans), seconds, status('VmRSS') - before, status('VmHWM'))
+"""
+
+
+def bench_loans(args):
+    """Memory and load time of the cached loan history in each representation."""
+    from datagen import generate
+
+    print(f'{"loans":>10} {"mode":<9} {"load s":>8} {"held MB":>9} {"bytes/loan":>11} {"peak MB":>9}')
+    for loans in args.loans:
+        with tempfile.TemporaryDirectory() as data_dir:
+            generate(data_dir, args.books, args.members, loans, args.seed)
+            size = os.path.getsize(os.path.join(data_dir, 'loans.csv'))
+            print(f'{loans:>10} {"loans.csv":<9} {"":>8} {size / 2**20:>9.1f} {size / loans:>11.0f}')
+            for mode in args.modes:
+                result = subprocess.run([sys.executable, '-c', _LOAN_CACHE_PROBE, data_dir, mode],
+                                        capture_output=True, text=True, cwd=HERE)
+                if result.returncode != 0:
+                    error = (result.stderr.strip().splitlines() or ['failed'])[-1]
+                    print(f'{loans:>10} {mode:<9} skipped: {error}')
+                    continue
+                count, seconds, held, peak = result.stdout.split()
+                print(f'{int(count):>10} {mode:<9} {float(seconds):>8.1f} {int(held) / 2**20:>9.1f} '
+                      f'{int(held) / int(count):>11.0f} {int(peak) / 2**20:>9.1f}')
+
+
+def bench_checkout(args):
+    """Checkout and return latency against catalogue size, CSV engines vs the binary book store."""
+    from bookstore import BookStore
+    from datagen import generate, isbn_for, member_id_for
+
+    print(f'{"books":>9} {"engine":<8} {"checkout ms":>12} {"return ms":>10} {"p99 ms":>8}')
+    for books in args.books:
+        with tempfile.TemporaryDirectory() as data_dir:
+            generate(data_dir, books, 100, 0, args.seed)
+            rng = random.Random(args.seed)
+            # Once books.dat exists the directory always opens as the mapped engine
+            for engine in sorted(args.engines, key=lambda e: e == 'mapped'):
+                if engine == 'mapped':
+                    start = time.perf_counter()
+                    BookStore(data_dir).create(open_storage(data_dir).iter_books())
+                    print(f'{books:>9} {"import":<8} {(time.perf_counter() - start) * 1000:>12.1f}')
+                storage = open_storage(data_dir, cached=engine == 'cached',
+                                       journal=engine == 'journal')
+                isbns = [isbn_for(rng.randrange(books)) for _ in range(args.repeat)]
+                # Loads caches and indexes, which is startup work
+                storage.get_book_by_isbn(isbns[0])
+                now = datetime.now()
+                checkouts, returns = [], []
+                for i, isbn in enumerate(isbns):
+                    loan = Loan(f'{engine}-{i}', member_id_for(0), isbn, now, now + timedelta(days=14))
+                    start = time.perf_counter()
+                    if not storage.checkout(loan):
+                        raise LibraryError(f'{isbn} unavailable')
+                    checkouts.append((time.perf_counter() - start) * 1000)
+                    start = time.perf_counter()
+                    storage.adjust_availability(isbn, 1)
+                    returns.append((time.perf_counter() - start) * 1000)
+                p99 = sorted(checkouts)[min(len(checkouts) - 1, int(len(checkouts) * 0.99))]
+                print(f'{books:>9} {engine:<8} {statistics.median(checkouts):>12.3f} '
+                      f'{statistics.median(returns):>10.3f} {p99:>8.3f}')
+
+
+def bench_desk(args):
+    """Desk checkout of a stack of books: one lend_book per book against one lend_books call."""
+    from datagen import generate, isbn_for, member_id_for
+    from main import LibrarySystem
+
+    print(f'{"engine":<8} {"stack":>6} {"one by one ms":>14} {"batch ms":>9}')
+    with tempfile.TemporaryDirectory() as data_dir:
+        generate(data_dir, args.books, 100, 0, args.seed)
+        rng = random.Random(args.seed)
+        for engine in args.engines:
+            library = LibrarySystem(data_dir, cached=engine == 'cached', journal=engine == 'journal')
+            storage = library.storage
+            member = member_id_for(0)
+            # Loads caches and indexes, which is startup work
+            storage.get_book_by_isbn('')
+            storage.get_member_by_id(member)
+            for stack in args.stack:
+                single, batch = [], []
+                for _ in range(args.repeat):
+                    for lend, times in ((None, single), (library.lend_books, batch)):
+                        isbns = [isbn_for(i) for i in rng.sample(range(args.books), stack)]
+                        start = time.perf_counter()
+                        if lend is None:
+                            loans = [library.lend_book(member, isbn) for isbn in isbns]
+                        else:
+                            loans = [o.loan for o in lend(member, isbns) if o.loan]
+                        times.append((time.perf_counter() - start) * 1000)
+                        if len(loans) != stack:
+                            raise LibraryError('Part of the stack was unavailable')
+                        # Put the copies back for the next round (untimed)
+                        for isbn in isbns:
+                            storage.adjust_availability(isbn, 1)
+                print(f'{engine:<8} {stack:>6} {statistics.median(single):>14.2f} '
+                      f'{statistics.median(batch):>9.2f}')
+
+
+def bench_returns(args):
+    """Return latency against loan history size, with the cost of rewriting loans.csv for comparison."""
+    from bookstore import BookStore
+    from datagen import generate
+
+    print(f'{"loans":>9} {"engine":<9} {"first s":>8} {"return ms":>10} {"p99 ms":>8}')
+    for loans in args.loans:
+        with tempfile.TemporaryDirectory() as data_dir:
+            generate(data_dir, args.books, args.members, loans, args.seed)
+            # What a return costs if it rewrites the history
+            loans_file = os.path.join(data_dir, 'loans.csv')
+            start = time.perf_counter()
+            with open(loans_file, newline='') as src, open(loans_file + '.copy', 'w', newline='') as dst:
+                csv.writer(dst).writerows(csv.reader(src))
+            os.remove(loans_file + '.copy')
+            print(f'{loans:>9} {"rewrite":<9} {"":>8} {(time.perf_counter() - start) * 1000:>10.1f}')
+
+            open_ids = [l.loan_id for l in open_storage(data_dir).get_overdue_loans(datetime.max)]
+            random.Random(args.seed).shuffle(open_ids)
+            for n, engine in enumerate(sorted(args.engines, key=lambda e: e == 'mapped')):
+                if engine == 'mapped':
+                    BookStore(data_dir).create(open_storage(data_dir).iter_books())
+                start = time.perf_counter()
+                storage = open_storage(data_dir, cached=engine == 'cached', journal=engine == 'journal',
+                                       compact='columnar' if engine == 'columnar' else None)
+                # Builds the open-loan index, which later returns extend
+                # incrementally, and loads the catalogue
+                storage.get_loans_due_soon(0)
+                storage.get_book_by_isbn('')
+                first = time.perf_counter() - start
+                times = []
+                for loan_id in open_ids[n * args.repeat:(n + 1) * args.repeat]:
+                    start = time.perf_counter()
+                    if storage.return_loan(loan_id) is None:
+                        raise LibraryError(f'{loan_id} is not open')
+                    times.append((time.perf_counter() - start) * 1000)
+                times.sort()
+                p99 = times[min(len(times) - 1, int(len(times) * 0.99))]
+                print(f'{loans:>9} {engine:<9} {first:>8.1f} {statistics.median(times):>10.3f} {p99:>8.3f}')
+
+
+def bench_holds(args):
+    """Hold placement, queue position, cancellation and allocation-on-return with one popular title."""
+    from holds import HoldQueues
+    from main import LibrarySystem
+
+    print(f'{"holds":>7} {"place ms":>9} {"cancel ms":>10} {"position us":>12} '
+          f'{"replay s":>9} {"return ms":>10} {"collect ms":>11}')
+    for count in args.holds:
+        with tempfile.TemporaryDirectory() as data_dir:
+            library = LibrarySystem(data_dir)
+            library.storage.add_book(Book('HOT', 'Popular', 'Author', 1, 1))
+            loan = library.lend_book('M0', 'HOT', verify_member=False)
+            places = []
+            holds = []
+            for i in range(count):
+                start = time.perf_counter()
+                # Every 100th member jumps the queue
+                holds.append(library.place_hold(f'M{i + 1}', 'HOT', int(i % 100 == 0), False))
+                places.append((time.perf_counter() - start) * 1000)
+
+            rng = random.Random(args.seed)
+            cancels = []
+            for hold in rng.sample(holds, min(args.repeat, count)):
+                start = time.perf_counter()
+                library.cancel_hold(hold.member_id, hold.hold_id)
+                cancels.append((time.perf_counter() - start) * 1000)
+
+            live = [h for h in holds if library.holds.get(h.hold_id)]
+            positions = []
+            for hold in rng.sample(live, min(1000, len(live))):
+                start = time.perf_counter()
+                library.holds.position(hold.hold_id)
+                positions.append((time.perf_counter() - start) * 1e6)
+
+            start = time.perf_counter()
+            HoldQueues(data_dir).waiting('HOT')
+            replay = time.perf_counter() - start
+
+            returns, collects = [], []
+            for _ in range(min(args.repeat, len(live))):
+                start = time.perf_counter()
+                library.receive_return(loan.loan_id)
+                returns.append((time.perf_counter() - start) * 1000)
+                hold = library.holds.ready_holds('HOT')[0]
+                start = time.perf_counter()
+                loan = library.lend_book(hold.member_id, 'HOT', verify_member=False)
+                collects.append((time.perf_counter() - start) * 1000)
+            print(f'{count:>7} {statistics.median(places):>9.3f} {statistics.median(cancels):>10.3f} '
+                  f'{statistics.median(positions):>12.1f} {replay:>9.2f} '
+                  f'{statistics.median(returns):>10.3f} {statistics.median(collects):>11.3f}')
+
+
+def bench_appends(args):
+    """Burst of new members and loans: written one by one, or grouped under each durability mode."""
+    from models import Member
+
+    print(f'{"engine":<7} {"threads":>7} {"mode":<10} {"records/s":>10} {"p99 ms":>8}')
+    now = datetime.now()
+    for engine in args.engines:
+        for threads in args.threads:
+            for mode in ['unbuffered'] + args.modes:
+                with tempfile.TemporaryDirectory(dir=args.dir) as data_dir:
+                    storage = open_storage(data_dir, cached=engine == 'cached')
+                    if mode != 'unbuffered':
+                        storage.buffer_appends(args.flush_records, args.flush_ms, mode)
+                    latencies = []
+
+                    def worker(first):
+                        times = []
+                        # Alternate registrations and checkouts, as in a class signing up
+                        for i in range(first, args.records, threads):
+                            start = time.perf_counter()
+                            if i % 2:
+                                storage.add_loan(Loan(f'L{i}', f'M{i - 1}', '9780000000000', now,
+                                                      now + timedelta(days=14)))
+                            else:
+                                storage.add_member(Member(f'M{i}', 'Member', 'hash', 'm@example.com', now))
+                            times.append(time.perf_counter() - start)
+                        latencies.extend(times)
+
+                    start = time.perf_counter()
+                    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+                    for t in workers:
+                        t.start()
+                    for t in workers:
+                        t.join()
+                    # Whatever is still buffered counts towards the burst
+                    storage.flush()
+                    elapsed = time.perf_counter() - start
+                    if len(storage.get_all_members()) + len(storage.get_all_loans()) != args.records:
+                        raise LibraryError('Records were lost')
+                    latencies.sort()
+                    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+                    print(f'{engine:<7} {threads:>7} {mode:<10} {args.records / elapsed:>10.0f} '
+                          f'{p99:>8.3f}')
+
+
+def _dir_mb(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names) / 2**20
+
+
+def bench_partitions(args):
+    """Loan queries against history size: one loans.csv vs monthly partitions, plain and compressed."""
+    from datagen import REFERENCE_DATE, generate, member_id_for
+    from partitions import PartitionedStorage, migrate
+
+    print(f'{"loans":>9} {"layout":<8} {"MB":>7} {"convert s":>10} {"overdue s":>10} '
+          f'{"member s":>9} {"month s":>8}')
+    month = (REFERENCE_DATE - timedelta(days=30), REFERENCE_DATE)
+
+    def report(loans, layout, data_dir, open_engine, convert=None):
+        times = {'overdue': [], 'member': [], 'month': []}
+        for i in range(args.repeat):
+            # A new instance each time, so the open-loan index is built from disk
+            storage = open_engine()
+            for name, query in (('overdue', lambda: storage.get_overdue_loans(REFERENCE_DATE)),
+                                ('member', lambda: storage.get_member_loans(member_id_for(i))),
+                                ('month', lambda: storage.get_loans_issued(*month))):
+                start = time.perf_counter()
+                query()
+                times[name].append(time.perf_counter() - start)
+        loans_dir = os.path.join(data_dir, 'loans')
+        size = _dir_mb(loans_dir) if os.path.isdir(loans_dir) else \
+            os.path.getsize(os.path.join(data_dir, 'loans.csv')) / 2**20
+        print(f'{loans:>9} {layout:<8} {size:>7.1f} {"" if convert is None else f"{convert:.1f}":>10} '
+              + ' '.join(f'{statistics.median(times[n]):>{w}.3f}'
+                         for n, w in (('overdue', 10), ('member', 9), ('month', 8))))
+
+    for loans in args.loans:
+        with tempfile.TemporaryDirectory() as root:
+            data_dir = os.path.join(root, 'data')
+            generate(data_dir, args.books, args.members, loans, args.seed)
+            report(loans, 'single', data_dir, lambda: open_storage(data_dir))
+            start = time.perf_counter()
+            migrate(data_dir)
+            report(loans, 'monthly', data_dir, lambda: PartitionedStorage(data_dir),
+                   time.perf_counter() - start)
+            for codec in args.codecs:
+                copy_dir = os.path.join(root, codec)
+                shutil.copytree(data_dir, copy_dir)
+                start = time.perf_counter()
+                # The reference date stands in for today
+                PartitionedStorage(copy_dir).archive(codec, REFERENCE_DATE.strftime('%Y-%m'))
+                report(loans, codec, copy_dir, lambda: PartitionedStorage(copy_dir),
+                       time.perf_counter() - start)
+                shutil.rmtree(copy_dir)
+
+            # datagen writes return dates inline, so make returns the way a
+            # desk does; "convert s" is then the time to record them
+            storage = PartitionedStorage(data_dir, journal=True)
+            isbn = next(storage.iter_books()).isbn
+            issued = REFERENCE_DATE - timedelta(days=7)
+            new_loans = [Loan(f'R{i}', member_id_for(i), isbn, issued,
+                              issued + timedelta(days=14)) for i in range(args.returns)]
+            storage.add_loans(new_loans)
+            start = time.perf_counter()
+            for loan in new_loans:
+                storage.return_loan(loan.loan_id, REFERENCE_DATE)
+            report(loans, 'returned', data_dir, lambda: PartitionedStorage(data_dir),
+                   time.perf_counter() - start)
+
+
+def _python_reports(path, as_of):
+    """The analytics aggregates computed with a plain loop over loans.csv."""
+    from collections import Counter
+    from datetime import date
+
+    per_isbn, per_member, per_month = Counter(), Counter(), Counter()
+    durations, lateness = [], Counter()
+    open_overdue = open_loans = 0
+    today = as_of.date()
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        for loan_id, member_id, isbn, issued, due, returned in reader:
+            per_isbn[isbn] += 1
+            per_member[member_id] += 1
+            per_month[issued[:7]] += 1
+            due_date = date.fromisoformat(due)
+            if returned:
+                return_date = date.fromisoformat(returned)
+                durations.append((return_date - date.fromisoformat(issued)).days)
+                late = (return_date - due_date).days
+                lateness[0 if late <= 0 else 1 if late <= 7 else 2 if late <= 14 else
+                         3 if late <= 30 else 4] += 1
+            else:
+                open_loans += 1
+                open_overdue += due_date < today
+    durations.sort()
+    return {'by-isbn': per_isbn.most_common(10), 'by-member': per_member.most_common(10),
+            'by-month': sorted(per_month.items()), 'returned': len(durations),
+            'median_days': durations[len(durations) // 2] if durations else 0,
+            'lateness': [lateness[i] for i in range(5)], 'open, overdue': open_overdue}
+
+
+def bench_analytics(args):
+    """Vectorized circulation reports against a pure-Python loop over loans.csv."""
+    import analytics
+    from datagen import REFERENCE_DATE, generate
+
+    loan_reports = [name for name in analytics.REPORTS if name != 'utilization']
+    with tempfile.TemporaryDirectory() as data_dir:
+        print(f'Generating {args.loans} loans')
+        generate(data_dir, args.books, args.members, args.loans, args.seed)
+        loans_file = os.path.join(data_dir, 'loans.csv')
+
+        start = time.perf_counter()
+        loans = analytics.load_loans(loans_file)
+        loaded = time.perf_counter()
+        results = {name: analytics.run_report(name, loans, None, 10, REFERENCE_DATE)
+                   for name in loan_reports}
+        reported = time.perf_counter()
+        books = analytics.load_books(open_storage(data_dir))
+        analytics.utilization(books, 10)
+        utilization = time.perf_counter() - reported
+
+        # A nightly run reads the columns cached by the previous one
+        cache_path = os.path.join(data_dir, analytics.COLUMNS_CACHE)
+        analytics.load_loans(loans_file, cache_path=cache_path)
+        start_cached = time.perf_counter()
+        analytics.load_loans(loans_file, cache_path=cache_path)
+        cached = time.perf_counter() - start_cached
+
+        start_python = time.perf_counter()
+        expected = _python_reports(loans_file, REFERENCE_DATE)
+        python = time.perf_counter() - start_python
+
+    consistent = (
+        [n for _, n in results['by-isbn']] == [n for _, n in expected['by-isbn']]
+        and [n for _, n in results['by-member']] == [n for _, n in expected['by-member']]
+        and results['by-month'] == expected['by-month']
+        and results['duration']['returned'] == expected['returned']
+        and results['duration']['median_days'] == expected['median_days']
+        and list(results['lateness'].values())[:5] == expected['lateness']
+        and results['lateness']['open, overdue'] == expected['open, overdue'])
+    reports = reported - loaded
+    print(f'NumPy:  parse loans.csv {loaded - start:.2f}s (from the column cache {cached:.2f}s), '
+          f'reports {reports:.2f}s; utilization with books.csv {utilization:.2f}s')
+    print(f'Python: {python:.2f}s')
+    print(f'Speedup {python / (loaded - start + reports):.1f}x parsing loans.csv, '
+          f'{python / (cached + reports):.0f}x from the column cache; results match: {consistent}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Library system benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    hashing = subparsers.add_parser('hashing', help=bench_hashing.__doc__)
+    hashing.add_argument('--count', type=int, default=64, help='Passwords to hash')
+    hashing.add_argument('--rounds', type=int, default=12, help='bcrypt cost factor')
+    hashing.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    hashing.add_argument('--threads', action='store_true',
+                         help='Use a thread pool instead of a process pool')
+    hashing.set_defaults(func=bench_hashing)
+
+    startup = subparsers.add_parser('startup', help=bench_startup.__doc__)
+    startup.add_argument('--repeat', type=int, default=5, help='Runs per entry point')
+    startup.set_defaults(func=bench_startup)
+
+    concurrency = subparsers.add_parser('concurrency', help=bench_concurrency.__doc__)
+    concurrency.add_argument('--writers', type=int, nargs='+', default=[1, 4, 16])
+    concurrency.add_argument('--checkouts', type=int, default=50, help='Checkouts per writer')
+    concurrency.add_argument('--books', type=int, default=1000, help='Other books in the catalogue')
+    concurrency.add_argument('--cached', action='store_true')
+    concurrency.add_argument('--journal', action='store_true')
+    concurrency.set_defaults(func=bench_concurrency)
+
+    http = subparsers.add_parser('http', help=bench_http.__doc__)
+    http.add_argument('--url', help='Running server to load, e.g. http://127.0.0.1:8080 '
+                                    '(default: start one on a temporary library)')
+    http.add_argument('--clients', type=int, nargs='+', default=[1, 16, 64])
+    http.add_argument('--seconds', type=float, default=5, help='Load duration per client count')
+    http.add_argument('--books', type=int, default=10_000, help='Books in the temporary library')
+    http.add_argument('--max-concurrency', type=int, default=64)
+    http.set_defaults(func=bench_http)
+
+    suite = subparsers.add_parser('suite', help=bench_suite.__doc__)
+    suite.add_argument('--sizes', nargs='+', default=['10k'], choices=['10k', '100k', '1m'])
+    suite.add_argument('--loans', type=int, help='Override the preset loan count (up to 10M)')
+    suite.add_argument('--engines', nargs='+', default=['csv', 'cached'],
+                       choices=['csv', 'cached', 'sqlite'])
+    suite.add_argument('--repeat', type=int, default=5, help='Runs per operation')
+    suite.add_argument('--login-repeat', type=int, default=3, help='Runs of the bcrypt-bound login')
+    suite.add_argument('--seed', type=int, default=0)
+    suite.add_argument('--metrics', action='store_true',
+                       help='Run with instrumentation on, to measure its overhead')
+    suite.add_argument('--cache-dir', help='Keep generated data here and reuse it on later runs')
+    suite.add_argument('--output', help='Write the results as JSON to this file')
+    suite.add_argument('--compare', help='Baseline results JSON to check for regressions')
+    suite.add_argument('--threshold', type=float, default=0.25,
+                       help='Slowdown that counts as a regression (0.25 = 25%%)')
+    suite.set_defaults(func=bench_suite)
+
+    compare = subparsers.add_parser('compare', help=bench_compare.__doc__)
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float, default=0.25)
+    compare.set_defaults(func=bench_compare)
+
+    memory = subparsers.add_parser('memory', help=bench_memory.__doc__)
+    memory.add_argument('--loans', type=int, default=1_000_000)
+    memory.add_argument('--books', type=int, default=100_000)
+    memory.add_argument('--members', type=int, default=10_000)
+    memory.add_argument('--engines', nargs='+', default=['csv'], choices=['csv', 'sqlite'])
+    memory.add_argument('--seed', type=int, default=0)
+    memory.set_defaults(func=bench_memory)
+
+    loans = subparsers.add_parser('loans', help=bench_loans.__doc__)
+    loans.add_argument('--loans', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    loans.add_argument('--modes', nargs='+', default=['objects', 'slots', 'columnar'],
+                       choices=['objects', 'slots', 'columnar'])
+    loans.add_argument('--books', type=int, default=10_000)
+    loans.add_argument('--members', type=int, default=10_000)
+    loans.add_argument('--seed', type=int, default=0)
+    loans.set_defaults(func=bench_loans)
+
+    checkout = subparsers.add_parser('checkout', help=bench_checkout.__doc__)
+    checkout.add_argument('--books', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    checkout.add_argument('--engines', nargs='+', default=['csv', 'journal', 'cached', 'mapped'],
+                          choices=['csv', 'journal', 'cached', 'mapped'],
+                          help='mapped is converted from books.csv and always runs last')
+    checkout.add_argument('--repeat', type=int, default=20, help='Checkouts per engine')
+    checkout.add_argument('--seed', type=int, default=0)
+    checkout.set_defaults(func=bench_checkout)
+
+    desk = subparsers.add_parser('desk', help=bench_desk.__doc__)
+    desk.add_argument('--stack', type=int, nargs='+', default=[1, 5, 10, 20, 50],
+                      help='Books checked out together')
+    desk.add_argument('--engines', nargs='+', default=['csv', 'journal', 'cached'],
+                      choices=['csv', 'journal', 'cached'])
+    desk.add_argument('--books', type=int, default=10_000)
+    desk.add_argument('--repeat', type=int, default=5, help='Stacks per size and mode')
+    desk.add_argument('--seed', type=int, default=0)
+    desk.set_defaults(func=bench_desk)
+
+    returns = subparsers.add_parser('returns', help=bench_returns.__doc__)
+    returns.add_argument('--loans', type=int, nargs='+', default=[500_000, 5_000_000])
+    returns.add_argument('--engines', nargs='+', default=['csv', 'journal', 'columnar', 'mapped'],
+                         choices=['csv', 'journal', 'cached', 'columnar', 'mapped'],
+                         help='mapped is converted from books.csv and always runs last')
+    returns.add_argument('--books', type=int, default=10_000)
+    returns.add_argument('--members', type=int, default=10_000)
+    returns.add_argument('--repeat', type=int, default=50, help='Returns per engine')
+    returns.add_argument('--seed', type=int, default=0)
+    returns.set_defaults(func=bench_returns)
+
+    partitions = subparsers.add_parser('partitions', help=bench_partitions.__doc__)
+    partitions.add_argument('--loans', type=int, nargs='+', default=[250_000, 1_000_000, 4_000_000])
+    partitions.add_argument('--codecs', nargs='+', default=['gzip', 'lzma'], choices=['gzip', 'lzma'])
+    partitions.add_argument('--books', type=int, default=10_000)
+    partitions.add_argument('--members', type=int, default=10_000)
+    partitions.add_argument('--returns', type=int, default=100_000,
+                            help='Loans to issue and return before the last run')
+    partitions.add_argument('--repeat', type=int, default=3, help='Runs per query')
+    partitions.add_argument('--seed', type=int, default=0)
+    partitions.set_defaults(func=bench_partitions)
+
+    appends = subparsers.add_parser('appends', help=bench_appends.__doc__)
+    appends.add_argument('--records', type=int, default=20_000,
+                         help='Members and loans added, half of each')
+    appends.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    appends.add_argument('--modes', nargs='+', default=list(DURABILITY_MODES),
+                         choices=DURABILITY_MODES)
+    appends.add_argument('--engines', nargs='+', default=['csv', 'cached'], choices=['csv', 'cached'])
+    appends.add_argument('--flush-records', type=int, default=FLUSH_RECORDS)
+    appends.add_argument('--flush-ms', type=float, default=FLUSH_MS)
+    appends.add_argument('--dir', help='Where to create the data directory; fsync cost depends '
+                                       'on the file system (default: the system temp directory)')
+    appends.set_defaults(func=bench_appends)
+
+    holds = subparsers.add_parser('holds', help=bench_holds.__doc__)
+    holds.add_argument('--holds', type=int, nargs='+', default=[1_000, 10_000, 100_000],
+                       help='Holds queued on the one title')
+    holds.add_argument('--repeat', type=int, default=50, help='Cancellations and returns to time')
+    holds.add_argument('--seed', type=int, default=0)
+    holds.set_defaults(func=bench_holds)
+
+    analytics = subparsers.add_parser('analytics', help=bench_analytics.__doc__)
+    analytics.add_argument('--loans', type=int, default=10_000_000)
+    analytics.add_argument('--books', type=int, default=100_000)
+    analytics.add_argument('--members', type=int, default=100_000)
+    analytics.add_argument('--seed', type=int, default=0)
+    analytics.set_defaults(func=bench_analytics)
+
+    typeahead = subparsers.add_parser('typeahead', help=bench_typeahead.__doc__)
+    typeahead.add_argument('--books', type=int, default=500_000)
+    typeahead.add_argument('--limit', type=int, default=50, help='Suggestions per keystroke')
+    typeahead.add_argument('--seed', type=int, default=0)
+    typeahead.set_defaults(func=bench_typeahead)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,413 @@
+"""Binary book store: fixed-width records in a memory-mapped file.
+
+``books.dat`` holds a header and one fixed-width record per book: the ISBN,
+the copy counts and where its title and author sit in the heap, an
+append-only side file. Each rebuild writes a new heap, ``books.<n>.heap``,
+and the header names its generation ``n``, so replacing books.dat switches
+both files at once. An in-memory ISBN -> record offset index makes a
+lookup one dictionary probe and a slice of the mapping, and a checkout or
+return rewrites the 4-byte available count in place, so neither gets
+slower as the catalogue grows.
+
+A data directory containing books.dat is opened as ``MappedStorage`` by
+``open_storage``. Convert from and back to books.csv with::
+
+    python bookstore.py import ./data
+    python bookstore.py export ./data [--output books.csv]
+"""
+import argparse
+import csv
+import mmap
+import os
+import re
+import struct
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set
+from models import Book, Page
+from importer import IMPORT_BATCH_SIZE, ImportReport, run_import
+from locking import atomic_write
+from storage import BOOK_FIELDS, BOOK_STORE_FILE, Storage
+
+HEAP_FILE = 'books.{}.heap'
+HEAP_NAME = re.compile(r'^books\.(\d+)\.heap$')
+
+MAGIC = b'LIBBOOK2'
+
+# Magic, record count, heap bytes in use, heap generation
+HEADER = struct.Struct('<8sQQQ')
+
+# ISBN (UTF-8, NUL-padded), copies total, copies available, heap offset,
+# title length, author length
+RECORD = struct.Struct('<40siiQII')
+MAX_ISBN_BYTES = 40
+COUNTS = struct.Struct('<ii')
+COUNTS_AT = MAX_ISBN_BYTES
+AVAILABLE = struct.Struct('<i')
+AVAILABLE_AT = 4
+
+# Files grow by doubling, and by at least this much, so appends rarely remap
+MIN_GROWTH = 1 << 16
+
+# Books read per lock acquisition when streaming the store
+READ_BATCH = 1000
+
+
+class _MappedFile:
+    """A file mapped read-write into memory, grown in large steps."""
+
+    def __init__(self, path: str):
+        self.fd = os.open(path, os.O_RDWR)
+        self.inode = os.fstat(self.fd).st_ino
+        if not os.fstat(self.fd).st_size:
+            # An empty file cannot be mapped
+            os.ftruncate(self.fd, MIN_GROWTH)
+        self.map = mmap.mmap(self.fd, 0)
+
+    def ensure(self, size: int) -> None:
+        """Grow the file and the mapping to at least ``size`` bytes."""
+        if len(self.map) >= size:
+            return
+        file_size = os.fstat(self.fd).st_size
+        if file_size < size:
+            os.ftruncate(self.fd, max(size, file_size * 2, MIN_GROWTH))
+        self.map.close()
+        self.map = mmap.mmap(self.fd, 0)
+
+    def write(self, offset: int, data: bytes) -> None:
+        self.ensure(offset + len(data))
+        self.map[offset:offset + len(data)] = data
+
+    def close(self) -> None:
+        self.map.close()
+        os.close(self.fd)
+
+
+class BookStore:
+    """The catalogue of a data directory as fixed-width records.
+
+    Callers hold the directory's books lock, shared to read and exclusive
+    to write, as they do for books.csv; changes made by other processes are
+    seen on the next call. Appends write the record and heap bytes before
+    the header's record count, so readers never see a partial book.
+    As in books.csv, lookups and updates go to the first record with an ISBN.
+    """
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, BOOK_STORE_FILE)
+        self._records: Optional[_MappedFile] = None
+        self._heap: Optional[_MappedFile] = None
+        # ISBN -> record offset, and how many records it covers
+        self._index: Dict[str, int] = {}
+        self._indexed = 0
+
+    @staticmethod
+    def exists(data_dir: str) -> bool:
+        return os.path.exists(os.path.join(data_dir, BOOK_STORE_FILE))
+
+    def heap_path(self, generation: int) -> str:
+        return os.path.join(self.data_dir, HEAP_FILE.format(generation))
+
+    def _generation(self) -> int:
+        """The heap generation books.dat names, or 0 if there is no store."""
+        try:
+            with open(self.path, 'rb') as f:
+                magic, _, _, generation = HEADER.unpack(f.read(HEADER.size))
+        except (FileNotFoundError, struct.error):
+            return 0
+        return generation if magic == MAGIC else 0
+
+    def create(self, books: Iterable[Book]) -> int:
+        """Replace the store with ``books``; returns how many were written.
+
+        The new heap gets a generation of its own, so the rename of books.dat
+        is the one step that switches over. A crash before it leaves the old
+        store intact. Heaps of other generations are removed afterwards.
+        """
+        generation = self._generation() + 1
+        heap_path = self.heap_path(generation)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        tmp_heap = f'{heap_path}.{os.getpid()}.tmp'
+        try:
+            count = heap_used = 0
+            with open(tmp_path, 'wb') as records, open(tmp_heap, 'wb') as heap:
+                records.write(HEADER.pack(MAGIC, 0, 0, generation))
+                for book in books:
+                    title, author = book.title.encode(), book.author.encode()
+                    records.write(self._pack(book, heap_used, title, author))
+                    heap.write(title + author)
+                    heap_used += len(title) + len(author)
+                    count += 1
+                records.seek(0)
+                records.write(HEADER.pack(MAGIC, count, heap_used, generation))
+                for f in (records, heap):
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_heap, heap_path)
+            os.replace(tmp_path, self.path)
+        finally:
+            for path in (tmp_path, tmp_heap):
+                if os.path.exists(path):
+                    os.remove(path)
+        # Processes still mapping an old heap keep it until they refresh
+        for name in os.listdir(self.data_dir):
+            match = HEAP_NAME.match(name)
+            if match and int(match.group(1)) != generation:
+                os.remove(os.path.join(self.data_dir, name))
+        self.close()
+        return count
+
+    @staticmethod
+    def _pack(book: Book, heap_offset: int, title: bytes, author: bytes) -> bytes:
+        isbn = book.isbn.encode()
+        if len(isbn) > MAX_ISBN_BYTES or b'\0' in isbn:
+            raise ValueError(f'ISBN {book.isbn!r} does not fit a book record')
+        return RECORD.pack(isbn, book.copies_total, book.copies_available, heap_offset,
+                           len(title), len(author))
+
+    def _refresh(self) -> int:
+        """Map the files, index any new records and return the record count."""
+        if self._records is not None and os.stat(self.path).st_ino != self._records.inode:
+            # Replaced by create(), perhaps in another process
+            self.close()
+        if self._records is None:
+            self._records = _MappedFile(self.path)
+            magic, _, _, generation = HEADER.unpack_from(self._records.map)
+            if magic != MAGIC:
+                raise ValueError(f'{self.path} is not a book store')
+            try:
+                self._heap = _MappedFile(self.heap_path(generation))
+            except FileNotFoundError:
+                # Replaced and cleaned up by create() since books.dat was opened
+                self.close()
+                return self._refresh()
+        _, count, heap_used, _ = HEADER.unpack_from(self._records.map)
+        self._records.ensure(HEADER.size + count * RECORD.size)
+        self._heap.ensure(heap_used)
+        if count > self._indexed:
+            records, index = self._records.map, self._index
+            for offset in range(HEADER.size + self._indexed * RECORD.size,
+                                HEADER.size + count * RECORD.size, RECORD.size):
+                isbn = records[offset:offset + MAX_ISBN_BYTES].rstrip(b'\0').decode()
+                index.setdefault(isbn, offset)
+            self._indexed = count
+        return count
+
+    def _book(self, offset: int) -> Book:
+        isbn, total, available, start, title_len, author_len = \
+            RECORD.unpack_from(self._records.map, offset)
+        heap = self._heap.map
+        middle = start + title_len
+        return Book(isbn.rstrip(b'\0').decode(), heap[start:middle].decode(),
+                    heap[middle:middle + author_len].decode(), total, available)
+
+    def __len__(self) -> int:
+        return self._refresh()
+
+    def isbns(self) -> Set[str]:
+        self._refresh()
+        return set(self._index)
+
+    def get(self, isbn: str) -> Optional[Book]:
+        self._refresh()
+        offset = self._index.get(isbn)
+        return None if offset is None else self._book(offset)
+
+    def read(self, start: int, count: int) -> List[Book]:
+        """Up to ``count`` books from record number ``start`` on."""
+        end = min(self._refresh(), start + count)
+        return [self._book(HEADER.size + i * RECORD.size) for i in range(start, end)]
+
+    def __iter__(self) -> Iterator[Book]:
+        count = self._refresh()
+        return (self._book(HEADER.size + i * RECORD.size) for i in range(count))
+
+    def add(self, books: Iterable[Book]) -> None:
+        """Append ``books``: one write to each file, then the new count."""
+        self._refresh()
+        _, count, heap_used, generation = HEADER.unpack_from(self._records.map)
+        records, heap = bytearray(), bytearray()
+        added = 0
+        for book in books:
+            title, author = book.title.encode(), book.author.encode()
+            records += self._pack(book, heap_used + len(heap), title, author)
+            heap += title + author
+            added += 1
+        if not added:
+            return
+        self._heap.write(heap_used, heap)
+        self._records.write(HEADER.size + count * RECORD.size, records)
+        HEADER.pack_into(self._records.map, 0, MAGIC, count + added, heap_used + len(heap), generation)
+
+    def adjust(self, isbn: str, delta: int) -> bool:
+        """Change a book's available copies by ``delta`` in place.
+
+        Returns False, writing nothing, if the book does not exist or the
+        change would take the count outside 0..copies_total. Otherwise the
+        only write is the record's 4-byte available count.
+        """
+        self._refresh()
+        offset = self._index.get(isbn)
+        if offset is None:
+            return False
+        at = offset + COUNTS_AT
+        total, available = COUNTS.unpack_from(self._records.map, at)
+        if not 0 <= available + delta <= total:
+            return False
+        AVAILABLE.pack_into(self._records.map, at + AVAILABLE_AT, available + delta)
+        return True
+
+    def add_copies(self, isbn: str, total: int, available: int) -> bool:
+        """Add to a book's total and available copies, e.g. for an import merge."""
+        self._refresh()
+        offset = self._index.get(isbn)
+        if offset is None:
+            return False
+        at = offset + COUNTS_AT
+        copies_total, copies_available = COUNTS.unpack_from(self._records.map, at)
+        COUNTS.pack_into(self._records.map, at, copies_total + total, copies_available + available)
+        return True
+
+    def export_csv(self, path: str) -> int:
+        """Write the catalogue to ``path`` in books.csv format."""
+        count = 0
+        with atomic_write(path) as f:
+            writer = csv.writer(f)
+            writer.writerow(BOOK_FIELDS)
+            for book in self:
+                writer.writerow(Storage._book_row(book))
+                count += 1
+        return count
+
+    def close(self) -> None:
+        for mapped in (self._records, self._heap):
+            if mapped is not None:
+                mapped.close()
+        self._records = self._heap = None
+        self._index = {}
+        self._indexed = 0
+
+
+class MappedStorage(Storage):
+    """CSV storage with the catalogue in a BookStore instead of books.csv.
+
+    Members, librarians and loans stay in their CSV files. books.csv is
+    left as it was when the store was imported; ``python bookstore.py
+    export`` writes the current catalogue back to it.
+    """
+
+    def __init__(self, data_dir: str = './data'):
+        super().__init__(data_dir)
+        self.book_store = BookStore(data_dir)
+
+    def get_all_books(self) -> List[Book]:
+        with self._books_lock.shared():
+            return list(self.book_store)
+
+    def get_book_by_isbn(self, isbn: str) -> Optional[Book]:
+        with self._books_lock.shared():
+            return self.book_store.get(isbn)
+
+    def get_books_by_isbns(self, isbns: Iterable[str]) -> Dict[str, Book]:
+        found: Dict[str, Book] = {}
+        with self._books_lock.shared():
+            for isbn in isbns:
+                book = self.book_store.get(isbn)
+                if book is not None:
+                    found[isbn] = book
+        return found
+
+    def add_book(self, book: Book) -> None:
+        with self._books_lock.exclusive():
+            self.book_store.add([book])
+        self._notify_book_added(book)
+
+    def adjust_availability(self, isbn: str, delta: int) -> bool:
+        with self._books_lock.exclusive():
+            return self.book_store.adjust(isbn, delta)
+
+    def take_copies(self, isbns: List[str], all_or_nothing: bool = False) -> List[bool]:
+        # Each copy is a 4-byte write in place, so there is nothing to batch
+        with self._books_lock.exclusive():
+            taken = [self.book_store.adjust(isbn, -1) for isbn in isbns]
+            if all_or_nothing and not all(taken):
+                for isbn, ok in zip(isbns, taken):
+                    if ok:
+                        self.book_store.adjust(isbn, 1)
+                taken = [False] * len(isbns)
+            return taken
+
+    def _save_books(self, books: List[Book]) -> None:
+        with self._books_lock.exclusive():
+            self.book_store.create(books)
+
+    def compact(self) -> None:
+        """Nothing to do: book changes are never journaled here."""
+
+    def bulk_import(self, kind: str, rows: Iterable[Dict[str, str]],
+                    batch_size: int = IMPORT_BATCH_SIZE,
+                    hash_passwords: Optional[Callable[[List[str]], List[str]]] = None) -> ImportReport:
+        if kind != 'books':
+            return super().bulk_import(kind, rows, batch_size, hash_passwords)
+        with self._books_lock.exclusive():
+            def write_batch(records, merges):
+                self.book_store.add(records)
+                for isbn, (total, available) in merges.items():
+                    self.book_store.add_copies(isbn, total, available)
+                for book in records:
+                    self._notify_book_added(book)
+
+            return run_import(kind, rows, self.book_store.isbns(), write_batch, batch_size)
+
+    def _records_from(self, start: int) -> Iterator[Book]:
+        # Reads a batch per lock acquisition, so slow consumers do not block writers
+        while True:
+            with self._books_lock.shared():
+                books = self.book_store.read(start, READ_BATCH)
+            yield from books
+            if len(books) < READ_BATCH:
+                return
+            start += len(books)
+
+    def iter_books(self, where: Optional[Callable[[Book], bool]] = None) -> Iterator[Book]:
+        for book in self._records_from(0):
+            if where is None or where(book):
+                yield book
+
+    def page_books(self, limit: int, cursor: Optional[str] = None,
+                   where: Optional[Callable[[Book], bool]] = None) -> Page:
+        """A page of books in record order; the cursor is a record number."""
+        start = int(cursor or 0)
+        books = self._records_from(start)
+        return self._page(((b, start + i) for i, b in enumerate(books, 1)), limit, where)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a catalogue between books.csv '
+                                                 'and the memory-mapped book store')
+    parser.add_argument('command', choices=['import', 'export'],
+                        help='import: books.csv -> books.dat; export: books.dat -> books.csv')
+    parser.add_argument('data_dir', nargs='?', default='./data')
+    parser.add_argument('--output', help="Export to this file instead of the directory's books.csv")
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        source = Storage(args.data_dir)
+        store = BookStore(args.data_dir)
+        with source._books_lock.exclusive():
+            count = store.create(source.iter_books())
+        print(f'✔ Imported {count} books into {store.path}')
+        return
+
+    if not BookStore.exists(args.data_dir):
+        parser.error(f'{args.data_dir} has no {BOOK_STORE_FILE}; run import first')
+    storage = MappedStorage(args.data_dir)
+    output = args.output or storage.books_file
+    with storage._books_lock.exclusive():
+        count = storage.book_store.export_csv(output)
+        if output == storage.books_file:
+            # The store already includes whatever the journal recorded
+            storage.journal.clear()
+    print(f'✔ Exported {count} books to {output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Deterministic synthetic data directories for benchmarks.
+
+The same arguments always produce byte-identical CSV files, so benchmark
+runs on different machines or commits see the same data.
+"""
+import argparse
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+from storage import BOOK_FIELDS, MEMBER_FIELDS, LOAN_FIELDS, Storage
+
+# Catalogue presets: (books, members, loans)
+SIZES = {
+    '10k': (10_000, 1_000, 100_000),
+    '100k': (100_000, 10_000, 1_000_000),
+    '1m': (1_000_000, 100_000, 10_000_000),
+}
+
+# Every generated member has this password. Its hash is precomputed at the
+# default bcrypt cost so that logins cost what they do in production.
+MEMBER_PASSWORD = 'bench-pass'
+MEMBER_HASH = '$2b$12$FjQZ6686u7XXbcPWAdVJq.r6amOQkS1Ng33ZpeEMRdEccHA86Cg9W'
+
+# Loan dates are relative to this day rather than today
+REFERENCE_DATE = datetime(2025, 1, 1)
+
+HISTORY_DAYS = 3 * 365
+LOAN_DAYS = 14
+
+WORDS = '''
+    river shadow garden winter silent empire glass orchard hidden night
+    stone ocean letters forest crown mirror summer broken golden island
+    wolves harbor paper distant storm kingdom lantern quiet thunder bridge
+    secret valley fire morning autumn tower salt memory desert journey
+    north machine ember raven willow iron velvet songs last wild
+    city light dark house road sea star heart moon blood
+'''.split()
+
+FIRST_NAMES = '''
+    Ada Ben Chloe Daniel Elena Farid Grace Hiro Ines Jonas Kira Liam Maya
+    Noah Olga Priya Quinn Rosa Sami Tara Uma Victor Wen Ximena Yusuf Zoe
+'''.split()
+
+LAST_NAMES = '''
+    Abbott Baker Castillo Dubois Eriksen Fischer Garcia Haddad Ito Jensen
+    Kowalski Lindqvist Moreau Nakamura Okafor Petrov Quinlan Rossi Silva
+    Tanaka Ueda Varga Weber Xu Yilmaz Zhang
+'''.split()
+
+
+def isbn_for(i: int) -> str:
+    return f'978{i:010d}'
+
+
+def member_id_for(i: int) -> str:
+    return f'M{i:07d}'
+
+
+def generate(data_dir: str, books: int, members: int, loans: int, seed: int = 0) -> None:
+    """Write books.csv, members.csv and loans.csv for a new data directory.
+
+    Loans are issued over the ``HISTORY_DAYS`` before ``REFERENCE_DATE``;
+    those issued in the last four weeks are still open, so about half of
+    the open loans are overdue on the reference date. Open loans are taken
+    from the available copies.
+    """
+    rng = random.Random(seed)
+    os.makedirs(data_dir, exist_ok=True)
+    days = [(REFERENCE_DATE - timedelta(days=d)).strftime('%Y-%m-%d')
+            for d in range(-LOAN_DAYS * 2, HISTORY_DAYS + 1)]
+
+    def day(offset: int) -> str:
+        # Day ``offset`` days before the reference date
+        return days[offset + LOAN_DAYS * 2]
+
+    copies = [rng.randint(1, 5) for _ in range(books)]
+    open_counts = [0] * books
+    with open(os.path.join(data_dir, 'loans.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(LOAN_FIELDS)
+        for i in range(loans):
+            book = rng.randrange(books)
+            issued = rng.randrange(HISTORY_DAYS)
+            returned = ''
+            if issued >= LOAN_DAYS * 2 or open_counts[book] >= copies[book]:
+                returned = day(max(0, issued - rng.randint(1, LOAN_DAYS)))
+            else:
+                open_counts[book] += 1
+            writer.writerow([f'L{i:09d}', member_id_for(rng.randrange(members)), isbn_for(book),
+                             day(issued), day(issued - LOAN_DAYS), returned])
+
+    with open(os.path.join(data_dir, 'books.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(BOOK_FIELDS)
+        for i in range(books):
+            title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).title()
+            author = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+            writer.writerow([isbn_for(i), title, author, copies[i], copies[i] - open_counts[i]])
+
+    with open(os.path.join(data_dir, 'members.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(MEMBER_FIELDS)
+        for i in range(members):
+            name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+            member_id = member_id_for(i)
+            writer.writerow([member_id, name, MEMBER_HASH, f'{member_id.lower()}@example.org',
+                             day(HISTORY_DAYS - rng.randrange(HISTORY_DAYS))])
+
+    # Adds librarians.csv
+    Storage(data_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic library data directory')
+    parser.add_argument('data_dir', help='Directory to write the CSV files to')
+    parser.add_argument('--size', choices=SIZES, default='10k', help='Preset catalogue size')
+    parser.add_argument('--books', type=int, help='Override the preset book count')
+    parser.add_argument('--members', type=int, help='Override the preset member count')
+    parser.add_argument('--loans', type=int, help='Override the preset loan count')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    books, members, loans = SIZES[args.size]
+    books = args.books or books
+    members = args.members or members
+    loans = args.loans if args.loans is not None else loans
+    generate(args.data_dir, books, members, loans, args.seed)
+    print(f'✔ Wrote {books} books, {members} members and {loans} loans to {args.data_dir}')
+
+if __name__ == '__main__':
+    main()
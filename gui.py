@@ -1,445 +1,790 @@
-import tkinter as tk
-from tkinter import ttk, messagebox
-from PIL import Image, ImageTk
-from datetime import datetime, timedelta
-from typing import Optional, Dict
-import re
-import os
-
-from auth import Auth
-from storage import Storage
-from models import Book, Member, Loan
-
-class LibraryApp(tk.Tk):
-    def __init__(self):
-        super().__init__()
-
-        self.title("Modern Library Management System")
-        self.geometry("1200x800")
-        self.configure(bg='#f0f0f0')
-
-        # Initialize backend components
-        self.storage = Storage()
-        self.auth = Auth(self.storage)
-        
-        # Setup styles
-        # Setup modern styles
-        self.style = ttk.Style(self)
-        self.style.configure('TLabel', font=('Helvetica', 12), background='#f0f0f0')
-        self.style.configure('TButton', font=('Helvetica', 11), padding=5)
-        self.style.configure('TEntry', font=('Helvetica', 11), padding=5)
-        self.style.configure('Accent.TButton', font=('Helvetica', 11, 'bold'), padding=10, background='#007bff')
-        self.style.configure('TNotebook.Tab', padding=(10, 5))
-        self.style.configure('TNotebook', background='#ffffff')
-        self.style.configure('Treeview', font=('Helvetica', 10), rowheight=25)
-        self.style.configure('Treeview.Heading', font=('Helvetica', 11, 'bold'))
-
-        # Create and set custom colors
-        self.colors = {
-            'primary': '#007bff',
-            'success': '#28a745',
-            'warning': '#ffc107',
-            'danger': '#dc3545',
-            'light': '#f8f9fa',
-            'dark': '#343a40'
-        }
-
-        # Create main container
-        self.main_container = ttk.Frame(self)
-        self.main_container.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
-
-        # Start with login screen
-        self.show_login_screen()
-
-    def show_login_screen(self):
-        self.clear_main_container()
-        
-        # Create a card-like frame for login
-        login_card = ttk.Frame(self.main_container, style='Card.TFrame')
-        login_card.pack(expand=True, padx=20, pady=20)
-
-        # Add decorative header
-        header_frame = ttk.Frame(login_card, style='Header.TFrame')
-        header_frame.pack(fill=tk.X, padx=2, pady=2)
-        header_frame.configure(style='Header.TFrame')
-
-        # Title with icon
-        title_frame = ttk.Frame(header_frame)
-        title_frame.pack(pady=20)
-        
-        title_label = ttk.Label(title_frame, 
-                               text="📚 Library Management System",
-                               font=('Helvetica', 24, 'bold'),
-                               foreground=self.colors['primary'])
-        title_label.pack()
-        
-        subtitle_label = ttk.Label(title_frame,
-                                  text="Welcome back! Please login to continue",
-                                  font=('Helvetica', 12),
-                                  foreground=self.colors['dark'])
-        subtitle_label.pack(pady=(5, 0))
-
-        # Main content frame
-        content_frame = ttk.Frame(login_card)
-        content_frame.pack(padx=40, pady=20, fill=tk.BOTH, expand=True)
-
-        # Role selection with modern styling
-        role_frame = ttk.Frame(content_frame)
-        role_frame.pack(pady=(0, 20))
-        self.role_var = tk.StringVar(value='member')
-        
-        # Style the radio buttons
-        for text, value in [('Member', 'member'), ('Librarian', 'librarian')]:
-            rb = ttk.Radiobutton(role_frame, text=text, value=value,
-                                variable=self.role_var,
-                                style='TRadiobutton')
-            rb.pack(side=tk.LEFT, padx=15)
-
-        # Username field with icon
-        username_frame = ttk.Frame(content_frame)
-        username_frame.pack(fill=tk.X, pady=5)
-        ttk.Label(username_frame, text="👤").pack(side=tk.LEFT, padx=(0, 10))
-        ttk.Label(username_frame, text="Username/ID:").pack(side=tk.LEFT)
-        
-        self.username_entry = ttk.Entry(content_frame, width=30)
-        self.username_entry.pack(fill=tk.X, pady=(0, 15))
-
-        # Password field with icon
-        password_frame = ttk.Frame(content_frame)
-        password_frame.pack(fill=tk.X, pady=5)
-        ttk.Label(password_frame, text="🔒").pack(side=tk.LEFT, padx=(0, 10))
-        ttk.Label(password_frame, text="Password:").pack(side=tk.LEFT)
-        
-        self.password_entry = ttk.Entry(content_frame, show='•', width=30)
-        self.password_entry.pack(fill=tk.X, pady=(0, 20))
-
-        # Modern login button
-        login_button = ttk.Button(content_frame, text="Login",
-                                command=self.handle_login,
-                                style='Accent.TButton')
-        login_button.pack(fill=tk.X, pady=10)
-
-        # Separator
-        ttk.Separator(content_frame, orient='horizontal').pack(fill=tk.X, pady=20)
-
-        # Register link with modern styling
-        register_frame = ttk.Frame(content_frame)
-        register_frame.pack(pady=10)
-        
-        ttk.Label(register_frame,
-                  text="New to our library?",
-                  foreground=self.colors['dark']).pack(side=tk.LEFT)
-        
-        register_link = ttk.Label(register_frame,
-                                 text="Create an account",
-                                 cursor="hand2",
-                                 foreground=self.colors['primary'])
-        register_link.pack(side=tk.LEFT, padx=5)
-        register_link.bind('<Button-1>', lambda e: self.show_register_screen())
-
-        # Add keyboard bindings
-        self.username_entry.bind('<Return>', lambda e: self.password_entry.focus())
-        self.password_entry.bind('<Return>', lambda e: self.handle_login())
-
-    def handle_login(self):
-        role = self.role_var.get()
-        username = self.username_entry.get().strip()
-        password = self.password_entry.get()
-
-        if not username or not password:
-            messagebox.showerror("Error", "Please fill in all fields")
-            return
-
-        if self.auth.login(role, username, password):
-            self.show_main_screen()
-        else:
-            messagebox.showerror("Error", "Invalid credentials")
-
-    def show_register_screen(self):
-        self.clear_main_container()
-
-        # Create a card-like frame for registration
-        register_card = ttk.Frame(self.main_container, style='Card.TFrame')
-        register_card.pack(expand=True, padx=20, pady=20)
-
-        # Header section
-        header_frame = ttk.Frame(register_card, style='Header.TFrame')
-        header_frame.pack(fill=tk.X, padx=2, pady=2)
-
-        # Title with icon
-        title_frame = ttk.Frame(header_frame)
-        title_frame.pack(pady=20)
-        
-        title_label = ttk.Label(title_frame,
-                               text="📝 New Member Registration",
-                               font=('Helvetica', 24, 'bold'),
-                               foreground=self.colors['primary'])
-        title_label.pack()
-        
-        subtitle_label = ttk.Label(title_frame,
-                                  text="Join our library community today!",
-                                  font=('Helvetica', 12),
-                                  foreground=self.colors['dark'])
-        subtitle_label.pack(pady=(5, 0))
-
-        # Main content frame
-        content_frame = ttk.Frame(register_card)
-        content_frame.pack(padx=40, pady=20, fill=tk.BOTH, expand=True)
-
-        # Member ID field with icon
-        id_frame = ttk.Frame(content_frame)
-        id_frame.pack(fill=tk.X, pady=5)
-        ttk.Label(id_frame, text="🆔").pack(side=tk.LEFT, padx=(0, 10))
-        ttk.Label(id_frame, text="Member ID:").pack(side=tk.LEFT)
-        
-        member_id_entry = ttk.Entry(content_frame, width=30)
-        member_id_entry.pack(fill=tk.X, pady=(0, 15))
-
-        # Name field with icon
-        name_frame = ttk.Frame(content_frame)
-        name_frame.pack(fill=tk.X, pady=5)
-        ttk.Label(name_frame, text="👤").pack(side=tk.LEFT, padx=(0, 10))
-        ttk.Label(name_frame, text="Full Name:").pack(side=tk.LEFT)
-        
-        name_entry = ttk.Entry(content_frame, width=30)
-        name_entry.pack(fill=tk.X, pady=(0, 15))
-
-        # Email field with icon
-        email_frame = ttk.Frame(content_frame)
-        email_frame.pack(fill=tk.X, pady=5)
-        ttk.Label(email_frame, text="📧").pack(side=tk.LEFT, padx=(0, 10))
-        ttk.Label(email_frame, text="Email:").pack(side=tk.LEFT)
-        
-        email_entry = ttk.Entry(content_frame, width=30)
-        email_entry.pack(fill=tk.X, pady=(0, 15))
-
-        # Password field with icon
-        password_frame = ttk.Frame(content_frame)
-        password_frame.pack(fill=tk.X, pady=5)
-        ttk.Label(password_frame, text="🔒").pack(side=tk.LEFT, padx=(0, 10))
-        ttk.Label(password_frame, text="Password:").pack(side=tk.LEFT)
-        
-        password_entry = ttk.Entry(content_frame, show='•', width=30)
-        password_entry.pack(fill=tk.X, pady=(0, 20))
-
-        def handle_register():
-            member_id = member_id_entry.get().strip()
-            name = name_entry.get().strip()
-            email = email_entry.get().strip()
-            password = password_entry.get()
-
-            if not all([member_id, name, email, password]):
-                messagebox.showerror("Error", "Please fill in all fields")
-                return
-
-            if not re.match(r"[^@]+@[^@]+\.[^@]+", email):
-                messagebox.showerror("Error", "Invalid email format")
-                return
-
-            if self.auth.register_member(member_id, name, password, email):
-                messagebox.showinfo("Success", "Registration successful! Please login.")
-                self.show_login_screen()
-            else:
-                messagebox.showerror("Error", "Member ID already exists")
-
-        # Register button with modern styling
-        register_button = ttk.Button(content_frame,
-                                   text="Create Account",
-                                   command=handle_register,
-                                   style='Accent.TButton')
-        register_button.pack(fill=tk.X, pady=10)
-
-        # Separator
-        ttk.Separator(content_frame, orient='horizontal').pack(fill=tk.X, pady=20)
-
-        # Back to login with modern styling
-        login_frame = ttk.Frame(content_frame)
-        login_frame.pack(pady=10)
-        
-        ttk.Label(login_frame,
-                  text="Already have an account?",
-                  foreground=self.colors['dark']).pack(side=tk.LEFT)
-        
-        back_link = ttk.Label(login_frame,
-                             text="Login here",
-                             cursor="hand2",
-                             foreground=self.colors['primary'])
-        back_link.pack(side=tk.LEFT, padx=5)
-        back_link.bind('<Button-1>', lambda e: self.show_login_screen())
-
-        # Add keyboard bindings for better UX
-        member_id_entry.bind('<Return>', lambda e: name_entry.focus())
-        name_entry.bind('<Return>', lambda e: email_entry.focus())
-        email_entry.bind('<Return>', lambda e: password_entry.focus())
-        password_entry.bind('<Return>', lambda e: handle_register())
-
-    def show_main_screen(self):
-        self.clear_main_container()
-        
-        # Create and show the dashboard screen
-        from gui.dashboard import DashboardScreen
-        dashboard = DashboardScreen(self.main_container, self)
-        dashboard.pack(fill=tk.BOTH, expand=True)
-
-        # Create menu bar
-        menu_frame = ttk.Frame(self.main_container)
-        menu_frame.pack(fill=tk.X, pady=(0, 20))
-
-        user = self.auth.get_current_user()
-        welcome_text = f"Welcome, {'Librarian' if self.auth.is_librarian() else 'Member'}: {user['user_id']}"
-        ttk.Label(menu_frame, text=welcome_text, 
-                 font=('Helvetica', 14)).pack(side=tk.LEFT, padx=10)
-
-        ttk.Button(menu_frame, text="Logout", 
-                  command=self.handle_logout).pack(side=tk.RIGHT, padx=10)
-
-        # Create notebook for different sections
-        notebook = ttk.Notebook(self.main_container)
-        notebook.pack(fill=tk.BOTH, expand=True)
-
-        # Books tab
-        books_frame = ttk.Frame(notebook)
-        self.setup_books_tab(books_frame)
-        notebook.add(books_frame, text='Books')
-
-        # Loans tab
-        loans_frame = ttk.Frame(notebook)
-        self.setup_loans_tab(loans_frame)
-        notebook.add(loans_frame, text='Loans')
-
-        if self.auth.is_librarian():
-            # Members tab (librarian only)
-            members_frame = ttk.Frame(notebook)
-            self.setup_members_tab(members_frame)
-            notebook.add(members_frame, text='Members')
-
-    def setup_books_tab(self, parent):
-        # Search frame
-        search_frame = ttk.Frame(parent)
-        search_frame.pack(fill=tk.X, padx=10, pady=10)
-
-        ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT, padx=5)
-        search_entry = ttk.Entry(search_frame, width=40)
-        search_entry.pack(side=tk.LEFT, padx=5)
-
-        # Books table
-        columns = ('ISBN', 'Title', 'Author', 'Available', 'Total')
-        tree = ttk.Treeview(parent, columns=columns, show='headings')
-
-        for col in columns:
-            tree.heading(col, text=col)
-            tree.column(col, width=100)
-
-        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-
-        # Populate books
-        for book in self.storage.get_all_books():
-            tree.insert('', tk.END, values=(book.isbn, book.title, book.author, 
-                                          book.copies_available, book.copies_total))
-
-        if self.auth.is_librarian():
-            # Add book button (librarian only)
-            add_button = ttk.Button(parent, text="Add New Book", 
-                                  command=lambda: self.show_add_book_dialog())
-            add_button.pack(pady=10)
-
-    def setup_loans_tab(self, parent):
-        # Loans table
-        columns = ('Loan ID', 'Member ID', 'ISBN', 'Issue Date', 'Due Date', 'Return Date')
-        tree = ttk.Treeview(parent, columns=columns, show='headings')
-
-        for col in columns:
-            tree.heading(col, text=col)
-            tree.column(col, width=100)
-
-        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-
-        # Populate loans based on role
-        if self.auth.is_librarian():
-            loans = self.storage.get_all_loans()
-        else:
-            user = self.auth.get_current_user()
-            loans = self.storage.get_member_loans(user['user_id'])
-
-        for loan in loans:
-            tree.insert('', tk.END, values=(
-                loan.loan_id, loan.member_id, loan.isbn,
-                loan.issue_date.strftime('%Y-%m-%d'),
-                loan.due_date.strftime('%Y-%m-%d'),
-                loan.return_date.strftime('%Y-%m-%d') if loan.return_date else 'Not Returned'
-            ))
-
-    def setup_members_tab(self, parent):
-        # Members table
-        columns = ('Member ID', 'Name', 'Email', 'Join Date')
-        tree = ttk.Treeview(parent, columns=columns, show='headings')
-
-        for col in columns:
-            tree.heading(col, text=col)
-            tree.column(col, width=150)
-
-        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-
-        # Populate members
-        for member in self.storage.get_all_members():
-            tree.insert('', tk.END, values=(
-                member.member_id, member.name, member.email,
-                member.join_date.strftime('%Y-%m-%d')
-            ))
-
-    def show_add_book_dialog(self):
-        dialog = tk.Toplevel(self)
-        dialog.title("Add New Book")
-        dialog.geometry("400x300")
-
-        ttk.Label(dialog, text="ISBN:").pack(pady=5)
-        isbn_entry = ttk.Entry(dialog, width=30)
-        isbn_entry.pack(pady=5)
-
-        ttk.Label(dialog, text="Title:").pack(pady=5)
-        title_entry = ttk.Entry(dialog, width=30)
-        title_entry.pack(pady=5)
-
-        ttk.Label(dialog, text="Author:").pack(pady=5)
-        author_entry = ttk.Entry(dialog, width=30)
-        author_entry.pack(pady=5)
-
-        ttk.Label(dialog, text="Number of Copies:").pack(pady=5)
-        copies_entry = ttk.Entry(dialog, width=30)
-        copies_entry.pack(pady=5)
-
-        def handle_add_book():
-            isbn = isbn_entry.get().strip()
-            title = title_entry.get().strip()
-            author = author_entry.get().strip()
-            try:
-                copies = int(copies_entry.get().strip())
-            except ValueError:
-                messagebox.showerror("Error", "Copies must be a number")
-                return
-
-            if not all([isbn, title, author]):
-                messagebox.showerror("Error", "Please fill in all fields")
-                return
-
-            new_book = Book(isbn=isbn, title=title, author=author,
-                          copies_total=copies, copies_available=copies)
-            self.storage.add_book(new_book)
-            messagebox.showinfo("Success", "Book added successfully")
-            dialog.destroy()
-            self.show_main_screen()
-
-        ttk.Button(dialog, text="Add Book", 
-                  command=handle_add_book).pack(pady=20)
-
-    def handle_logout(self):
-        self.auth.logout()
-        self.show_login_screen()
-
-    def clear_main_container(self):
-        for widget in self.main_container.winfo_children():
-            widget.destroy()
-
-if __name__ == "__main__":
-    app = LibraryApp()
-    app.mainloop()
\ No newline at end of file
+import tkinter as tk
+from tkinter import ttk, messagebox
+from PIL import Image, ImageTk
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import queue
+import re
+import os
+
+from main import LibrarySystem
+from models import Book, Member, Loan, LibraryError, Page
+
+# Rows fetched per page. A page is several screens tall, so scrolling a
+# little never waits on storage.
+PAGE_SIZE = 200
+
+# Fetch the next page once the bottom of the view passes this fraction of
+# the rows loaded so far, or the previous one once the top is above 1 - this
+PREFETCH_AT = 0.75
+
+# Pages kept in a table; scrolling further drops pages at the other end, so
+# a long catalogue never holds more than this many pages of rows
+MAX_PAGES = 5
+
+# Type-ahead waits for a pause in typing this long before querying
+DEBOUNCE_MS = 120
+
+# Type-ahead rows shown while typing
+SUGGESTIONS = 50
+
+
+def page_of(records: list, limit: int, cursor: Optional[str]) -> Page:
+    """Page through a list already in memory; the cursor is a position."""
+    start = int(cursor or 0)
+    end = start + limit
+    return Page(records[start:end], str(end) if end < len(records) else None)
+
+
+class BackgroundLoader:
+    """Runs storage calls on a worker thread and hands the results to Tk.
+
+    Tk may only be used from the main thread, so finished calls are queued
+    and delivered by an ``after()`` poll that runs while calls are pending.
+    A single worker keeps storage calls in submission order.
+    """
+
+    def __init__(self, root: tk.Misc, poll_ms: int = 20):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.results: queue.Queue = queue.Queue()
+        self.pending = 0
+
+    def submit(self, func: Callable, callback: Callable, *args,
+               errback: Optional[Callable[[Exception], None]] = None) -> None:
+        """Run ``func(*args)``, then ``callback(result)`` or ``errback(error)`` on the Tk thread.
+
+        Without ``errback`` a failed call is reported in a message box.
+        """
+        future = self.executor.submit(func, *args)
+        future.add_done_callback(lambda f: self.results.put((f, callback, errback)))
+        self.pending += 1
+        if self.pending == 1:
+            self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self) -> None:
+        while True:
+            try:
+                future, callback, errback = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending -= 1
+            try:
+                result = future.result()
+            except Exception as e:
+                if errback is not None:
+                    errback(e)
+                else:
+                    messagebox.showerror("Error", f"Could not load data: {e}")
+                continue
+            callback(result)
+        if self.pending:
+            self.root.after(self.poll_ms, self._poll)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class PagedTable(ttk.Frame):
+    """A Treeview that loads its rows a page at a time as it is scrolled.
+
+    ``fetch(limit, cursor)`` returns a ``Page`` and runs on the loader's
+    worker thread; ``to_row`` turns a record into the row's values. At most
+    ``MAX_PAGES`` pages are kept: a page fetched at one end drops the page
+    at the other, and scrolling back fetches dropped pages again from their
+    cursors.
+    """
+
+    def __init__(self, parent, loader: BackgroundLoader, columns: tuple, width: int,
+                 to_row: Callable[[object], tuple]):
+        super().__init__(parent)
+        self.loader = loader
+        self.to_row = to_row
+        self.fetch: Optional[Callable[[int, Optional[str]], Page]] = None
+        # (cursor the page was fetched with, its row IDs) of the pages shown
+        self.pages: List[Tuple[Optional[str], tuple]] = []
+        # Cursors of the pages dropped above the first one shown, nearest last
+        self.dropped: List[Optional[str]] = []
+        # Rows dropped above the first one shown
+        self.offset = 0
+        # Cursor of the page after the last one shown
+        self.cursor: Optional[str] = None
+        self.exhausted = False
+        self.loading = False
+        # Pages from an earlier load() are dropped when they arrive
+        self.generation = 0
+
+        self.tree = ttk.Treeview(self, columns=columns, show='headings')
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=width)
+        scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=lambda first, last: self._on_scroll(scrollbar, first, last))
+        self.status = ttk.Label(self, text="")
+
+        self.status.pack(side=tk.BOTTOM, anchor=tk.W)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(fill=tk.BOTH, expand=True)
+
+    def load(self, fetch: Callable[[int, Optional[str]], Page]) -> None:
+        """Replace the contents with the pages returned by ``fetch``."""
+        self.generation += 1
+        self.fetch = fetch
+        self.pages = []
+        self.dropped = []
+        self.offset = 0
+        self.cursor = None
+        self.exhausted = False
+        self.loading = False
+        self.tree.delete(*self.tree.get_children())
+        self._fetch_next()
+
+    def reload(self) -> None:
+        if self.fetch is not None:
+            self.load(self.fetch)
+
+    def _fetch_next(self) -> None:
+        if self.loading or self.exhausted or self.fetch is None:
+            return
+        self._fetch(self.cursor, at_top=False)
+
+    def _fetch_previous(self) -> None:
+        if self.loading or not self.dropped:
+            return
+        self._fetch(self.dropped[-1], at_top=True)
+
+    def _fetch(self, cursor: Optional[str], at_top: bool) -> None:
+        self.loading = True
+        self.status.configure(text="Loading…")
+        generation = self.generation
+        self.loader.submit(self.fetch, lambda page: self._add_page(generation, cursor, page, at_top),
+                           PAGE_SIZE, cursor,
+                           errback=lambda error: self._fetch_failed(generation, error))
+
+    def _fetch_failed(self, generation: int, error: Exception) -> None:
+        if generation != self.generation or not self.winfo_exists():
+            return
+        # Scrolling again retries
+        self.loading = False
+        self.status.configure(text=f"Could not load rows: {error}")
+
+    def _add_page(self, generation: int, cursor: Optional[str], page: Page, at_top: bool) -> None:
+        if generation != self.generation or not self.winfo_exists():
+            return
+        self.loading = False
+        first = float(self.tree.yview()[0])
+        total = len(self.tree.get_children())
+        top_row = first * total
+        if at_top:
+            self.dropped.pop()
+            ids = tuple(self.tree.insert('', i, values=self.to_row(r)) for i, r in enumerate(page.items))
+            self.pages.insert(0, (cursor, ids))
+            self.offset -= len(ids)
+            top_row += len(ids)
+            if len(self.pages) > MAX_PAGES:
+                last_cursor, last_ids = self.pages.pop()
+                self.tree.delete(*last_ids)
+                self.cursor = last_cursor
+                self.exhausted = False
+        else:
+            ids = tuple(self.tree.insert('', tk.END, values=self.to_row(r)) for r in page.items)
+            self.pages.append((cursor, ids))
+            self.cursor = page.cursor
+            self.exhausted = page.cursor is None
+            if len(self.pages) > MAX_PAGES:
+                first_cursor, first_ids = self.pages.pop(0)
+                self.tree.delete(*first_ids)
+                self.dropped.append(first_cursor)
+                self.offset += len(first_ids)
+                top_row -= len(first_ids)
+        # Keep the rows in view where they were on screen
+        total = len(self.tree.get_children())
+        if total:
+            self.tree.yview_moveto(max(top_row, 0) / total)
+        shown = f"Rows {self.offset + 1}–{self.offset + total}" if self.offset else f"{total} rows"
+        self.status.configure(text=shown if self.exhausted else f"{shown} loaded, scroll for more")
+
+    def show(self, rows: list, status: str = "") -> None:
+        """Replace the contents with ``(iid, values)`` rows, without fetching pages."""
+        self.generation += 1
+        self.fetch = None
+        self.pages = []
+        self.dropped = []
+        self.offset = 0
+        self.exhausted = True
+        self.loading = False
+        self.tree.delete(*self.tree.get_children())
+        for iid, values in rows:
+            self.tree.insert('', tk.END, iid=iid, values=values)
+        self.status.configure(text=status)
+
+    def _on_scroll(self, scrollbar: ttk.Scrollbar, first: str, last: str) -> None:
+        scrollbar.set(first, last)
+        if float(last) >= PREFETCH_AT:
+            self._fetch_next()
+        elif float(first) <= 1 - PREFETCH_AT:
+            self._fetch_previous()
+
+
+class LibraryApp(tk.Tk):
+    def __init__(self, data_dir: str = './data', cached: bool = False,
+                 journal: bool = False):
+        super().__init__()
+
+        self.title("Modern Library Management System")
+        self.geometry("1200x800")
+        self.configure(bg='#f0f0f0')
+
+        # Initialize backend components
+        self.library = LibrarySystem(data_dir, cached=cached, journal=journal)
+        self.storage = self.library.storage
+        self.auth = self.library.auth
+        self.catalogue = self.library.catalogue
+        self.loader = BackgroundLoader(self)
+        # Index building has its own worker so it never holds up a page
+        self.warmup = BackgroundLoader(self)
+        self.books_table: Optional[PagedTable] = None
+        
+        # Setup styles
+        # Setup modern styles
+        self.style = ttk.Style(self)
+        self.style.configure('TLabel', font=('Helvetica', 12), background='#f0f0f0')
+        self.style.configure('TButton', font=('Helvetica', 11), padding=5)
+        self.style.configure('TEntry', font=('Helvetica', 11), padding=5)
+        self.style.configure('Accent.TButton', font=('Helvetica', 11, 'bold'), padding=10, background='#007bff')
+        self.style.configure('TNotebook.Tab', padding=(10, 5))
+        self.style.configure('TNotebook', background='#ffffff')
+        self.style.configure('Treeview', font=('Helvetica', 10), rowheight=25)
+        self.style.configure('Treeview.Heading', font=('Helvetica', 11, 'bold'))
+
+        # Create and set custom colors
+        self.colors = {
+            'primary': '#007bff',
+            'success': '#28a745',
+            'warning': '#ffc107',
+            'danger': '#dc3545',
+            'light': '#f8f9fa',
+            'dark': '#343a40'
+        }
+
+        # Create main container
+        self.main_container = ttk.Frame(self)
+        self.main_container.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+
+        # Start with login screen
+        self.show_login_screen()
+
+    def show_login_screen(self):
+        self.clear_main_container()
+        
+        # Create a card-like frame for login
+        login_card = ttk.Frame(self.main_container, style='Card.TFrame')
+        login_card.pack(expand=True, padx=20, pady=20)
+
+        # Add decorative header
+        header_frame = ttk.Frame(login_card, style='Header.TFrame')
+        header_frame.pack(fill=tk.X, padx=2, pady=2)
+        header_frame.configure(style='Header.TFrame')
+
+        # Title with icon
+        title_frame = ttk.Frame(header_frame)
+        title_frame.pack(pady=20)
+        
+        title_label = ttk.Label(title_frame, 
+                               text="📚 Library Management System",
+                               font=('Helvetica', 24, 'bold'),
+                               foreground=self.colors['primary'])
+        title_label.pack()
+        
+        subtitle_label = ttk.Label(title_frame,
+                                  text="Welcome back! Please login to continue",
+                                  font=('Helvetica', 12),
+                                  foreground=self.colors['dark'])
+        subtitle_label.pack(pady=(5, 0))
+
+        # Main content frame
+        content_frame = ttk.Frame(login_card)
+        content_frame.pack(padx=40, pady=20, fill=tk.BOTH, expand=True)
+
+        # Role selection with modern styling
+        role_frame = ttk.Frame(content_frame)
+        role_frame.pack(pady=(0, 20))
+        self.role_var = tk.StringVar(value='member')
+        
+        # Style the radio buttons
+        for text, value in [('Member', 'member'), ('Librarian', 'librarian')]:
+            rb = ttk.Radiobutton(role_frame, text=text, value=value,
+                                variable=self.role_var,
+                                style='TRadiobutton')
+            rb.pack(side=tk.LEFT, padx=15)
+
+        # Username field with icon
+        username_frame = ttk.Frame(content_frame)
+        username_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(username_frame, text="👤").pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Label(username_frame, text="Username/ID:").pack(side=tk.LEFT)
+        
+        self.username_entry = ttk.Entry(content_frame, width=30)
+        self.username_entry.pack(fill=tk.X, pady=(0, 15))
+
+        # Password field with icon
+        password_frame = ttk.Frame(content_frame)
+        password_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(password_frame, text="🔒").pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Label(password_frame, text="Password:").pack(side=tk.LEFT)
+        
+        self.password_entry = ttk.Entry(content_frame, show='•', width=30)
+        self.password_entry.pack(fill=tk.X, pady=(0, 20))
+
+        # Modern login button
+        login_button = ttk.Button(content_frame, text="Login",
+                                command=self.handle_login,
+                                style='Accent.TButton')
+        login_button.pack(fill=tk.X, pady=10)
+
+        # Separator
+        ttk.Separator(content_frame, orient='horizontal').pack(fill=tk.X, pady=20)
+
+        # Register link with modern styling
+        register_frame = ttk.Frame(content_frame)
+        register_frame.pack(pady=10)
+        
+        ttk.Label(register_frame,
+                  text="New to our library?",
+                  foreground=self.colors['dark']).pack(side=tk.LEFT)
+        
+        register_link = ttk.Label(register_frame,
+                                 text="Create an account",
+                                 cursor="hand2",
+                                 foreground=self.colors['primary'])
+        register_link.pack(side=tk.LEFT, padx=5)
+        register_link.bind('<Button-1>', lambda e: self.show_register_screen())
+
+        # Add keyboard bindings
+        self.username_entry.bind('<Return>', lambda e: self.password_entry.focus())
+        self.password_entry.bind('<Return>', lambda e: self.handle_login())
+
+    def handle_login(self):
+        role = self.role_var.get()
+        username = self.username_entry.get().strip()
+        password = self.password_entry.get()
+
+        if not username or not password:
+            messagebox.showerror("Error", "Please fill in all fields")
+            return
+
+        if self.auth.login(role, username, password):
+            self.show_main_screen()
+        else:
+            messagebox.showerror("Error", "Invalid credentials")
+
+    def show_register_screen(self):
+        self.clear_main_container()
+
+        # Create a card-like frame for registration
+        register_card = ttk.Frame(self.main_container, style='Card.TFrame')
+        register_card.pack(expand=True, padx=20, pady=20)
+
+        # Header section
+        header_frame = ttk.Frame(register_card, style='Header.TFrame')
+        header_frame.pack(fill=tk.X, padx=2, pady=2)
+
+        # Title with icon
+        title_frame = ttk.Frame(header_frame)
+        title_frame.pack(pady=20)
+        
+        title_label = ttk.Label(title_frame,
+                               text="📝 New Member Registration",
+                               font=('Helvetica', 24, 'bold'),
+                               foreground=self.colors['primary'])
+        title_label.pack()
+        
+        subtitle_label = ttk.Label(title_frame,
+                                  text="Join our library community today!",
+                                  font=('Helvetica', 12),
+                                  foreground=self.colors['dark'])
+        subtitle_label.pack(pady=(5, 0))
+
+        # Main content frame
+        content_frame = ttk.Frame(register_card)
+        content_frame.pack(padx=40, pady=20, fill=tk.BOTH, expand=True)
+
+        # Member ID field with icon
+        id_frame = ttk.Frame(content_frame)
+        id_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(id_frame, text="🆔").pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Label(id_frame, text="Member ID:").pack(side=tk.LEFT)
+        
+        member_id_entry = ttk.Entry(content_frame, width=30)
+        member_id_entry.pack(fill=tk.X, pady=(0, 15))
+
+        # Name field with icon
+        name_frame = ttk.Frame(content_frame)
+        name_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(name_frame, text="👤").pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Label(name_frame, text="Full Name:").pack(side=tk.LEFT)
+        
+        name_entry = ttk.Entry(content_frame, width=30)
+        name_entry.pack(fill=tk.X, pady=(0, 15))
+
+        # Email field with icon
+        email_frame = ttk.Frame(content_frame)
+        email_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(email_frame, text="📧").pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Label(email_frame, text="Email:").pack(side=tk.LEFT)
+        
+        email_entry = ttk.Entry(content_frame, width=30)
+        email_entry.pack(fill=tk.X, pady=(0, 15))
+
+        # Password field with icon
+        password_frame = ttk.Frame(content_frame)
+        password_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(password_frame, text="🔒").pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Label(password_frame, text="Password:").pack(side=tk.LEFT)
+        
+        password_entry = ttk.Entry(content_frame, show='•', width=30)
+        password_entry.pack(fill=tk.X, pady=(0, 20))
+
+        def handle_register():
+            member_id = member_id_entry.get().strip()
+            name = name_entry.get().strip()
+            email = email_entry.get().strip()
+            password = password_entry.get()
+
+            if not all([member_id, name, email, password]):
+                messagebox.showerror("Error", "Please fill in all fields")
+                return
+
+            if not re.match(r"[^@]+@[^@]+\.[^@]+", email):
+                messagebox.showerror("Error", "Invalid email format")
+                return
+
+            if self.auth.register_member(member_id, name, password, email):
+                messagebox.showinfo("Success", "Registration successful! Please login.")
+                self.show_login_screen()
+            else:
+                messagebox.showerror("Error", "Member ID already exists")
+
+        # Register button with modern styling
+        register_button = ttk.Button(content_frame,
+                                   text="Create Account",
+                                   command=handle_register,
+                                   style='Accent.TButton')
+        register_button.pack(fill=tk.X, pady=10)
+
+        # Separator
+        ttk.Separator(content_frame, orient='horizontal').pack(fill=tk.X, pady=20)
+
+        # Back to login with modern styling
+        login_frame = ttk.Frame(content_frame)
+        login_frame.pack(pady=10)
+        
+        ttk.Label(login_frame,
+                  text="Already have an account?",
+                  foreground=self.colors['dark']).pack(side=tk.LEFT)
+        
+        back_link = ttk.Label(login_frame,
+                             text="Login here",
+                             cursor="hand2",
+                             foreground=self.colors['primary'])
+        back_link.pack(side=tk.LEFT, padx=5)
+        back_link.bind('<Button-1>', lambda e: self.show_login_screen())
+
+        # Add keyboard bindings for better UX
+        member_id_entry.bind('<Return>', lambda e: name_entry.focus())
+        name_entry.bind('<Return>', lambda e: email_entry.focus())
+        email_entry.bind('<Return>', lambda e: password_entry.focus())
+        password_entry.bind('<Return>', lambda e: handle_register())
+
+    def show_main_screen(self):
+        self.clear_main_container()
+        
+        # Create and show the dashboard screen
+        from gui.dashboard import DashboardScreen
+        dashboard = DashboardScreen(self.main_container, self)
+        dashboard.pack(fill=tk.BOTH, expand=True)
+
+        # Create menu bar
+        menu_frame = ttk.Frame(self.main_container)
+        menu_frame.pack(fill=tk.X, pady=(0, 20))
+
+        user = self.auth.get_current_user()
+        welcome_text = f"Welcome, {'Librarian' if self.auth.is_librarian() else 'Member'}: {user['user_id']}"
+        ttk.Label(menu_frame, text=welcome_text, 
+                 font=('Helvetica', 14)).pack(side=tk.LEFT, padx=10)
+
+        ttk.Button(menu_frame, text="Logout", 
+                  command=self.handle_logout).pack(side=tk.RIGHT, padx=10)
+
+        # Create notebook for different sections. Each tab is built the
+        # first time it is selected.
+        notebook = ttk.Notebook(self.main_container)
+        notebook.pack(fill=tk.BOTH, expand=True)
+        self.books_table = None
+
+        tabs = [('Books', self.setup_books_tab), ('Loans', self.setup_loans_tab)]
+        if self.auth.is_librarian():
+            # Members tab (librarian only)
+            tabs.append(('Members', self.setup_members_tab))
+
+        unbuilt = {}
+
+        def build_selected_tab(event=None):
+            tab = unbuilt.pop(notebook.select(), None)
+            if tab is not None:
+                setup, frame = tab
+                setup(frame)
+
+        notebook.bind('<<NotebookTabChanged>>', build_selected_tab)
+        for text, setup in tabs:
+            frame = ttk.Frame(notebook)
+            notebook.add(frame, text=text)
+            unbuilt[str(frame)] = (setup, frame)
+
+    def search_page(self, query: str, limit: int, cursor: Optional[str]) -> Page:
+        """A page of catalogue search results; the cursor is an offset."""
+        offset = int(cursor or 0)
+        books = self.catalogue.search(query, limit, offset)
+        return Page(books, str(offset + limit) if len(books) == limit else None)
+
+    def show_suggestions(self, table: PagedTable, query: str) -> None:
+        """Filter the books table to the type-ahead matches for ``query``.
+
+        Matches come from the search index alone; copy counts are filled in
+        once the worker has read them.
+        """
+        matches = self.catalogue.suggest(query, SUGGESTIONS)
+        table.show([(isbn, (isbn, title, author, '', '')) for isbn, title, author in matches],
+                   f"{len(matches)} matches, press Enter for all results")
+        generation = table.generation
+
+        def fill_counts(books: Dict[str, Book]):
+            if generation != table.generation or not table.winfo_exists():
+                return
+            for isbn, book in books.items():
+                table.tree.set(isbn, 'Available', book.copies_available)
+                table.tree.set(isbn, 'Total', book.copies_total)
+
+        self.loader.submit(self.storage.get_books_by_isbns, fill_counts,
+                           [isbn for isbn, _, _ in matches])
+
+    def setup_books_tab(self, parent):
+        # Search frame
+        search_frame = ttk.Frame(parent)
+        search_frame.pack(fill=tk.X, padx=10, pady=10)
+
+        ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT, padx=5)
+        search_entry = ttk.Entry(search_frame, width=40)
+        search_entry.pack(side=tk.LEFT, padx=5)
+
+        # Books table
+        columns = ('ISBN', 'Title', 'Author', 'Available', 'Total')
+        table = PagedTable(parent, self.loader, columns, 100,
+                           lambda book: (book.isbn, book.title, book.author,
+                                         book.copies_available, book.copies_total))
+        table.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.books_table = table
+
+        def handle_search(event=None):
+            query = search_entry.get().strip()
+            if query:
+                table.load(lambda limit, cursor: self.search_page(query, limit, cursor))
+            else:
+                table.load(self.storage.page_books)
+
+        pending = [None]
+
+        def type_ahead():
+            pending[0] = None
+            query = search_entry.get()
+            if not query.strip():
+                table.load(self.storage.page_books)
+            elif self.catalogue.ready:
+                self.show_suggestions(table, query)
+            else:
+                handle_search()
+
+        def handle_key(event):
+            # Enter runs the full search straight away
+            if event.keysym in ('Return', 'KP_Enter'):
+                return
+            if pending[0] is not None:
+                self.after_cancel(pending[0])
+            pending[0] = self.after(DEBOUNCE_MS, type_ahead)
+
+        search_entry.bind('<Return>', handle_search)
+        search_entry.bind('<KeyRelease>', handle_key)
+        ttk.Button(search_frame, text="Search",
+                  command=handle_search).pack(side=tk.LEFT, padx=5)
+
+        # Populate books
+        table.load(self.storage.page_books)
+
+        # Build the search index and its sorted word list in the background
+        # so type-ahead is ready by the time it is needed
+        self.warmup.submit(self.catalogue.prepare, lambda result: None)
+
+        if self.auth.is_librarian():
+            # Add book button (librarian only)
+            add_button = ttk.Button(parent, text="Add New Book", 
+                                  command=lambda: self.show_add_book_dialog())
+            add_button.pack(pady=10)
+
+    def setup_loans_tab(self, parent):
+        # Loans table
+        columns = ('Loan ID', 'Member ID', 'ISBN', 'Issue Date', 'Due Date', 'Return Date')
+        table = PagedTable(parent, self.loader, columns, 100, lambda loan: (
+            loan.loan_id, loan.member_id, loan.isbn,
+            loan.issue_date.strftime('%Y-%m-%d'),
+            loan.due_date.strftime('%Y-%m-%d'),
+            loan.return_date.strftime('%Y-%m-%d') if loan.return_date else 'Not Returned'
+        ))
+        table.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        # Populate loans based on role
+        if self.auth.is_librarian():
+            table.load(self.storage.page_loans)
+            ttk.Button(parent, text="Issue Books",
+                      command=lambda: self.show_issue_books_dialog(table)).pack(pady=10)
+        else:
+            # A member's loans are few; fetch them once and page in memory
+            member_id = self.auth.get_current_user()['user_id']
+            loans = []
+
+            def fetch(limit, cursor):
+                if cursor is None:
+                    loans[:] = self.storage.get_member_loans(member_id)
+                return page_of(loans, limit, cursor)
+            table.load(fetch)
+
+    def setup_members_tab(self, parent):
+        # Members table
+        columns = ('Member ID', 'Name', 'Email', 'Join Date')
+        table = PagedTable(parent, self.loader, columns, 150, lambda member: (
+            member.member_id, member.name, member.email,
+            member.join_date.strftime('%Y-%m-%d')
+        ))
+        table.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        # Populate members
+        table.load(self.storage.page_members)
+
+    def show_add_book_dialog(self):
+        dialog = tk.Toplevel(self)
+        dialog.title("Add New Book")
+        dialog.geometry("400x300")
+
+        ttk.Label(dialog, text="ISBN:").pack(pady=5)
+        isbn_entry = ttk.Entry(dialog, width=30)
+        isbn_entry.pack(pady=5)
+
+        ttk.Label(dialog, text="Title:").pack(pady=5)
+        title_entry = ttk.Entry(dialog, width=30)
+        title_entry.pack(pady=5)
+
+        ttk.Label(dialog, text="Author:").pack(pady=5)
+        author_entry = ttk.Entry(dialog, width=30)
+        author_entry.pack(pady=5)
+
+        ttk.Label(dialog, text="Number of Copies:").pack(pady=5)
+        copies_entry = ttk.Entry(dialog, width=30)
+        copies_entry.pack(pady=5)
+
+        def handle_add_book():
+            isbn = isbn_entry.get().strip()
+            title = title_entry.get().strip()
+            author = author_entry.get().strip()
+            try:
+                copies = int(copies_entry.get().strip())
+            except ValueError:
+                messagebox.showerror("Error", "Copies must be a number")
+                return
+
+            if not all([isbn, title, author]):
+                messagebox.showerror("Error", "Please fill in all fields")
+                return
+
+            new_book = Book(isbn=isbn, title=title, author=author,
+                          copies_total=copies, copies_available=copies)
+            self.storage.add_book(new_book)
+            messagebox.showinfo("Success", "Book added successfully")
+            dialog.destroy()
+            if self.books_table is not None and self.books_table.winfo_exists():
+                self.books_table.reload()
+
+        ttk.Button(dialog, text="Add Book", 
+                  command=handle_add_book).pack(pady=20)
+
+    def show_issue_books_dialog(self, loans_table: PagedTable):
+        dialog = tk.Toplevel(self)
+        dialog.title("Issue Books")
+        dialog.geometry("500x550")
+
+        ttk.Label(dialog, text="Member ID:").pack(pady=5)
+        member_entry = ttk.Entry(dialog, width=30)
+        member_entry.pack(pady=5)
+
+        ttk.Label(dialog, text="ISBNs (one per line, or scan each):").pack(pady=5)
+        isbns_text = tk.Text(dialog, width=40, height=8, font=('Helvetica', 11))
+        isbns_text.pack(pady=5)
+
+        all_or_nothing = tk.BooleanVar(value=False)
+        ttk.Checkbutton(dialog, text="Issue only if every book is available",
+                        variable=all_or_nothing).pack(pady=5)
+
+        results = ttk.Treeview(dialog, columns=('ISBN', 'Result'), show='headings', height=8)
+        results.heading('ISBN', text='ISBN')
+        results.heading('Result', text='Result')
+        results.column('ISBN', width=150)
+        results.column('Result', width=300)
+
+        def handle_issue():
+            member_id = member_entry.get().strip()
+            isbns = isbns_text.get("1.0", tk.END).split()
+            if not member_id or not isbns:
+                messagebox.showerror("Error", "Please enter a member ID and at least one ISBN")
+                return
+
+            try:
+                outcomes = self.library.lend_books(member_id, isbns, all_or_nothing.get())
+            except LibraryError as e:
+                messagebox.showerror("Error", str(e))
+                return
+
+            results.delete(*results.get_children())
+            for outcome in outcomes:
+                result = (f"Due {outcome.loan.due_date.strftime('%Y-%m-%d')}"
+                          if outcome.loan else outcome.error)
+                results.insert('', tk.END, values=(outcome.isbn, result))
+            if any(outcome.loan for outcome in outcomes):
+                isbns_text.delete("1.0", tk.END)
+                if loans_table.winfo_exists():
+                    loans_table.reload()
+                if self.books_table is not None and self.books_table.winfo_exists():
+                    self.books_table.reload()
+
+        ttk.Button(dialog, text="Check Out",
+                  command=handle_issue).pack(pady=10)
+        results.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+    def handle_logout(self):
+        self.auth.logout()
+        self.show_login_screen()
+
+    def clear_main_container(self):
+        for widget in self.main_container.winfo_children():
+            widget.destroy()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Library Management System GUI")
+    parser.add_argument("--data-dir", default="./data",
+                        help="Directory for CSV files, or sqlite:///path.db for SQLite")
+    args = parser.parse_args()
+    app = LibraryApp(args.data_dir)
+    app.mainloop()
+    app.loader.shutdown()
+    app.warmup.shutdown()
+    app.library.close()
@@ -0,0 +1,288 @@
+import bisect
+import csv
+import heapq
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from models import Hold, LibraryError
+from locking import FileLock, atomic_write, read_appended_lines
+
+# Days a member has to collect a copy set aside for their hold
+PICKUP_DAYS = 3
+
+# Rewrite holds.csv with just the live holds once it has this many rows
+# and at least half of them are about holds that have ended
+COMPACT_ROWS = 10_000
+
+
+class HoldQueue:
+    """The holds waiting for copies of one ISBN.
+
+    Holds are kept in a heap keyed by (-priority, ticket), where tickets
+    count up in request order, so taking the next hold costs O(log n).
+    A hold's place in the queue is the number of waiting holds with a
+    higher priority plus its ticket's distance from the first waiting
+    ticket of its own priority, less any tickets cancelled in between:
+    O(1) per priority level unless holds ahead of it were cancelled.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[int, int, str]] = []
+        # Hold ID -> (priority, ticket), for waiting holds only
+        self._tickets: Dict[str, Tuple[int, int]] = {}
+        # Per priority: the next ticket to hand out, the first ticket still
+        # waiting, the number waiting and the later tickets already gone
+        self._next: Dict[int, int] = {}
+        self._first: Dict[int, int] = {}
+        self._waiting: Dict[int, int] = {}
+        self._gone: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._tickets)
+
+    def __contains__(self, hold_id: str) -> bool:
+        return hold_id in self._tickets
+
+    def push(self, hold_id: str, priority: int = 0) -> None:
+        ticket = self._next.get(priority, 0)
+        self._next[priority] = ticket + 1
+        self._first.setdefault(priority, ticket)
+        self._waiting[priority] = self._waiting.get(priority, 0) + 1
+        self._tickets[hold_id] = (priority, ticket)
+        heapq.heappush(self._heap, (-priority, ticket, hold_id))
+
+    def remove(self, hold_id: str) -> bool:
+        """Take a hold out of the queue; its heap entry is skipped when reached."""
+        entry = self._tickets.pop(hold_id, None)
+        if entry is None:
+            return False
+        priority, ticket = entry
+        self._waiting[priority] -= 1
+        gone = self._gone.setdefault(priority, [])
+        if ticket == self._first[priority]:
+            first = ticket + 1
+            while gone and gone[0] == first:
+                gone.pop(0)
+                first += 1
+            self._first[priority] = first
+        else:
+            bisect.insort(gone, ticket)
+        return True
+
+    def pop(self) -> Optional[str]:
+        """Remove and return the hold to serve next, or None."""
+        while self._heap:
+            _, ticket, hold_id = heapq.heappop(self._heap)
+            if self._tickets.get(hold_id, (None, None))[1] == ticket:
+                self.remove(hold_id)
+                return hold_id
+        return None
+
+    def position(self, hold_id: str) -> Optional[int]:
+        """1 for the hold served next; None if the hold is not waiting."""
+        entry = self._tickets.get(hold_id)
+        if entry is None:
+            return None
+        priority, ticket = entry
+        ahead = sum(n for p, n in self._waiting.items() if p > priority)
+        gone = self._gone.get(priority)
+        skipped = bisect.bisect_left(gone, ticket) if gone else 0
+        return ahead + ticket - self._first[priority] - skipped + 1
+
+
+class HoldQueues:
+    """Every hold in a data directory, persisted in holds.csv.
+
+    holds.csv is an append-only log: ``P`` rows place a hold, ``R`` rows
+    record that a copy was set aside for it until the given time, and ``X``
+    rows end it (collected, cancelled or lapsed). It is replayed on first
+    use and read incrementally after that, so several processes can share
+    it; they serialize changes with ``lock``. Only the queue state is kept
+    here: moving copies on and off the shelf is up to the caller, which
+    should hold ``lock`` across both.
+    """
+
+    PLACE = 'P'
+    READY = 'R'
+    CLOSE = 'X'
+
+    def __init__(self, data_dir: str, pickup_days: int = PICKUP_DAYS,
+                 compact_rows: int = COMPACT_ROWS):
+        self.path = os.path.join(data_dir, 'holds.csv')
+        self.lock = FileLock(os.path.join(data_dir, '.holds.lock'))
+        self.pickup = timedelta(days=pickup_days)
+        self.compact_rows = compact_rows
+        self._reset()
+
+    def _reset(self) -> None:
+        # Live holds by ID, in the order they were placed
+        self._holds: Dict[str, Hold] = {}
+        self._queues: Dict[str, HoldQueue] = {}
+        self._member_holds: Dict[str, Dict[str, None]] = {}
+        # (expires, hold ID) of holds with a copy set aside; ended ones are skipped
+        self._ready: List[Tuple[datetime, str]] = []
+        self._set_aside = 0
+        self._inode = None
+        self._offset = 0
+        self._rows = 0
+
+    # Log handling; callers hold the lock
+
+    def _sync(self) -> None:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        if st is None or st.st_ino != self._inode or st.st_size < self._offset:
+            # Created, or rewritten by compaction
+            self._reset()
+            if st is None:
+                return
+            self._inode = st.st_ino
+        lines, self._offset = read_appended_lines(self.path, self._offset)
+        for row in csv.reader(lines):
+            if row:
+                self._apply(row)
+
+    def _apply(self, row: List[str]) -> None:
+        self._rows += 1
+        kind, hold_id = row[0], row[1]
+        if kind == self.PLACE:
+            hold = Hold(hold_id, row[2], row[3], datetime.fromisoformat(row[5]), int(row[4]))
+            self._holds[hold_id] = hold
+            self._queues.setdefault(hold.isbn, HoldQueue()).push(hold_id, hold.priority)
+            self._member_holds.setdefault(hold.member_id, {})[hold_id] = None
+            return
+        hold = self._holds.get(hold_id)
+        if hold is None:
+            return
+        self._queues[hold.isbn].remove(hold_id)
+        if kind == self.READY:
+            hold.expires = datetime.fromisoformat(row[2])
+            self._set_aside += 1
+            heapq.heappush(self._ready, (hold.expires, hold_id))
+        elif kind == self.CLOSE:
+            self._set_aside -= hold.expires is not None
+            del self._holds[hold_id]
+            del self._member_holds[hold.member_id][hold_id]
+
+    def _append(self, row: list) -> None:
+        with open(self.path, 'a', newline='') as f:
+            csv.writer(f).writerow(row)
+        self._sync()
+
+    def _maybe_compact(self) -> None:
+        live = len(self._holds) + self._set_aside
+        if self._rows < self.compact_rows or self._rows < 2 * live:
+            return
+        with atomic_write(self.path) as f:
+            writer = csv.writer(f)
+            # Placement order is kept, so tickets come out the same on replay
+            for hold in self._holds.values():
+                writer.writerow(self._place_row(hold))
+            for hold in self._holds.values():
+                if hold.expires:
+                    writer.writerow([self.READY, hold.hold_id, hold.expires.isoformat()])
+        self._reset()
+        self._sync()
+
+    def _place_row(self, hold: Hold) -> list:
+        return [self.PLACE, hold.hold_id, hold.member_id, hold.isbn, hold.priority,
+                hold.requested.isoformat(timespec='seconds')]
+
+    # Queries
+
+    def get(self, hold_id: str) -> Optional[Hold]:
+        with self.lock.shared():
+            self._sync()
+            return self._holds.get(hold_id)
+
+    def position(self, hold_id: str) -> Optional[int]:
+        """Place in its queue, 1 being next; None once a copy is set aside."""
+        with self.lock.shared():
+            self._sync()
+            hold = self._holds.get(hold_id)
+            return self._queues[hold.isbn].position(hold_id) if hold else None
+
+    def waiting(self, isbn: str) -> int:
+        """Holds on ``isbn`` still waiting for a copy."""
+        with self.lock.shared():
+            self._sync()
+            queue = self._queues.get(isbn)
+            return len(queue) if queue else 0
+
+    def member_holds(self, member_id: str) -> List[Tuple[Hold, Optional[int]]]:
+        """A member's live holds, oldest first, with their queue positions."""
+        with self.lock.shared():
+            self._sync()
+            holds = [self._holds[h] for h in self._member_holds.get(member_id, {})]
+            return [(h, self._queues[h.isbn].position(h.hold_id)) for h in holds]
+
+    def ready_holds(self, isbn: str) -> List[Hold]:
+        """Holds on ``isbn`` with a copy set aside."""
+        with self.lock.shared():
+            self._sync()
+            return [h for h in self._holds.values() if h.isbn == isbn and h.expires]
+
+    def ready_hold(self, member_id: str, isbn: str) -> Optional[Hold]:
+        with self.lock.shared():
+            self._sync()
+            return next((self._holds[h] for h in self._member_holds.get(member_id, {})
+                         if self._holds[h].isbn == isbn and self._holds[h].expires), None)
+
+    # Changes
+
+    def place(self, member_id: str, isbn: str, priority: int = 0,
+              now: Optional[datetime] = None) -> Hold:
+        """Join the queue for ``isbn``; higher priorities are served first."""
+        with self.lock.exclusive():
+            self._sync()
+            if any(self._holds[h].isbn == isbn for h in self._member_holds.get(member_id, {})):
+                raise LibraryError('You already have a hold on this book')
+            hold = Hold(str(uuid.uuid4()), member_id, isbn,
+                        (now or datetime.now()).replace(microsecond=0), priority)
+            self._append(self._place_row(hold))
+            return self._holds[hold.hold_id]
+
+    def allocate(self, isbn: str, now: Optional[datetime] = None) -> Optional[Hold]:
+        """Set a copy aside for the next hold on ``isbn``, which the caller has taken off the shelf."""
+        with self.lock.exclusive():
+            self._sync()
+            queue = self._queues.get(isbn)
+            hold_id = queue.pop() if queue else None
+            if hold_id is None:
+                return None
+            expires = (now or datetime.now()).replace(microsecond=0) + self.pickup
+            self._append([self.READY, hold_id, expires.isoformat()])
+            return self._holds[hold_id]
+
+    def close(self, hold_id: str) -> Optional[Hold]:
+        """End a hold; returns it, or None if it had already ended."""
+        with self.lock.exclusive():
+            self._sync()
+            hold = self._holds.get(hold_id)
+            if hold is not None:
+                self._append([self.CLOSE, hold_id])
+                self._maybe_compact()
+            return hold
+
+    def has_lapsed(self, now: Optional[datetime] = None) -> bool:
+        """Whether some pickup window may have passed, without ending anything."""
+        now = now or datetime.now()
+        with self.lock.shared():
+            self._sync()
+            return bool(self._ready) and self._ready[0][0] <= now
+
+    def lapsed(self, now: Optional[datetime] = None) -> List[Hold]:
+        """Holds whose pickup window has passed, earliest first; they stay live until closed."""
+        now = now or datetime.now()
+        lapsed = []
+        with self.lock.shared():
+            self._sync()
+            while self._ready and self._ready[0][0] <= now:
+                _, hold_id = heapq.heappop(self._ready)
+                hold = self._holds.get(hold_id)
+                if hold is not None and hold.expires and hold.expires <= now:
+                    lapsed.append(hold)
+        return lapsed
@@ -0,0 +1,183 @@
+import csv
+import json
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from models import Book, Member, Loan
+
+IMPORT_BATCH_SIZE = 10_000
+
+# Only the first few rejected rows are described, to keep memory bounded
+MAX_REPORTED_ERRORS = 100
+
+KINDS = ('books', 'members', 'loans')
+
+
+@dataclass
+class ImportReport:
+    kind: str
+    imported: int = 0
+    merged: int = 0
+    rejected: int = 0
+    errors: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def rows(self) -> int:
+        return self.imported + self.merged + self.rejected
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def reject(self, line: int, reason: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f'row {line}: {reason}')
+
+
+def read_rows(path: str, fmt: Optional[str] = None) -> Iterator[Dict[str, str]]:
+    """Stream rows from a CSV file (with header) or a JSON Lines file.
+
+    The format is taken from the file extension unless ``fmt`` is given.
+    Rows use the same column names as the data files, e.g. ``ISBN``.
+    """
+    if fmt is None:
+        fmt = 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+    with open(path, 'r', newline='') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        elif fmt == 'jsonl':
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise ValueError(f'Unknown import format: {fmt}')
+
+
+def _date(row: dict, key: str, default: Optional[datetime] = None) -> Optional[datetime]:
+    value = row.get(key)
+    if not value:
+        if default is None:
+            raise ValueError(f'missing {key}')
+        return default
+    return datetime.strptime(str(value), '%Y-%m-%d')
+
+
+def _text(row: dict, key: str) -> str:
+    value = str(row.get(key) or '').strip()
+    if not value:
+        raise ValueError(f'missing {key}')
+    return value
+
+
+def parse_book(row: dict) -> Book:
+    total = int(row.get('CopiesTotal') or row.get('Copies') or 0)
+    available = row.get('CopiesAvailable')
+    available = total if available in (None, '') else int(available)
+    if total < 0 or not 0 <= available <= total:
+        raise ValueError('invalid copy counts')
+    return Book(isbn=_text(row, 'ISBN'), title=_text(row, 'Title'),
+                author=_text(row, 'Author'), copies_total=total,
+                copies_available=available)
+
+
+def parse_member(row: dict) -> Tuple[Member, Optional[str]]:
+    """Return the member and, if it still needs hashing, its plain password."""
+    password_hash = str(row.get('PasswordHash') or '')
+    password = None
+    if not password_hash:
+        password = _text(row, 'Password')
+    member = Member(member_id=_text(row, 'MemberID'), name=_text(row, 'Name'),
+                    password_hash=password_hash, email=_text(row, 'Email'),
+                    join_date=_date(row, 'JoinDate', datetime.now()))
+    return member, password
+
+
+def parse_loan(row: dict) -> Loan:
+    return Loan(loan_id=str(row.get('LoanID') or uuid.uuid4()),
+                member_id=_text(row, 'MemberID'), isbn=_text(row, 'ISBN'),
+                issue_date=_date(row, 'IssueDate'), due_date=_date(row, 'DueDate'),
+                return_date=_date(row, 'ReturnDate') if row.get('ReturnDate') else None)
+
+
+def run_import(kind: str, rows: Iterable[dict], existing_keys: Set[str],
+               write_batch: Callable[[list, Dict[str, Tuple[int, int]]], None],
+               batch_size: int = IMPORT_BATCH_SIZE,
+               hash_passwords: Optional[Callable[[List[str]], List[str]]] = None) -> ImportReport:
+    """Validate and dedupe ``rows`` and hand them to ``write_batch``.
+
+    ``write_batch(records, merges)`` receives up to ``batch_size`` new
+    records and, for books, the extra ``(copies_total, copies_available)``
+    to add to ISBNs written earlier or already in the catalogue. Duplicate
+    member IDs are rejected; loans are not deduplicated. Only the key set
+    and one batch are held in memory.
+    """
+    if kind not in KINDS:
+        raise ValueError(f'Unknown import kind: {kind}')
+    report = ImportReport(kind)
+    start = time.perf_counter()
+    keys = existing_keys
+    batch: Dict[str, object] = {}
+    passwords: Dict[str, str] = {}
+    merges: Dict[str, Tuple[int, int]] = {}
+
+    def flush():
+        if passwords:
+            if hash_passwords is None:
+                raise ValueError('Member rows with plain passwords need a password hasher')
+            hashes = hash_passwords(list(passwords.values()))
+            for member_id, password_hash in zip(passwords, hashes):
+                batch[member_id].password_hash = password_hash
+            passwords.clear()
+        if batch or merges:
+            write_batch(list(batch.values()), dict(merges))
+        batch.clear()
+        merges.clear()
+
+    for line, row in enumerate(rows, 1):
+        try:
+            if kind == 'books':
+                record = parse_book(row)
+                key = record.isbn
+            elif kind == 'members':
+                record, password = parse_member(row)
+                key = record.member_id
+            else:
+                record = parse_loan(row)
+                key = record.loan_id
+        except (ValueError, TypeError) as e:
+            report.reject(line, str(e))
+            continue
+
+        if kind == 'books' and (key in keys or key in batch):
+            if key in batch:
+                batch[key].copies_total += record.copies_total
+                batch[key].copies_available += record.copies_available
+            else:
+                total, available = merges.get(key, (0, 0))
+                merges[key] = (total + record.copies_total,
+                               available + record.copies_available)
+            report.merged += 1
+            continue
+        if kind == 'members' and (key in keys or key in batch):
+            report.reject(line, f'duplicate member ID {key}')
+            continue
+
+        if kind == 'loans':
+            # Loan IDs are not tracked, so key the batch by position
+            key = str(line)
+        else:
+            keys.add(key)
+        batch[key] = record
+        if kind == 'members' and password is not None:
+            passwords[key] = password
+        report.imported += 1
+        if len(batch) >= batch_size:
+            flush()
+
+    flush()
+    report.seconds = time.perf_counter() - start
+    return report
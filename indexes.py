@@ -0,0 +1,55 @@
+import bisect
+import copy
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from models import Loan
+
+class DueDateIndex:
+    """Open loans kept sorted by due date.
+
+    Range queries bisect into the sorted keys, so they cost O(log n + k) for
+    k results instead of a pass over the whole loan history. Results are
+    passed through ``export``, which copies them by default.
+    """
+
+    def __init__(self, export: Callable[[Loan], Loan] = copy.copy):
+        self._keys: List[Tuple[datetime, str]] = []
+        self._loans: Dict[str, Loan] = {}
+        self._export = export
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, loan: Loan) -> None:
+        """Index ``loan`` if it is still open."""
+        if loan.return_date is not None or loan.loan_id in self._loans:
+            return
+        self._loans[loan.loan_id] = loan
+        bisect.insort(self._keys, (loan.due_date, loan.loan_id))
+
+    def get(self, loan_id: str) -> Optional[Loan]:
+        """The open loan with this ID, or None."""
+        loan = self._loans.get(loan_id)
+        return self._export(loan) if loan is not None else None
+
+    def discard(self, loan_id: str) -> None:
+        """Drop a loan, e.g. once it has been returned."""
+        loan = self._loans.pop(loan_id, None)
+        if loan is None:
+            return
+        i = bisect.bisect_left(self._keys, (loan.due_date, loan_id))
+        del self._keys[i]
+
+    def due_before(self, when: datetime) -> List[Loan]:
+        """Open loans due strictly before ``when``, earliest first."""
+        end = bisect.bisect_left(self._keys, (when,))
+        return self._slice(0, end)
+
+    def due_between(self, start: datetime, end: datetime) -> List[Loan]:
+        """Open loans with ``start <= due_date < end``, earliest first."""
+        lo = bisect.bisect_left(self._keys, (start,))
+        hi = bisect.bisect_left(self._keys, (end,))
+        return self._slice(lo, hi)
+
+    def _slice(self, lo: int, hi: int) -> List[Loan]:
+        return [self._export(self._loans[loan_id]) for _, loan_id in self._keys[lo:hi]]
@@ -0,0 +1,115 @@
+import csv
+import os
+from typing import Dict, Iterable, Iterator, List, Optional
+from models import Book
+
+class BookJournal:
+    """Append-only log of catalogue changes layered over books.csv.
+
+    Two kinds of rows are written: ``A`` rows carry a complete new book and
+    ``D`` rows carry a signed change to one book's available copies. Reading
+    the catalogue means loading books.csv and replaying the log on top of it;
+    compaction folds the log back into books.csv and removes it.
+    """
+
+    ADD = 'A'
+    DELTA = 'D'
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def append_book(self, book: Book) -> None:
+        self._append([self.ADD, book.isbn, book.title, book.author,
+                      book.copies_total, book.copies_available])
+
+    def append_delta(self, isbn: str, delta: int) -> None:
+        self._append([self.DELTA, isbn, delta])
+
+    def append_deltas(self, counts: Dict[str, int], sign: int = 1) -> None:
+        """Log ``sign * count`` for each ISBN with a single write."""
+        with open(self.path, 'a', newline='') as f:
+            csv.writer(f).writerows([self.DELTA, isbn, sign * n] for isbn, n in counts.items())
+
+    def _append(self, row: list) -> None:
+        with open(self.path, 'a', newline='') as f:
+            csv.writer(f).writerow(row)
+
+    def size(self) -> int:
+        """Size of the log in bytes (0 when there is no log)."""
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def replay(self, books: List[Book], isbn: Optional[str] = None) -> List[Book]:
+        """Apply the log to ``books`` in place and return the list.
+
+        As with books.csv, a change applies to the first book with a given
+        ISBN. When ``isbn`` is given, rows for every other ISBN are skipped.
+        """
+        if not os.path.exists(self.path):
+            return books
+
+        index: Dict[str, Book] = {}
+        for book in books:
+            index.setdefault(book.isbn, book)
+        with open(self.path, 'r', newline='') as f:
+            self.apply(csv.reader(f), index, books, isbn)
+        return books
+
+    def stream(self, books: Iterable[Book]) -> Iterator[Book]:
+        """Replay the log over a stream of books.csv books.
+
+        Yields the same books as ``replay`` would return, in the same order,
+        holding only the log in memory.
+        """
+        if not os.path.exists(self.path):
+            yield from books
+            return
+        with open(self.path, 'r', newline='') as f:
+            rows = [row for row in csv.reader(f) if row]
+
+        mentioned = {row[1] for row in rows}
+        deltas: Dict[str, int] = {}
+        for row in rows:
+            if row[0] == self.DELTA:
+                deltas[row[1]] = deltas.get(row[1], 0) + int(row[2])
+        in_csv = set()
+        for book in books:
+            # Only the first book with an ISBN takes its changes
+            if book.isbn in mentioned and book.isbn not in in_csv:
+                in_csv.add(book.isbn)
+                book.copies_available += deltas.get(book.isbn, 0)
+            yield book
+
+        added: List[Book] = []
+        self.apply((row for row in rows if row[0] == self.ADD or row[1] not in in_csv),
+                   {}, added)
+        yield from added
+
+    def apply(self, rows: Iterable[List[str]], index: Dict[str, Book],
+              added: Optional[List[Book]] = None, isbn: Optional[str] = None) -> None:
+        """Apply parsed log rows to books indexed by ISBN.
+
+        New books are added to ``index`` (unless the ISBN is already there)
+        and appended to ``added`` if given.
+        """
+        for row in rows:
+            if not row or (isbn is not None and row[1] != isbn):
+                continue
+            if row[0] == self.ADD:
+                book = Book(isbn=row[1], title=row[2], author=row[3],
+                            copies_total=int(row[4]),
+                            copies_available=int(row[5]))
+                if added is not None:
+                    added.append(book)
+                index.setdefault(book.isbn, book)
+            elif row[0] == self.DELTA and row[1] in index:
+                index[row[1]].copies_available += int(row[2])
+
+    def clear(self) -> None:
+        """Drop the log once its changes are part of books.csv."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,67 @@
+from array import array
+from typing import Dict, Iterator, List, Optional
+from models import CompactLoan
+
+class LoanTable:
+    """The loan history as parallel columns, used as a loan ID -> loan mapping.
+
+    Member IDs and ISBNs are kept as (interned) strings in lists and the
+    dates as day ordinals in ``array('i')`` columns, so a loan costs its ID,
+    a dict slot and a few machine words rather than an object graph.
+    Lookups return ``CompactLoan`` views built from the columns; assigning
+    to an existing ID updates its row in place.
+    """
+
+    def __init__(self):
+        self._rows: Dict[str, int] = {}
+        self.loan_ids: List[str] = []
+        self.member_ids: List[str] = []
+        self.isbns: List[str] = []
+        self.issue_days = array('i')
+        self.due_days = array('i')
+        self.return_days = array('i')
+
+    def __len__(self) -> int:
+        return len(self.loan_ids)
+
+    def __contains__(self, loan_id: str) -> bool:
+        return loan_id in self._rows
+
+    def _loan(self, row: int) -> CompactLoan:
+        return CompactLoan(self.loan_ids[row], self.member_ids[row], self.isbns[row],
+                           self.issue_days[row], self.due_days[row], self.return_days[row])
+
+    def __getitem__(self, loan_id: str) -> CompactLoan:
+        return self._loan(self._rows[loan_id])
+
+    def get(self, loan_id: str, default=None) -> Optional[CompactLoan]:
+        row = self._rows.get(loan_id)
+        return default if row is None else self._loan(row)
+
+    def __setitem__(self, loan_id: str, loan: CompactLoan) -> None:
+        row = self._rows.get(loan_id)
+        if row is None:
+            self._rows[loan_id] = len(self.loan_ids)
+            self.loan_ids.append(loan_id)
+            self.member_ids.append(loan.member_id)
+            self.isbns.append(loan.isbn)
+            self.issue_days.append(loan.issue_day)
+            self.due_days.append(loan.due_day)
+            self.return_days.append(loan.return_day)
+        else:
+            self.member_ids[row] = loan.member_id
+            self.isbns[row] = loan.isbn
+            self.issue_days[row] = loan.issue_day
+            self.due_days[row] = loan.due_day
+            self.return_days[row] = loan.return_day
+
+    def values(self) -> Iterator[CompactLoan]:
+        """The rows present now, built lazily as the iterator is consumed.
+
+        Columns only grow, so this is safe to consume without a lock; rows
+        updated in place meanwhile are seen with their new values.
+        """
+        return map(self._loan, range(len(self.loan_ids)))
+
+    def clear(self) -> None:
+        self.__init__()
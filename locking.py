@@ -0,0 +1,91 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import IO, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+class FileLock:
+    """Advisory inter-process lock on a lock file, reentrant within a process.
+
+    Readers take the lock shared and writers take it exclusive. Nested
+    acquisitions by the thread that holds the lock just bump a counter, so a
+    write operation can call read helpers; taking it exclusive inside a
+    shared hold is not supported. Threads of one process are serialized.
+    Without ``fcntl`` only the in-process part applies.
+
+    If ``buffer`` (an ``AppendBuffer`` from groupcommit.py) has rows waiting,
+    they are written as soon as a thread here takes the lock, which is then
+    held exclusively even when asked for shared, so readers in this process
+    never miss rows appended by it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._exclusive = False
+        self._fd = None
+        self.buffer = None
+
+    @contextmanager
+    def hold(self, exclusive: bool = True) -> Iterator[None]:
+        with self._thread_lock:
+            flush = self.buffer is not None and self.buffer.pending
+            if self._depth == 0:
+                self._exclusive = exclusive or flush
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX if self._exclusive else fcntl.LOCK_SH)
+            self._depth += 1
+            try:
+                if flush and self._exclusive:
+                    self.buffer.write_locked()
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    # Closing the descriptor releases the flock
+                    os.close(self._fd)
+                    self._fd = None
+
+    def shared(self):
+        return self.hold(exclusive=False)
+
+    def exclusive(self):
+        return self.hold(exclusive=True)
+
+
+@contextmanager
+def atomic_write(path: str) -> Iterator[IO[str]]:
+    """Write a file by filling a temporary sibling and renaming it over ``path``.
+
+    Readers see either the old or the new file, never a partial one.
+    """
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'w', newline='') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_appended_lines(path: str, offset: int):
+    """Return the complete lines written to ``path`` after ``offset``.
+
+    Returns ``(lines, new_offset)``. A last line without its newline may
+    still be being written, so it is left for the next call.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    return data[:end].decode().splitlines(), offset + end
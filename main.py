@@ -1,296 +1,635 @@
-import argparse
-from datetime import datetime, timedelta
-import uuid
-from storage import Storage
-from auth import Auth
-from models import Book, Loan
-
-class LibrarySystem:
-    def __init__(self, data_dir: str = './data'):
-        self.storage = Storage(data_dir)
-        self.auth = Auth(self.storage)
-
-    def librarian_menu(self):
-        while True:
-            print('\n=== Librarian Dashboard ===')
-            print('1. Add Book')
-            print('2. Register Member')
-            print('3. Issue Book')
-            print('4. Return Book')
-            print('5. Overdue List')
-            print('6. Logout')
-
-            choice = input('> ')
-            if choice == '1':
-                self.add_book()
-            elif choice == '2':
-                self.register_member()
-            elif choice == '3':
-                self.issue_book()
-            elif choice == '4':
-                self.return_book()
-            elif choice == '5':
-                self.show_overdue_list()
-            elif choice == '6':
-                self.auth.logout()
-                break
-            else:
-                print('Invalid choice. Please try again.')
-
-    def member_menu(self):
-        while True:
-            print('\n=== Member Dashboard ===')
-            print('1. Search Catalogue')
-            print('2. Borrow Book')
-            print('3. My Loans')
-            print('4. Logout')
-
-            choice = input('> ')
-            if choice == '1':
-                self.search_catalogue()
-            elif choice == '2':
-                self.borrow_book()
-            elif choice == '3':
-                self.view_my_loans()
-            elif choice == '4':
-                self.auth.logout()
-                break
-            else:
-                print('Invalid choice. Please try again.')
-
-    def add_book(self):
-        if not self.auth.is_librarian():
-            print('Unauthorized access')
-            return
-
-        isbn = input('Enter ISBN: ')
-        title = input('Enter Title: ')
-        author = input('Enter Author: ')
-        copies = input('Enter number of copies: ')
-
-        try:
-            copies = int(copies)
-            if copies < 0:
-                raise ValueError('Copies cannot be negative')
-
-            book = Book(isbn=isbn, title=title, author=author,
-                       copies_total=copies, copies_available=copies)
-            self.storage.add_book(book)
-            print('✔ Book added successfully')
-        except ValueError as e:
-            print(f'Error: {e}')
-
-    def register_member(self):
-        if not self.auth.is_librarian():
-            print('Unauthorized access')
-            return
-
-        member_id = input('Enter Member ID: ')
-        name = input('Enter Name: ')
-        email = input('Enter Email: ')
-        password = input('Enter Password: ')
-
-        if self.auth.register_member(member_id, name, password, email):
-            print('✔ Member registered successfully')
-        else:
-            print('Error: Member ID already exists')
-
-    def issue_book(self):
-        if not self.auth.is_librarian():
-            print('Unauthorized access')
-            return
-
-        isbn = input('ISBN to issue: ')
-        member_id = input('Member ID: ')
-
-        # Find the book
-        books = self.storage.get_all_books()
-        book = next((b for b in books if b.isbn == isbn), None)
-        if not book:
-            print('Error: Book not found')
-            return
-
-        if book.copies_available <= 0:
-            print('Error: No copies available')
-            return
-
-        # Verify member
-        member = self.storage.get_member_by_id(member_id)
-        if not member:
-            print('Error: Member not found')
-            return
-
-        # Create loan
-        issue_date = datetime.now()
-        due_date = issue_date + timedelta(days=14)
-        loan = Loan(
-            loan_id=str(uuid.uuid4()),
-            member_id=member_id,
-            isbn=isbn,
-            issue_date=issue_date,
-            due_date=due_date
-        )
-
-        # Update book availability
-        book.copies_available -= 1
-        books = [b if b.isbn != isbn else book for b in books]
-        self.storage._save_books(books)
-        self.storage.add_loan(loan)
-
-        print(f'✔ Book issued. Due on {due_date.strftime("%d-%b-%Y")}')
-
-    def return_book(self):
-        if not self.auth.is_librarian():
-            print('Unauthorized access')
-            return
-
-        loan_id = input('Enter Loan ID: ')
-        # Implementation for return book
-        print('✔ Book returned successfully')
-
-    def search_catalogue(self):
-        keyword = input('Enter search keyword (title/author): ').lower()
-        books = self.storage.get_all_books()
-        matches = [book for book in books
-                  if keyword in book.title.lower() or keyword in book.author.lower()]
-
-        if matches:
-            print('\nSearch Results:')
-            for book in matches:
-                print(f'ISBN: {book.isbn}')
-                print(f'Title: {book.title}')
-                print(f'Author: {book.author}')
-                print(f'Available Copies: {book.copies_available}/{book.copies_total}\n')
-        else:
-            print('No books found matching your search')
-
-    def borrow_book(self):
-        if not self.auth.is_member():
-            print('Please login as a member to borrow books')
-            return
-
-        isbn = input('Enter ISBN of the book to borrow: ')
-        member_id = self.auth.current_session['user_id']
-        
-        # Find the book
-        books = self.storage.get_all_books()
-        book = next((b for b in books if b.isbn == isbn), None)
-        if not book:
-            print('Error: Book not found')
-            return
-
-        if book.copies_available <= 0:
-            print('Error: No copies available')
-            return
-
-        # Create loan
-        issue_date = datetime.now()
-        due_date = issue_date + timedelta(days=14)
-        loan = Loan(
-            loan_id=str(uuid.uuid4()),
-            member_id=member_id,
-            isbn=isbn,
-            issue_date=issue_date,
-            due_date=due_date
-        )
-
-        # Update book availability
-        book.copies_available -= 1
-        books = [b if b.isbn != isbn else book for b in books]
-        self.storage._save_books(books)
-        self.storage.add_loan(loan)
-
-        print(f'✔ Book borrowed successfully. Due on {due_date.strftime("%d-%b-%Y")}')
-
-    def view_my_loans(self):
-        if not self.auth.is_member():
-            print('Please login as a member to view loans')
-            return
-
-        member_id = self.auth.current_session['user_id']
-        loans = self.storage.get_member_loans(member_id)
-
-        if not loans:
-            print('No loan history found')
-            return
-
-        print('\nYour Loan History:')
-        for loan in loans:
-            print(f'Loan ID: {loan.loan_id}')
-            print(f'ISBN: {loan.isbn}')
-            print(f'Issue Date: {loan.issue_date.strftime("%d-%b-%Y")}')
-            print(f'Due Date: {loan.due_date.strftime("%d-%b-%Y")}')
-            if loan.return_date:
-                print(f'Returned: {loan.return_date.strftime("%d-%b-%Y")}')
-            print()
-
-    def show_overdue_list(self):
-        if not self.auth.is_librarian():
-            print('Unauthorized access')
-            return
-
-        overdue_loans = self.storage.get_overdue_loans()
-        if not overdue_loans:
-            print('No overdue books')
-            return
-
-        print('\nOverdue Books:')
-        for loan in overdue_loans:
-            member = self.storage.get_member_by_id(loan.member_id)
-            print(f'Loan ID: {loan.loan_id}')
-            print(f'Member: {member.name} (ID: {member.member_id})')
-            print(f'ISBN: {loan.isbn}')
-            print(f'Due Date: {loan.due_date.strftime("%d-%b-%Y")}\n')
-
-    def signup_member(self):
-        print('\n=== Member Signup ===\n')
-        member_id = input('Enter Member ID: ')
-        name = input('Enter Name: ')
-        email = input('Enter Email: ')
-        password = input('Enter Password: ')
-
-        if self.auth.register_member(member_id, name, password, email):
-            print('✔ Signup successful! You can now login as a member.')
-        else:
-            print('Error: Member ID already exists')
-
-def main():
-    parser = argparse.ArgumentParser(description='Library Management System')
-    parser.add_argument('--data-dir', default='./data',
-                        help='Directory for CSV files')
-    args = parser.parse_args()
-
-    library = LibrarySystem(args.data_dir)
-
-    while True:
-        print('\n=== Library Management System ===')
-        print('1. Login as Librarian')
-        print('2. Login as Member')
-        print('3. Sign Up as New Member')
-        print('4. Exit')
-
-        choice = input('> ')
-        if choice == '1':
-            username = input('Username: ')
-            password = input('Password: ')
-            if library.auth.login('librarian', username, password):
-                library.librarian_menu()
-            else:
-                print('Invalid credentials')
-        elif choice == '2':
-            member_id = input('Member ID: ')
-            password = input('Password: ')
-            if library.auth.login('member', member_id, password):
-                library.member_menu()
-            else:
-                print('Invalid credentials')
-        elif choice == '3':
-            library.signup_member()
-        elif choice == '4':
-            print('Goodbye!')
-            break
-        else:
-            print('Invalid choice. Please try again.')
-
-if __name__ == '__main__':
-    main()
\ No newline at end of file
+import argparse
+import contextlib
+from datetime import datetime, timedelta
+import os
+import uuid
+from typing import Iterable, List, Optional, Tuple
+from storage import COMPACT_MODES, open_storage
+from groupcommit import DURABILITY_MODES, FLUSH_MS, FLUSH_RECORDS
+from auth import Auth
+from models import Book, CheckoutOutcome, Hold, Loan, LibraryError
+from holds import HoldQueues
+from search import CatalogueSearch
+from importer import IMPORT_BATCH_SIZE, KINDS, read_rows
+from metrics import Metrics, instrument_actions, instrument_auth, instrument_storage
+
+class LibrarySystem:
+    # Menu actions, traced as spans when metrics are enabled
+    ACTIONS = ('add_book', 'register_member', 'lend_book', 'lend_books', 'issue_book',
+               'issue_books', 'receive_return',
+               'return_book', 'search_catalogue', 'borrow_book', 'view_my_loans', 'show_overdue_list',
+               'signup_member', 'place_hold', 'cancel_hold', 'view_my_holds')
+
+    def __init__(self, data_dir: str = './data', cached: bool = False,
+                 journal: bool = False, metrics: Optional[Metrics] = None,
+                 compact: Optional[str] = None, durability: Optional[str] = None,
+                 flush_records: int = FLUSH_RECORDS, flush_ms: float = FLUSH_MS):
+        self.storage = open_storage(data_dir, cached=cached, journal=journal, compact=compact)
+        if durability is not None:
+            self.storage.buffer_appends(flush_records, flush_ms, durability)
+        self.auth = Auth(self.storage)
+        self.catalogue = CatalogueSearch(self.storage)
+        self.holds = HoldQueues(self.storage.data_dir)
+        self.metrics = metrics
+        if metrics is not None:
+            instrument_storage(self.storage, metrics)
+            instrument_auth(self.auth, metrics)
+            instrument_actions(self, metrics, self.ACTIONS)
+
+    def close(self) -> None:
+        """Write out buffered members and loans; call before exiting."""
+        self.storage.flush()
+
+    def write_metrics(self) -> None:
+        """Write metrics.json and the Prometheus file metrics.prom to the data directory."""
+        if self.metrics is None:
+            return
+        self.metrics.write_json(os.path.join(self.storage.data_dir, 'metrics.json'))
+        self.metrics.write_prometheus(os.path.join(self.storage.data_dir, 'metrics.prom'))
+
+    def librarian_menu(self):
+        while True:
+            print('\n=== Librarian Dashboard ===')
+            print('1. Add Book')
+            print('2. Register Member')
+            print('3. Issue Book')
+            print('4. Return Book')
+            print('5. Overdue List')
+            print('6. Issue Several Books')
+            print('7. Logout')
+
+            choice = input('> ')
+            if choice == '1':
+                self.add_book()
+            elif choice == '2':
+                self.register_member()
+            elif choice == '3':
+                self.issue_book()
+            elif choice == '4':
+                self.return_book()
+            elif choice == '5':
+                self.show_overdue_list()
+            elif choice == '6':
+                self.issue_books()
+            elif choice == '7':
+                self.auth.logout()
+                break
+            else:
+                print('Invalid choice. Please try again.')
+
+    def member_menu(self):
+        while True:
+            print('\n=== Member Dashboard ===')
+            print('1. Search Catalogue')
+            print('2. Borrow Book')
+            print('3. My Loans')
+            print('4. My Holds')
+            print('5. Logout')
+
+            choice = input('> ')
+            if choice == '1':
+                self.search_catalogue()
+            elif choice == '2':
+                self.borrow_book()
+            elif choice == '3':
+                self.view_my_loans()
+            elif choice == '4':
+                self.view_my_holds()
+            elif choice == '5':
+                self.auth.logout()
+                break
+            else:
+                print('Invalid choice. Please try again.')
+
+    def add_book(self):
+        if not self.auth.is_librarian():
+            print('Unauthorized access')
+            return
+
+        isbn = input('Enter ISBN: ')
+        title = input('Enter Title: ')
+        author = input('Enter Author: ')
+        copies = input('Enter number of copies: ')
+
+        try:
+            copies = int(copies)
+            if copies < 0:
+                raise ValueError('Copies cannot be negative')
+
+            book = Book(isbn=isbn, title=title, author=author,
+                       copies_total=copies, copies_available=copies)
+            self.storage.add_book(book)
+            print('✔ Book added successfully')
+        except ValueError as e:
+            print(f'Error: {e}')
+
+    def register_member(self):
+        if not self.auth.is_librarian():
+            print('Unauthorized access')
+            return
+
+        member_id = input('Enter Member ID: ')
+        name = input('Enter Name: ')
+        email = input('Enter Email: ')
+        password = input('Enter Password: ')
+
+        if self.auth.register_member(member_id, name, password, email):
+            print('✔ Member registered successfully')
+        else:
+            print('Error: Member ID already exists')
+
+    def lend_book(self, member_id: str, isbn: str, verify_member: bool = True) -> Loan:
+        """Lend one copy of ``isbn`` to ``member_id`` for 14 days.
+
+        A copy set aside for the member's hold is lent from the hold shelf.
+        Raises LibraryError if the book, a copy or the member is missing.
+        """
+        self._expire_holds()
+
+        # Find the book
+        book = self.storage.get_book_by_isbn(isbn)
+        if not book:
+            raise LibraryError('Book not found')
+
+        hold = self.holds.ready_hold(member_id, isbn)
+        if hold is None and book.copies_available <= 0:
+            raise LibraryError('No copies available')
+
+        # Verify member
+        if verify_member and not self.storage.get_member_by_id(member_id):
+            raise LibraryError('Member not found')
+
+        loan = self._new_loan(member_id, isbn)
+
+        # Only collecting a hold needs the holds lock; other checkouts go ahead in parallel
+        if hold is not None:
+            with self.holds.lock.exclusive():
+                # Check again: the hold may have lapsed or been collected meanwhile
+                hold = self.holds.ready_hold(member_id, isbn)
+                if hold is not None:
+                    # The copy was taken off the shelf when it was set aside
+                    self.storage.add_loan(loan)
+                    # The loan is written before the hold it replaces is closed
+                    self.storage.flush()
+                    self.holds.close(hold.hold_id)
+                    return loan
+
+        # Take a copy and record the loan in one step
+        if not self.storage.checkout(loan):
+            raise LibraryError('No copies available')
+        return loan
+
+    @staticmethod
+    def _new_loan(member_id: str, isbn: str) -> Loan:
+        issue_date = datetime.now()
+        due_date = issue_date + timedelta(days=14)
+        return Loan(
+            loan_id=str(uuid.uuid4()),
+            member_id=member_id,
+            isbn=isbn,
+            issue_date=issue_date,
+            due_date=due_date
+        )
+
+    def lend_books(self, member_id: str, isbns: Iterable[str], all_or_nothing: bool = False,
+                   verify_member: bool = True) -> List[CheckoutOutcome]:
+        """Lend a stack of books to one member, with an outcome per ISBN in order.
+
+        The member is checked once, and the copies are taken with one
+        catalogue write and the loans recorded with one append. With
+        ``all_or_nothing`` no book is lent unless every one can be.
+        Raises LibraryError if the member is missing.
+        """
+        isbns = [isbn.strip() for isbn in isbns if isbn.strip()]
+        if verify_member and not self.storage.get_member_by_id(member_id):
+            raise LibraryError('Member not found')
+
+        self._expire_holds()
+        # As in lend_book, the holds lock is only taken to collect holds
+        collecting = any(self.holds.ready_hold(member_id, isbn) for isbn in set(isbns))
+        with self.holds.lock.exclusive() if collecting else contextlib.nullcontext():
+            loans = [self._new_loan(member_id, isbn) for isbn in isbns]
+            # Copies set aside for the member's holds are already off the shelf
+            held = {}
+            for i, isbn in enumerate(isbns):
+                if isbn not in held:
+                    hold = self.holds.ready_hold(member_id, isbn)
+                    if hold is not None:
+                        held[isbn] = (i, hold)
+            from_shelf = {i for i, _ in held.values()}
+
+            taken = iter(self.storage.checkout_many(
+                [loan for i, loan in enumerate(loans) if i not in from_shelf], all_or_nothing))
+            lent = [i in from_shelf or next(taken) for i in range(len(loans))]
+            if all_or_nothing and not all(lent):
+                # Any shelf copies were recorded as not taken above
+                lent = [False] * len(loans)
+            held_loans = [loans[i] for i, _ in held.values() if lent[i]]
+            if held_loans:
+                self.storage.add_loans(held_loans)
+                self.storage.flush()
+                for i, hold in held.values():
+                    if lent[i]:
+                        self.holds.close(hold.hold_id)
+
+            failed = [isbn for isbn, ok in zip(isbns, lent) if not ok]
+            books = self.storage.get_books_by_isbns(failed) if failed else {}
+
+        # Explain each failure against the copies on the shelf now
+        available = {isbn: book.copies_available for isbn, book in books.items()}
+        outcomes = []
+        for i, (isbn, loan, ok) in enumerate(zip(isbns, loans, lent)):
+            if ok:
+                outcomes.append(CheckoutOutcome(isbn, loan))
+            elif isbn not in available:
+                outcomes.append(CheckoutOutcome(isbn, error='Book not found'))
+            elif i in from_shelf or available[isbn] > 0:
+                # Only happens with all_or_nothing: this one could have been lent
+                if i not in from_shelf:
+                    available[isbn] -= 1
+                outcomes.append(CheckoutOutcome(isbn, error='Not issued: another book could not be'))
+            else:
+                outcomes.append(CheckoutOutcome(isbn, error='No copies available'))
+        return outcomes
+
+    def receive_return(self, loan_id: str) -> Loan:
+        """Close loan ``loan_id`` and put its copy back on the shelf.
+
+        If members are waiting for the book, the copy is set aside for the
+        next of them instead. Raises LibraryError if no open loan has that ID.
+        """
+        self._expire_holds()
+        loan = self.storage.return_loan(loan_id.strip())
+        if loan is None:
+            raise LibraryError('No open loan with that ID')
+        # A hold placed after this check finds the copy on the shelf itself
+        if self.holds.waiting(loan.isbn):
+            with self.holds.lock.exclusive():
+                self._allocate(loan.isbn)
+        return loan
+
+    def place_hold(self, member_id: str, isbn: str, priority: int = 0,
+                   verify_member: bool = True) -> Hold:
+        """Queue ``member_id`` for the next copy of ``isbn``.
+
+        Higher priorities, which only librarians set, are served first. A
+        copy on the shelf with nobody ahead in the queue is set aside at
+        once. Raises LibraryError if the book or member is missing or the
+        member already has a hold on it.
+        """
+        if verify_member and not self.storage.get_member_by_id(member_id):
+            raise LibraryError('Member not found')
+        with self.holds.lock.exclusive():
+            self._expire_holds()
+            if not self.storage.get_book_by_isbn(isbn):
+                raise LibraryError('Book not found')
+            hold = self.holds.place(member_id, isbn, priority)
+            self._allocate(isbn)
+            return hold
+
+    def cancel_hold(self, member_id: str, hold_id: str) -> Hold:
+        """End one of a member's holds, passing any copy set aside to the next in line."""
+        with self.holds.lock.exclusive():
+            hold = self.holds.get(hold_id.strip())
+            if hold is None or hold.member_id != member_id:
+                raise LibraryError('No such hold')
+            self._release(hold)
+            return hold
+
+    def member_holds(self, member_id: str) -> List[Tuple[Hold, Optional[int]]]:
+        """A member's holds with their queue positions (None once a copy is ready)."""
+        with self.holds.lock.exclusive():
+            self._expire_holds()
+            return self.holds.member_holds(member_id)
+
+    def _allocate(self, isbn: str, now: Optional[datetime] = None) -> None:
+        """Set copies of ``isbn`` on the shelf aside for the holds waiting on it."""
+        while self.holds.waiting(isbn) and self.storage.adjust_availability(isbn, -1):
+            self.holds.allocate(isbn, now)
+
+    def _release(self, hold: Hold, now: Optional[datetime] = None) -> None:
+        self.holds.close(hold.hold_id)
+        if hold.expires is not None:
+            self.storage.adjust_availability(hold.isbn, 1)
+            self._allocate(hold.isbn, now)
+
+    def _expire_holds(self, now: Optional[datetime] = None) -> None:
+        """Pass copies not collected within their pickup window to the next holds."""
+        if not self.holds.has_lapsed(now):
+            return
+        with self.holds.lock.exclusive():
+            for hold in self.holds.lapsed(now):
+                self._release(hold, now)
+
+    def issue_book(self):
+        if not self.auth.is_librarian():
+            print('Unauthorized access')
+            return
+
+        isbn = input('ISBN to issue: ')
+        member_id = input('Member ID: ')
+
+        try:
+            loan = self.lend_book(member_id, isbn)
+        except LibraryError as e:
+            print(f'Error: {e}')
+            return
+
+        print(f'✔ Book issued. Due on {loan.due_date.strftime("%d-%b-%Y")}')
+
+    def issue_books(self):
+        if not self.auth.is_librarian():
+            print('Unauthorized access')
+            return
+
+        member_id = input('Member ID: ')
+        print('Enter or scan one ISBN per line; a blank line finishes the stack')
+        isbns = []
+        while True:
+            isbn = input('ISBN: ').strip()
+            if not isbn:
+                break
+            isbns.append(isbn)
+        all_or_nothing = input('Issue only if every book is available? (y/n): ').lower() == 'y'
+
+        try:
+            outcomes = self.lend_books(member_id, isbns, all_or_nothing)
+        except LibraryError as e:
+            print(f'Error: {e}')
+            return
+
+        for outcome in outcomes:
+            if outcome.loan:
+                print(f'✔ {outcome.isbn}: due on {outcome.loan.due_date.strftime("%d-%b-%Y")}')
+            else:
+                print(f'✘ {outcome.isbn}: {outcome.error}')
+        print(f'{sum(1 for o in outcomes if o.loan)} of {len(outcomes)} books issued')
+
+    def return_book(self):
+        if not self.auth.is_librarian():
+            print('Unauthorized access')
+            return
+
+        loan_id = input('Enter Loan ID: ')
+
+        try:
+            loan = self.receive_return(loan_id)
+        except LibraryError as e:
+            print(f'Error: {e}')
+            return
+
+        days_late = (loan.return_date.date() - loan.due_date.date()).days
+        if days_late > 0:
+            print(f'✔ Book returned successfully ({days_late} days late)')
+        else:
+            print('✔ Book returned successfully')
+        for hold in self.holds.ready_holds(loan.isbn):
+            print(f'On hold shelf for member {hold.member_id} until '
+                  f'{hold.expires.strftime("%d-%b-%Y")}')
+
+    def search_catalogue(self):
+        keyword = input('Enter search keyword (title/author): ')
+        matches = self.catalogue.search(keyword)
+
+        if matches:
+            print('\nSearch Results:')
+            for book in matches:
+                print(f'ISBN: {book.isbn}')
+                print(f'Title: {book.title}')
+                print(f'Author: {book.author}')
+                print(f'Available Copies: {book.copies_available}/{book.copies_total}\n')
+        else:
+            print('No books found matching your search')
+
+    def borrow_book(self):
+        if not self.auth.is_member():
+            print('Please login as a member to borrow books')
+            return
+
+        isbn = input('Enter ISBN of the book to borrow: ')
+        member_id = self.auth.current_session['user_id']
+
+        try:
+            # The logged-in member is known to exist
+            loan = self.lend_book(member_id, isbn, verify_member=False)
+        except LibraryError as e:
+            print(f'Error: {e}')
+            if str(e) == 'No copies available' and input('Place a hold? (y/n): ').lower() == 'y':
+                self.request_hold(member_id, isbn)
+            return
+
+        print(f'✔ Book borrowed successfully. Due on {loan.due_date.strftime("%d-%b-%Y")}')
+
+    def request_hold(self, member_id: str, isbn: str):
+        try:
+            # The logged-in member is known to exist
+            hold = self.place_hold(member_id, isbn, verify_member=False)
+        except LibraryError as e:
+            print(f'Error: {e}')
+            return
+
+        position = self.holds.position(hold.hold_id)
+        if position is None:
+            print('✔ A copy has been set aside for you')
+        else:
+            print(f'✔ Hold placed. You are number {position} in the queue')
+
+    def view_my_holds(self):
+        if not self.auth.is_member():
+            print('Please login as a member to view holds')
+            return
+
+        member_id = self.auth.current_session['user_id']
+        holds = self.member_holds(member_id)
+
+        if not holds:
+            print('No holds found')
+            return
+
+        print('\nYour Holds:')
+        for hold, position in holds:
+            print(f'Hold ID: {hold.hold_id}')
+            print(f'ISBN: {hold.isbn}')
+            if position is None:
+                print(f'Ready for pickup until {hold.expires.strftime("%d-%b-%Y")}')
+            else:
+                print(f'Queue position: {position}')
+            print()
+
+        hold_id = input('Hold ID to cancel (blank to go back): ').strip()
+        if hold_id:
+            try:
+                self.cancel_hold(member_id, hold_id)
+            except LibraryError as e:
+                print(f'Error: {e}')
+                return
+            print('✔ Hold cancelled')
+
+    def view_my_loans(self):
+        if not self.auth.is_member():
+            print('Please login as a member to view loans')
+            return
+
+        member_id = self.auth.current_session['user_id']
+        loans = self.storage.get_member_loans(member_id)
+
+        if not loans:
+            print('No loan history found')
+            return
+
+        print('\nYour Loan History:')
+        for loan in loans:
+            print(f'Loan ID: {loan.loan_id}')
+            print(f'ISBN: {loan.isbn}')
+            print(f'Issue Date: {loan.issue_date.strftime("%d-%b-%Y")}')
+            print(f'Due Date: {loan.due_date.strftime("%d-%b-%Y")}')
+            if loan.return_date:
+                print(f'Returned: {loan.return_date.strftime("%d-%b-%Y")}')
+            print()
+
+    def show_overdue_list(self):
+        if not self.auth.is_librarian():
+            print('Unauthorized access')
+            return
+
+        overdue = self.storage.get_overdue_report()
+        if not overdue:
+            print('No overdue books')
+            return
+
+        print('\nOverdue Books:')
+        for entry in overdue:
+            loan = entry.loan
+            name = entry.member.name if entry.member else 'Unknown member'
+            print(f'Loan ID: {loan.loan_id}')
+            print(f'Member: {name} (ID: {loan.member_id})')
+            print(f'ISBN: {loan.isbn}')
+            print(f'Due Date: {loan.due_date.strftime("%d-%b-%Y")}\n')
+
+    def signup_member(self):
+        print('\n=== Member Signup ===\n')
+        member_id = input('Enter Member ID: ')
+        name = input('Enter Name: ')
+        email = input('Enter Email: ')
+        password = input('Enter Password: ')
+
+        if self.auth.register_member(member_id, name, password, email):
+            print('✔ Signup successful! You can now login as a member.')
+        else:
+            print('Error: Member ID already exists')
+
+def run_import_command(library: LibrarySystem, args):
+    report = library.storage.bulk_import(
+        args.kind, read_rows(args.path, args.format), args.batch_size,
+        hash_passwords=library.auth.hash_passwords)
+    print(f'✔ Imported {report.imported} {report.kind} '
+          f'({report.merged} merged, {report.rejected} rejected) '
+          f'in {report.seconds:.2f}s, {report.rows_per_sec:,.0f} rows/sec')
+    for error in report.errors:
+        print(f'  {error}')
+    if report.rejected > len(report.errors):
+        print(f'  ... and {report.rejected - len(report.errors)} more rejected rows')
+
+def main():
+    parser = argparse.ArgumentParser(description='Library Management System')
+    parser.add_argument('--data-dir', default='./data',
+                        help='Directory for CSV files, or sqlite:///path.db for SQLite')
+    parser.add_argument('--cached', action='store_true',
+                        help='Load the CSV files once and serve lookups from memory')
+    parser.add_argument('--journal', action='store_true',
+                        help='Log book changes to an append-only journal instead of rewriting books.csv')
+    parser.add_argument('--compact', choices=COMPACT_MODES,
+                        help='Cache loans compactly (implies --cached): as slotted objects '
+                             'with day-number dates, or in columnar arrays')
+    parser.add_argument('--metrics', action='store_true',
+                        help='Record call counts, latencies and traces; written to the data '
+                             'directory as metrics.json and metrics.prom on exit')
+    parser.add_argument('--durability', choices=DURABILITY_MODES,
+                        help='Buffer new members and loans and write them in groups, with no '
+                             'fsync, one per group or one per record (default: write each at once)')
+    parser.add_argument('--flush-records', type=int, default=FLUSH_RECORDS,
+                        help='With --durability, write a group once this many rows are waiting')
+    parser.add_argument('--flush-ms', type=float, default=FLUSH_MS,
+                        help='With --durability, write a group once its oldest row is this old')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='Run the session under cProfile and write the stats to PATH')
+    subparsers = parser.add_subparsers(dest='command')
+    import_parser = subparsers.add_parser('import', help='Bulk import books, members or loans')
+    import_parser.add_argument('kind', choices=KINDS)
+    import_parser.add_argument('path', help='CSV file with a header row, or JSON Lines file')
+    import_parser.add_argument('--format', choices=['csv', 'jsonl'],
+                               help='Input format (default: from the file extension)')
+    import_parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                               help='Records written per batch')
+    serve_parser = subparsers.add_parser('serve', help='Run the HTTP/JSON service')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8080)
+    serve_parser.add_argument('--max-concurrency', type=int, default=64,
+                              help='Requests processed at once; the rest wait')
+    serve_parser.add_argument('--workers', type=int,
+                              help='Threads for storage and password hashing calls')
+    args = parser.parse_args()
+
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(run, args)
+        finally:
+            profiler.dump_stats(args.profile)
+            print(f'Profile written to {args.profile} (read it with: python -m pstats {args.profile})')
+    else:
+        run(args)
+
+def run(args):
+    metrics = Metrics() if args.metrics else None
+    library = LibrarySystem(args.data_dir, cached=args.cached, journal=args.journal,
+                            metrics=metrics, compact=args.compact, durability=args.durability,
+                            flush_records=args.flush_records, flush_ms=args.flush_ms)
+    try:
+        session(library, args)
+    finally:
+        library.close()
+        library.write_metrics()
+
+def session(library: LibrarySystem, args):
+    if args.command == 'import':
+        run_import_command(library, args)
+        return
+    if args.command == 'serve':
+        from server import serve
+        serve(library, args.host, args.port, args.max_concurrency, args.workers)
+        return
+
+    while True:
+        print('\n=== Library Management System ===')
+        print('1. Login as Librarian')
+        print('2. Login as Member')
+        print('3. Sign Up as New Member')
+        print('4. Exit')
+
+        choice = input('> ')
+        if choice == '1':
+            username = input('Username: ')
+            password = input('Password: ')
+            if library.auth.login('librarian', username, password):
+                library.librarian_menu()
+            else:
+                print('Invalid credentials')
+        elif choice == '2':
+            member_id = input('Member ID: ')
+            password = input('Password: ')
+            if library.auth.login('member', member_id, password):
+                library.member_menu()
+            else:
+                print('Invalid credentials')
+        elif choice == '3':
+            library.signup_member()
+        elif choice == '4':
+            print('Goodbye!')
+            break
+        else:
+            print('Invalid choice. Please try again.')
+
+if __name__ == '__main__':
+    main()
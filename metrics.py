@@ -0,0 +1,246 @@
+"""Opt-in metrics and tracing for storage, auth and library actions.
+
+Nothing here runs unless a ``Metrics`` object is passed to ``LibrarySystem``:
+instrumentation replaces methods on the storage, auth and library instances
+with timing wrappers, so uninstrumented objects run their plain methods.
+"""
+import bisect
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from locking import atomic_write
+
+# Upper bounds (in milliseconds) of the latency histogram buckets
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Completed root spans kept for the trace dump, and child spans kept per span
+MAX_TRACES = 100
+MAX_CHILDREN = 1000
+
+# Per-thread I/O counters (Linux); bytes are not reported elsewhere
+IO_STATS = '/proc/thread-self/io'
+
+ROW_PARSERS = {'_book_from_row': 'books', '_member_from_row': 'members',
+               '_loan_from_row': 'loans', '_compact_loan_from_row': 'loans'}
+
+
+def _read_io() -> Optional[Tuple[int, int, int]]:
+    """Return ``(chars read, chars written, size of this read)`` for the thread."""
+    try:
+        with open(IO_STATS, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    fields = dict(line.split(b': ') for line in data.splitlines())
+    return int(fields[b'rchar']), int(fields[b'wchar']), len(data)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        # One count per bucket plus the +Inf bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self) -> dict:
+        return {'count': self.count, 'sum': self.sum,
+                'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.counts))}
+
+
+class Metrics:
+    """Counters, latency histograms and recent traces, safe to share across threads.
+
+    Series are keyed by metric name and a label string such as
+    ``operation="storage.get_all_books"``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, str], float] = {}
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.traces: deque = deque(maxlen=MAX_TRACES)
+        self._local = threading.local()
+
+    def inc(self, name: str, labels: str = '', value: float = 1) -> None:
+        with self._lock:
+            self.counters[name, labels] = self.counters.get((name, labels), 0) + value
+
+    def observe(self, name: str, labels: str, value: float) -> None:
+        with self._lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[name, labels] = Histogram()
+            histogram.observe(value)
+
+    def _span_stack(self) -> List[dict]:
+        stack = getattr(self._local, 'spans', None)
+        if stack is None:
+            stack = self._local.spans = []
+        return stack
+
+    def _record_child(self, name: str, ms: float) -> None:
+        stack = self._span_stack()
+        if stack and len(stack[-1]['children']) < MAX_CHILDREN:
+            stack[-1]['children'].append({'name': name, 'ms': ms})
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[dict]:
+        """Trace a block; instrumented calls inside it are recorded as children."""
+        stack = self._span_stack()
+        span = {'name': name, 'start': time.time(), 'ms': 0.0, 'children': []}
+        stack.append(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span['ms'] = (time.perf_counter() - start) * 1000
+            stack.pop()
+            self.observe('library_span_duration_ms', f'span="{name}"', span['ms'])
+            if stack:
+                if len(stack[-1]['children']) < MAX_CHILDREN:
+                    stack[-1]['children'].append(span)
+            else:
+                with self._lock:
+                    self.traces.append(span)
+
+    def timed(self, operation: str, func: Callable, measure_io: bool = False) -> Callable:
+        """Wrap ``func`` to count calls, errors and latency under ``operation``.
+
+        With ``measure_io`` the bytes the thread reads and writes during the
+        outermost such call are counted too.
+        """
+        labels = f'operation="{operation}"'
+        local = self._local
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            outermost = measure_io and not getattr(local, 'io_depth', 0)
+            if measure_io:
+                local.io_depth = getattr(local, 'io_depth', 0) + 1
+            io_before = _read_io() if outermost else None
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                self.inc('library_errors_total', labels)
+                raise
+            finally:
+                ms = (time.perf_counter() - start) * 1000
+                if measure_io:
+                    local.io_depth -= 1
+                if io_before is not None:
+                    io_after = _read_io()
+                    self.inc('library_bytes_read_total', labels,
+                             io_after[0] - io_before[0] - io_before[2])
+                    self.inc('library_bytes_written_total', labels, io_after[1] - io_before[1])
+                self.inc('library_calls_total', labels)
+                self.observe('library_operation_duration_ms', labels, ms)
+                self._record_child(operation, ms)
+        return wrapper
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'counters': {_series(n, l): v for (n, l), v in sorted(self.counters.items())},
+                'histograms': {_series(n, l): h.to_dict()
+                               for (n, l), h in sorted(self.histograms.items())},
+                'traces': list(self.traces),
+            }
+
+    def to_prometheus(self) -> str:
+        """Render the counters and histograms in the Prometheus text format."""
+        lines = []
+        with self._lock:
+            seen = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f'# TYPE {name} counter')
+                lines.append(f'{_series(name, labels)} {value:g}')
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f'# TYPE {name} histogram')
+                prefix = f'{labels},' if labels else ''
+                cumulative = 0
+                bounds = [f'{b:g}' for b in histogram.buckets] + ['+Inf']
+                for bound, count in zip(bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                lines.append(f'{_series(name + "_sum", labels)} {histogram.sum:g}')
+                lines.append(f'{_series(name + "_count", labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path: str) -> None:
+        with atomic_write(path) as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def write_prometheus(self, path: str) -> None:
+        # Written atomically so a textfile collector never reads half a file
+        with atomic_write(path) as f:
+            f.write(self.to_prometheus())
+
+
+def _series(name: str, labels: str) -> str:
+    return f'{name}{{{labels}}}' if labels else name
+
+
+def _public_methods(obj) -> List[str]:
+    return [name for name in dir(obj)
+            if not name.startswith('_') and callable(getattr(obj, name))]
+
+
+def instrument_storage(storage, metrics: Metrics) -> None:
+    """Time every public storage method and count the rows it parses."""
+    for name in _public_methods(storage):
+        setattr(storage, name, metrics.timed(f'storage.{name}', getattr(storage, name),
+                                             measure_io=True))
+    for name, kind in ROW_PARSERS.items():
+        parse = getattr(storage, name, None)
+        if parse is not None:
+            setattr(storage, name, _counting(parse, metrics, f'kind="{kind}"'))
+
+
+def _counting(func: Callable, metrics: Metrics, labels: str) -> Callable:
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        metrics.inc('library_rows_parsed_total', labels)
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def instrument_auth(auth, metrics: Metrics) -> None:
+    """Time every public auth method, and each bcrypt check on its own."""
+    for name in _public_methods(auth):
+        setattr(auth, name, metrics.timed(f'auth.{name}', getattr(auth, name)))
+    checkpw = auth._checkpw
+
+    @wraps(checkpw)
+    def timed_checkpw(*args):
+        start = time.perf_counter()
+        try:
+            return checkpw(*args)
+        finally:
+            metrics.observe('library_bcrypt_duration_ms', '', (time.perf_counter() - start) * 1000)
+    auth._checkpw = timed_checkpw
+
+
+def instrument_actions(obj, metrics: Metrics, actions: Iterable[str]) -> None:
+    """Give each named method of ``obj`` its own trace span."""
+    for name in actions:
+        method = getattr(obj, name)
+
+        def traced(*args, _method=method, _name=name, **kwargs):
+            with metrics.span(_name):
+                return _method(*args, **kwargs)
+        setattr(obj, name, wraps(method)(traced))
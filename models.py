@@ -1,28 +1,112 @@
-from dataclasses import dataclass
-from datetime import datetime
-from typing import Optional
-
-@dataclass
-class Book:
-    isbn: str
-    title: str
-    author: str
-    copies_total: int
-    copies_available: int
-
-@dataclass
-class Member:
-    member_id: str
-    name: str
-    password_hash: str
-    email: str
-    join_date: datetime
-
-@dataclass
-class Loan:
-    loan_id: str
-    member_id: str
-    isbn: str
-    issue_date: datetime
-    due_date: datetime
-    return_date: Optional[datetime] = None
\ No newline at end of file
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+@dataclass(slots=True)
+class Book:
+    isbn: str
+    title: str
+    author: str
+    copies_total: int
+    copies_available: int
+
+@dataclass(slots=True)
+class Member:
+    member_id: str
+    name: str
+    password_hash: str
+    email: str
+    join_date: datetime
+
+@dataclass(slots=True)
+class Loan:
+    loan_id: str
+    member_id: str
+    isbn: str
+    issue_date: datetime
+    due_date: datetime
+    return_date: Optional[datetime] = None
+
+@dataclass(slots=True)
+class CheckoutOutcome:
+    """One book of a batch checkout: the loan made, or why there is none."""
+    isbn: str
+    loan: Optional[Loan] = None
+    error: Optional[str] = None
+
+@dataclass(slots=True)
+class Hold:
+    hold_id: str
+    member_id: str
+    isbn: str
+    requested: datetime
+    priority: int = 0
+    # End of the pickup window once a copy has been set aside
+    expires: Optional[datetime] = None
+
+class CompactLoan:
+    """A loan held as day ordinals, for caches of the whole loan history.
+
+    It takes about half the memory of a ``Loan``: no ``__dict__`` and no
+    ``datetime`` objects. The date attributes are built when read, so it
+    can stand in wherever a ``Loan`` is only read; ``to_loan()`` makes a
+    real one. A ``return_day`` of 0 means the loan is open.
+    """
+    __slots__ = ('loan_id', 'member_id', 'isbn', 'issue_day', 'due_day', 'return_day')
+
+    def __init__(self, loan_id: str, member_id: str, isbn: str, issue_day: int,
+                 due_day: int, return_day: int = 0):
+        self.loan_id = loan_id
+        self.member_id = member_id
+        self.isbn = isbn
+        self.issue_day = issue_day
+        self.due_day = due_day
+        self.return_day = return_day
+
+    @classmethod
+    def from_loan(cls, loan: Loan) -> 'CompactLoan':
+        return cls(loan.loan_id, loan.member_id, loan.isbn, loan.issue_date.toordinal(),
+                   loan.due_date.toordinal(),
+                   loan.return_date.toordinal() if loan.return_date else 0)
+
+    @property
+    def issue_date(self) -> datetime:
+        return datetime.fromordinal(self.issue_day)
+
+    @property
+    def due_date(self) -> datetime:
+        return datetime.fromordinal(self.due_day)
+
+    @property
+    def return_date(self) -> Optional[datetime]:
+        return datetime.fromordinal(self.return_day) if self.return_day else None
+
+    @return_date.setter
+    def return_date(self, value: Optional[datetime]) -> None:
+        self.return_day = value.toordinal() if value else 0
+
+    def to_loan(self) -> Loan:
+        return Loan(self.loan_id, self.member_id, self.isbn, self.issue_date,
+                    self.due_date, self.return_date)
+
+    def __repr__(self) -> str:
+        return f'CompactLoan({self.to_loan()!r})'
+
+@dataclass(slots=True)
+class OverdueEntry:
+    loan: Loan
+    member: Optional[Member]
+    book: Optional[Book]
+
+@dataclass(slots=True)
+class Page:
+    """One page of a paginated query.
+
+    Pass ``cursor`` back to get the next page; it is None once the data is
+    exhausted. Cursors are opaque and only valid for the storage that made them.
+    """
+    items: List
+    cursor: Optional[str]
+
+class LibraryError(Exception):
+    """A library operation was refused; the message is shown to the user."""
@@ -0,0 +1,420 @@
+"""Loan history partitioned by month of issue.
+
+``loans/`` holds one CSV file per month (``2026-10.csv``, ...) with the
+columns of loans.csv, and ``active.csv``, the loans that were still open
+when it was last rewritten. Returns are appended to returns.csv as usual;
+when active.csv is rewritten without its returned loans, their return
+dates move to the ``<month>.returns.csv`` of the month they were issued.
+Overdue and due-soon queries read only the active partition and the
+returns of its loans, and date-bounded queries open only the months they
+cover. Months before the
+current one can be compressed with gzip or lzma; they are read back as
+streams and can still be appended to (as a new gzip member or xz stream).
+
+A data directory containing ``loans/`` is opened as ``PartitionedStorage``
+by ``open_storage``. Convert from and back to a single loans.csv with::
+
+    python partitions.py migrate ./data [--codec gzip]
+    python partitions.py archive ./data --codec lzma
+    python partitions.py export ./data
+"""
+import argparse
+import csv
+import os
+import re
+import gzip
+import lzma
+import shutil
+from datetime import datetime
+from typing import Callable, Dict, IO, Iterable, Iterator, List, Optional
+from models import Loan, Page
+from importer import IMPORT_BATCH_SIZE, ImportReport, run_import
+from indexes import DueDateIndex
+from locking import atomic_write
+from groupcommit import append_rows, fsync_path
+from storage import BOOK_STORE_FILE, LOAN_FIELDS, LOAN_PARTITIONS_DIR, RETURN_FIELDS, Storage
+
+ACTIVE_FILE = 'active.csv'
+
+# Codec name -> (file suffix, open function)
+CODECS = {'gzip': ('.gz', gzip.open), 'lzma': ('.xz', lzma.open)}
+
+PARTITION_NAME = re.compile(r'^(\d{4}-\d{2})\.csv(\.gz|\.xz)?$')
+
+RETURNS_FILE = '{}.returns.csv'
+
+# Rewrite active.csv without its returned loans once it is this big and
+# no more than half of its rows are still open
+ACTIVE_MAX_BYTES = 1 << 20
+
+
+def _open(path: str, mode: str) -> IO:
+    """Open a partition as text, decompressing by file suffix."""
+    for suffix, opener in CODECS.values():
+        if path.endswith(suffix):
+            return opener(path, mode, newline='')
+    return open(path, mode, newline='')
+
+
+class LoanPartitions:
+    """The files of a ``loans/`` directory; callers hold the loans lock."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.active_path = os.path.join(root, ACTIVE_FILE)
+
+    @staticmethod
+    def exists(data_dir: str) -> bool:
+        return os.path.isdir(os.path.join(data_dir, LOAN_PARTITIONS_DIR))
+
+    def months(self) -> Dict[str, str]:
+        """Month -> partition file, oldest first."""
+        found: Dict[str, str] = {}
+        for name in sorted(os.listdir(self.root)):
+            match = PARTITION_NAME.match(name)
+            # An uncompressed file wins: archive removes it only after the
+            # compressed copy is complete
+            if match and (match.group(1) not in found or not match.group(2)):
+                found[match.group(1)] = os.path.join(self.root, name)
+        return dict(sorted(found.items()))
+
+    def between(self, start: datetime, end: datetime) -> List[str]:
+        """Partitions that can hold loans issued from ``start`` up to ``end``."""
+        first, last = start.strftime('%Y-%m'), end.strftime('%Y-%m')
+        return [path for month, path in self.months().items() if first <= month <= last]
+
+    def append(self, rows: Iterable[list], sync: bool = False) -> None:
+        """Append loan rows, each to the partition of its issue month, then fsync if ``sync``."""
+        by_month: Dict[str, List[list]] = {}
+        for row in rows:
+            by_month.setdefault(row[3][:7], []).append(row)
+        months = self.months()
+        for month, month_rows in by_month.items():
+            path = months.get(month) or os.path.join(self.root, f'{month}.csv')
+            new = not os.path.exists(path)
+            with _open(path, 'at') as f:
+                writer = csv.writer(f)
+                if new:
+                    writer.writerow(LOAN_FIELDS)
+                writer.writerows(month_rows)
+            if sync:
+                fsync_path(path)
+
+    def returns_path(self, month: str) -> str:
+        return os.path.join(self.root, RETURNS_FILE.format(month))
+
+    def month_returns(self, path: str) -> Dict[str, str]:
+        """Loan ID -> return date for the returns folded into partition ``path``."""
+        month = PARTITION_NAME.match(os.path.basename(path)).group(1)
+        try:
+            with open(self.returns_path(month), newline='') as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                return {row[0]: row[1] for row in reader if row}
+        except FileNotFoundError:
+            return {}
+
+    def add_returns(self, rows: Iterable[list]) -> None:
+        """Append ``(issued, loan_id, return_date)`` rows to their months' returns and fsync."""
+        by_month: Dict[str, List[list]] = {}
+        for issued, loan_id, return_date in rows:
+            by_month.setdefault(issued[:7], []).append([loan_id, return_date])
+        for month, month_rows in by_month.items():
+            path = self.returns_path(month)
+            new = not os.path.exists(path)
+            with open(path, 'a', newline='') as f:
+                writer = csv.writer(f)
+                if new:
+                    writer.writerow(RETURN_FIELDS)
+                writer.writerows(month_rows)
+            fsync_path(path)
+
+    def archive(self, codec: str, before: str) -> List[str]:
+        """Compress the uncompressed partitions of months before ``before``."""
+        suffix, opener = CODECS[codec]
+        archived = []
+        for month, path in self.months().items():
+            if month >= before or not path.endswith('.csv'):
+                continue
+            target = path + suffix
+            with open(path, 'rb') as src, opener(f'{target}.tmp', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(f'{target}.tmp', target)
+            os.remove(path)
+            archived.append(target)
+        return archived
+
+
+class PartitionedStorage(Storage):
+    """CSV storage with the loan history split into monthly partitions.
+
+    ``loans_file`` is the active partition, so the due-date index and
+    returns work as in ``Storage`` but only read loans that may be open.
+    Books and members stay in their usual CSV files, and returns.csv only
+    holds the returns of loans in the active partition.
+    """
+
+    def __init__(self, data_dir: str = './data', journal: bool = False,
+                 active_max_bytes: int = ACTIVE_MAX_BYTES):
+        self.partitions = LoanPartitions(os.path.join(data_dir, LOAN_PARTITIONS_DIR))
+        self.active_max_bytes = active_max_bytes
+        self._active_inode = None
+        # Returns to record before active.csv is next worth checking
+        self._returns_until_check = 0
+        super().__init__(data_dir, journal=journal)
+
+    def _initialize_files(self):
+        os.makedirs(self.partitions.root, exist_ok=True)
+        self.loans_file = self.partitions.active_path
+        super()._initialize_files()
+
+    def _write_loan_rows(self, rows: List[list], sync: bool) -> None:
+        self.partitions.append(rows, sync)
+        open_rows = [row for row in rows if not row[5]]
+        if open_rows:
+            append_rows(self.loans_file, open_rows, sync)
+
+    def _partition_rows(self, path: str) -> Iterator[Dict[str, str]]:
+        if path.endswith('.csv'):
+            for row, _ in self._scan(path, self._loans_lock, LOAN_FIELDS):
+                yield row
+            return
+        with self._loans_lock.shared():
+            f = _open(path, 'rt')
+        with f:
+            reader = csv.reader(f)
+            next(reader, None)
+            try:
+                for row in reader:
+                    if row:
+                        yield dict(zip(LOAN_FIELDS, row))
+            except EOFError:
+                # Another process is still appending to the stream
+                return
+
+    def _returned_rows(self, path: str) -> Iterator[Dict[str, str]]:
+        """Rows of one partition with their return dates, folded or still in returns.csv."""
+        with self._loans_lock.shared():
+            folded = self.partitions.month_returns(path)
+        for row in self._partition_rows(path):
+            if not row['ReturnDate']:
+                row['ReturnDate'] = folded.get(row['LoanID']) or self._returns.get(row['LoanID'], '')
+            yield row
+
+    def _rows(self, paths: Optional[List[str]] = None) -> Iterator[Dict[str, str]]:
+        """Rows of the given partitions (default all), with returns applied."""
+        with self._loans_lock.shared():
+            self._sync_returns()
+            if paths is None:
+                paths = list(self.partitions.months().values())
+        for path in paths:
+            yield from self._returned_rows(path)
+
+    def get_all_loans(self) -> List[Loan]:
+        return [self._loan_from_row(row) for row in self._rows()]
+
+    def get_member_loans(self, member_id: str) -> List[Loan]:
+        return [self._loan_from_row(row) for row in self._rows() if row['MemberID'] == member_id]
+
+    def get_loans_issued(self, start: datetime, end: datetime) -> List[Loan]:
+        loans = (self._loan_from_row(row) for row in self._rows(self.partitions.between(start, end)))
+        return [loan for loan in loans if start <= loan.issue_date < end]
+
+    def iter_loans(self, where: Optional[Callable[[Loan], bool]] = None) -> Iterator[Loan]:
+        for row in self._rows():
+            loan = self._loan_from_row(row)
+            if where is None or where(loan):
+                yield loan
+
+    def page_loans(self, limit: int, cursor: Optional[str] = None,
+                   where: Optional[Callable[[Loan], bool]] = None) -> Page:
+        """A page of loans by month; the cursor is ``month:rows read in that month``.
+
+        Compressed partitions cannot be seeked, so a page skips over the
+        earlier rows of its first month, but never reads earlier months.
+        """
+        month, _, skip = (cursor or ':0').partition(':')
+        with self._loans_lock.shared():
+            self._sync_returns()
+            months = [(m, path) for m, path in self.partitions.months().items() if m >= month]
+
+        def records():
+            for m, path in months:
+                for n, row in enumerate(self._returned_rows(path), 1):
+                    if m != month or n > int(skip):
+                        yield self._loan_from_row(row), f'{m}:{n}'
+        return self._page(records(), limit, where)
+
+    def return_loan(self, loan_id: str, when: Optional[datetime] = None) -> Optional[Loan]:
+        with self._books_lock.exclusive(), self._loans_lock.exclusive():
+            loan = super().return_loan(loan_id, when)
+            if loan is not None:
+                self._maybe_compact_active()
+            return loan
+
+    def _refresh_due_index(self) -> DueDateIndex:
+        with self._loans_lock.shared():
+            # The active partition is replaced when it is compacted
+            inode = os.stat(self.loans_file).st_ino
+            if inode != self._active_inode:
+                self._active_inode = inode
+                self._due_index = None
+            return super()._refresh_due_index()
+
+    def _maybe_compact_active(self) -> None:
+        # Caller holds the loans lock exclusively, just after a return
+        self._returns_until_check -= 1
+        if self._returns_until_check > 0 or os.path.getsize(self.loans_file) < self.active_max_bytes:
+            return
+        self._sync_returns()
+        with open(self.loans_file, 'r', newline='') as f:
+            reader = csv.reader(f)
+            next(reader)
+            rows = [row for row in reader if row]
+        open_rows = [row for row in rows if not row[5] and row[0] not in self._returns]
+        if 2 * len(open_rows) > len(rows):
+            # Half the rows cannot be returned loans before this many more returns
+            self._returns_until_check = (2 * len(open_rows) - len(rows) + 1) // 2
+            return
+        # The return dates of the loans leaving active.csv move to their
+        # months first, and returns.csv is emptied last, so a crash in
+        # between only leaves a return recorded twice
+        issued = {row[0]: row[3] for row in rows}
+        self.partitions.add_returns([issued[loan_id], loan_id, return_date]
+                                    for loan_id, return_date in self._returns.items()
+                                    if loan_id in issued)
+        with atomic_write(self.loans_file) as f:
+            writer = csv.writer(f)
+            writer.writerow(LOAN_FIELDS)
+            writer.writerows(open_rows)
+        # Returns of loans not in active.csv were left by an older layout;
+        # with no issue date to place them by, they stay
+        with atomic_write(self.returns_file) as f:
+            writer = csv.writer(f)
+            writer.writerow(RETURN_FIELDS)
+            writer.writerows([loan_id, return_date] for loan_id, return_date in self._returns.items()
+                             if loan_id not in issued)
+        self._sync_returns()
+        self._returns_until_check = len(open_rows) // 2
+
+    def archive(self, codec: str, before: Optional[str] = None) -> List[str]:
+        """Compress the partitions of months before ``before`` (default this month)."""
+        with self._loans_lock.exclusive():
+            return self.partitions.archive(codec, before or datetime.now().strftime('%Y-%m'))
+
+    def bulk_import(self, kind: str, rows: Iterable[Dict[str, str]],
+                    batch_size: int = IMPORT_BATCH_SIZE,
+                    hash_passwords: Optional[Callable[[List[str]], List[str]]] = None) -> ImportReport:
+        if kind != 'loans':
+            return super().bulk_import(kind, rows, batch_size, hash_passwords)
+        def write_batch(records, merges):
+            self._write_loan_rows([self._loan_row(loan) for loan in records], False)
+
+        # Batches are written straight through, as by Storage.bulk_import
+        with self._loans_lock.exclusive():
+            return run_import(kind, rows, set(), write_batch, batch_size)
+
+
+def migrate(data_dir: str, codec: Optional[str] = None) -> int:
+    """Split a directory's loans.csv into partitions; returns the loans moved.
+
+    The partitions are built in a temporary directory that is renamed into
+    place, then loans.csv is removed. Return dates from returns.csv are
+    written into the partitions and returns.csv is emptied.
+    """
+    if LoanPartitions.exists(data_dir):
+        raise ValueError(f'{data_dir} already has partitioned loans')
+    if os.path.exists(os.path.join(data_dir, BOOK_STORE_FILE)):
+        raise ValueError(f'{data_dir} keeps its books in {BOOK_STORE_FILE}; '
+                         'export them to books.csv first')
+    source = Storage(data_dir)
+    building = os.path.join(data_dir, f'{LOAN_PARTITIONS_DIR}.tmp')
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    count = 0
+    with source._loans_lock.exclusive():
+        source._sync_returns()
+        files: Dict[str, IO] = {}
+        writers = {}
+        try:
+            with open(source.loans_file, 'r', newline='') as f, \
+                    open(os.path.join(building, ACTIVE_FILE), 'w', newline='') as active_file:
+                active = csv.writer(active_file)
+                active.writerow(LOAN_FIELDS)
+                reader = csv.reader(f)
+                next(reader)
+                for row in reader:
+                    if not row:
+                        continue
+                    # Returns are written into the partitions
+                    row[5] = row[5] or source._returns.get(row[0], '')
+                    month = row[3][:7]
+                    writer = writers.get(month)
+                    if writer is None:
+                        files[month] = open(os.path.join(building, f'{month}.csv'), 'w', newline='')
+                        writer = writers[month] = csv.writer(files[month])
+                        writer.writerow(LOAN_FIELDS)
+                    writer.writerow(row)
+                    if not row[5]:
+                        active.writerow(row)
+                    count += 1
+        finally:
+            for month_file in files.values():
+                month_file.close()
+        os.rename(building, os.path.join(data_dir, LOAN_PARTITIONS_DIR))
+        os.remove(source.loans_file)
+        with atomic_write(source.returns_file) as f:
+            csv.writer(f).writerow(RETURN_FIELDS)
+    if codec:
+        PartitionedStorage(data_dir).archive(codec)
+    return count
+
+
+def export(data_dir: str) -> int:
+    """Write the partitions back to a single loans.csv and remove them."""
+    storage = PartitionedStorage(data_dir)
+    count = 0
+    with storage._loans_lock.exclusive():
+        storage._sync_returns()
+        with atomic_write(os.path.join(data_dir, 'loans.csv')) as f:
+            writer = csv.writer(f)
+            writer.writerow(LOAN_FIELDS)
+            for path in storage.partitions.months().values():
+                # Returns folded into the partitions would go with them
+                for row in storage._returned_rows(path):
+                    writer.writerow(row.values())
+                    count += 1
+        shutil.rmtree(storage.partitions.root)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a loan history between loans.csv '
+                                                 'and monthly partitions')
+    parser.add_argument('command', choices=['migrate', 'archive', 'export'],
+                        help='migrate: loans.csv -> loans/; archive: compress closed months; '
+                             'export: loans/ -> loans.csv')
+    parser.add_argument('data_dir', nargs='?', default='./data')
+    parser.add_argument('--codec', choices=sorted(CODECS),
+                        help='Compress the months before this one (required for archive)')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        count = migrate(args.data_dir, args.codec)
+        print(f'✔ Moved {count} loans into {os.path.join(args.data_dir, LOAN_PARTITIONS_DIR)}')
+        return
+
+    if not LoanPartitions.exists(args.data_dir):
+        parser.error(f'{args.data_dir} has no {LOAN_PARTITIONS_DIR}/; run migrate first')
+    if args.command == 'archive':
+        if not args.codec:
+            parser.error('archive needs --codec')
+        archived = PartitionedStorage(args.data_dir).archive(args.codec)
+        print(f'✔ Compressed {len(archived)} partitions')
+        return
+
+    count = export(args.data_dir)
+    print(f'✔ Exported {count} loans to {os.path.join(args.data_dir, "loans.csv")}')
+
+if __name__ == '__main__':
+    main()
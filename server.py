@@ -0,0 +1,316 @@
+"""Asyncio HTTP/JSON service exposing LibrarySystem operations.
+
+Endpoints (tokens come from POST /login and go in ``Authorization: Bearer``):
+
+    POST /login      {"role", "username", "password"} -> {"token"}
+    POST /logout
+    GET  /books      ?q=&limit=&offset=               -> {"books": [...]}
+    POST /borrow     {"isbn"}                (member)  -> {"loan"}
+    POST /issue      {"isbn", "member_id"}   (librarian)
+    POST /issue/batch {"isbns", "member_id", "all_or_nothing"} (librarian) -> {"outcomes": [...]}
+    POST /return     {"loan_id"}             (librarian) -> {"loan"}
+    GET  /loans                              (member)  -> {"loans": [...]}
+    POST /holds      {"isbn"}                (member)  -> {"hold", "position"}
+    POST /holds      {"isbn", "member_id", "priority"} (librarian) -> {"hold", "position"}
+    GET  /holds                              (member)  -> {"holds": [...]}
+    POST /holds/cancel {"hold_id"}           (member)  -> {"hold"}
+    GET  /overdue                            (librarian) -> {"overdue": [...]}
+    GET  /metrics                            (librarian) -> metrics, if enabled
+
+Storage and bcrypt calls block, so they run on a thread pool while the event
+loop keeps serving other connections.
+"""
+import asyncio
+import dataclasses
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+from models import LibraryError
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 64 * 1024
+
+# Idle keep-alive connections are closed after this many seconds
+KEEP_ALIVE_TIMEOUT = 15
+
+REASONS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden',
+           404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error', 501: 'Not Implemented'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def to_json(value):
+    """Convert models (and lists of them) to JSON-ready values."""
+    if dataclasses.is_dataclass(value):
+        return {f.name: to_json(getattr(value, f.name)) for f in dataclasses.fields(value)
+                if f.name != 'password_hash'}
+    if isinstance(value, (list, tuple)):
+        return [to_json(v) for v in value]
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    return value
+
+
+class LibraryServer:
+    """Serves one LibrarySystem to many HTTP clients.
+
+    At most ``max_concurrency`` requests are processed at once; further
+    requests wait for a slot. Blocking work runs on ``workers`` threads.
+    """
+
+    def __init__(self, library, host: str = '127.0.0.1', port: int = 8080,
+                 max_concurrency: int = 64, workers: Optional[int] = None):
+        self.library = library
+        self.host = host
+        self.port = port
+        self.max_concurrency = max_concurrency
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.routes = {
+            ('POST', '/login'): self.login,
+            ('POST', '/logout'): self.logout,
+            ('GET', '/books'): self.search,
+            ('POST', '/borrow'): self.borrow,
+            ('POST', '/issue'): self.issue,
+            ('POST', '/issue/batch'): self.issue_batch,
+            ('POST', '/return'): self.return_loan,
+            ('GET', '/loans'): self.my_loans,
+            ('POST', '/holds'): self.place_hold,
+            ('GET', '/holds'): self.my_holds,
+            ('POST', '/holds/cancel'): self.cancel_hold,
+            ('GET', '/overdue'): self.overdue,
+            ('GET', '/metrics'): self.metrics,
+        }
+
+    async def start(self) -> None:
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # Pick up the real port when started with port 0
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self.executor.shutdown(wait=False)
+        self.library.close()
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    # Connection handling
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except HTTPError as e:
+                    self._write_response(writer, e.status, {'error': str(e)}, False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, target, headers, body, keep_alive = request
+                async with self._slots:
+                    status, payload = await self._dispatch(method, target, headers, body)
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            return None
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        length = headers.get('content-length') or '0'
+        # isdigit alone also accepts digits like '²' that int() rejects
+        if not (length.isascii() and length.isdigit()):
+            raise HTTPError(400, 'Invalid Content-Length')
+        length = int(length)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, 'Request body too large')
+        body = await reader.readexactly(length) if length else b''
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+        return method, target, headers, body, keep_alive
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: int, payload: dict,
+                        keep_alive: bool) -> None:
+        body = json.dumps(payload).encode()
+        head = (f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\n'
+                f'Content-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+        writer.write(head.encode('latin-1') + body)
+
+    async def _dispatch(self, method: str, target: str, headers: Dict[str, str],
+                        body: bytes) -> Tuple[int, dict]:
+        url = urlsplit(target)
+        handler = self.routes.get((method, url.path))
+        if handler is None:
+            known_path = any(path == url.path for _, path in self.routes)
+            return (405, {'error': 'Method not allowed'}) if known_path else \
+                (404, {'error': 'Not found'})
+        try:
+            data = json.loads(body) if body else {}
+            if not isinstance(data, dict):
+                raise ValueError
+        except ValueError:
+            return 400, {'error': 'Body must be a JSON object'}
+
+        request = {
+            'query': {k: v[-1] for k, v in parse_qs(url.query).items()},
+            'data': data,
+            'token': headers.get('authorization', '').removeprefix('Bearer ').strip() or None,
+        }
+        try:
+            return 200, await handler(request)
+        except HTTPError as e:
+            return e.status, {'error': str(e)}
+        except LibraryError as e:
+            return 400, {'error': str(e)}
+        except (KeyError, ValueError) as e:
+            return 400, {'error': f'Invalid request: {e}'}
+        except Exception:
+            logger.exception('Error handling %s %s', method, url.path)
+            return 500, {'error': 'Internal server error'}
+
+    # Endpoints
+
+    def _require(self, request: dict, role: str) -> Dict[str, str]:
+        token = request['token']
+        user = self.library.auth.get_current_user(token) if token else None
+        if user is None:
+            raise HTTPError(401, 'Login required')
+        if user['role'] != role:
+            raise HTTPError(403, f'Only a {role} may do this')
+        return user
+
+    async def login(self, request: dict) -> dict:
+        data = request['data']
+        token = await self._run(self.library.auth.authenticate,
+                                data['role'], data['username'], data['password'])
+        if token is None:
+            raise HTTPError(401, 'Invalid credentials')
+        return {'token': token}
+
+    async def logout(self, request: dict) -> dict:
+        if request['token']:
+            self.library.auth.logout(request['token'])
+        return {}
+
+    async def search(self, request: dict) -> dict:
+        query = request['query']
+        limit = int(query.get('limit', 20))
+        offset = int(query.get('offset', 0))
+        books = await self._run(self.library.catalogue.search, query.get('q', ''), limit, offset)
+        return {'books': to_json(books)}
+
+    async def borrow(self, request: dict) -> dict:
+        user = self._require(request, 'member')
+        loan = await self._run(self.library.lend_book, user['user_id'],
+                               request['data']['isbn'], False)
+        return {'loan': to_json(loan)}
+
+    async def issue(self, request: dict) -> dict:
+        self._require(request, 'librarian')
+        data = request['data']
+        loan = await self._run(self.library.lend_book, data['member_id'], data['isbn'])
+        return {'loan': to_json(loan)}
+
+    async def issue_batch(self, request: dict) -> dict:
+        self._require(request, 'librarian')
+        data = request['data']
+        outcomes = await self._run(self.library.lend_books, data['member_id'], data['isbns'],
+                                   bool(data.get('all_or_nothing')))
+        return {'outcomes': to_json(outcomes)}
+
+    async def return_loan(self, request: dict) -> dict:
+        self._require(request, 'librarian')
+        loan = await self._run(self.library.receive_return, request['data']['loan_id'])
+        return {'loan': to_json(loan)}
+
+    async def my_loans(self, request: dict) -> dict:
+        user = self._require(request, 'member')
+        loans = await self._run(self.library.storage.get_member_loans, user['user_id'])
+        return {'loans': to_json(loans)}
+
+    async def place_hold(self, request: dict) -> dict:
+        data = request['data']
+        if 'member_id' in data or 'priority' in data:
+            # Librarians queue holds for members, ahead of others if given a priority
+            self._require(request, 'librarian')
+            hold = await self._run(self.library.place_hold, data['member_id'], data['isbn'],
+                                   int(data.get('priority', 0)))
+        else:
+            user = self._require(request, 'member')
+            hold = await self._run(self.library.place_hold, user['user_id'], data['isbn'], 0, False)
+        position = await self._run(self.library.holds.position, hold.hold_id)
+        return {'hold': to_json(hold), 'position': position}
+
+    async def my_holds(self, request: dict) -> dict:
+        user = self._require(request, 'member')
+        holds = await self._run(self.library.member_holds, user['user_id'])
+        return {'holds': [dict(to_json(hold), position=position) for hold, position in holds]}
+
+    async def cancel_hold(self, request: dict) -> dict:
+        user = self._require(request, 'member')
+        hold = await self._run(self.library.cancel_hold, user['user_id'],
+                               request['data']['hold_id'])
+        return {'hold': to_json(hold)}
+
+    async def overdue(self, request: dict) -> dict:
+        self._require(request, 'librarian')
+        report = await self._run(self.library.storage.get_overdue_report)
+        return {'overdue': to_json(report)}
+
+    async def metrics(self, request: dict) -> dict:
+        self._require(request, 'librarian')
+        if self.library.metrics is None:
+            raise HTTPError(404, 'Metrics are not enabled (start with --metrics)')
+        return self.library.metrics.to_dict()
+
+
+def serve(library, host: str, port: int, max_concurrency: int, workers: Optional[int]) -> None:
+    server = LibraryServer(library, host, port, max_concurrency, workers)
+    print(f'Serving on http://{host}:{port} (Ctrl+C to stop)')
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print('Goodbye!')
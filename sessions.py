@@ -0,0 +1,69 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+# Idle sessions expire after this many seconds
+SESSION_TTL = 30 * 60
+
+MAX_SESSIONS = 10_000
+
+
+class SessionStore:
+    """Logged-in sessions keyed by opaque random tokens.
+
+    Sessions are kept in least-recently-used order. Each lookup refreshes a
+    session's expiry and moves it to the back, so the front always holds the
+    session that will expire first; expired sessions are dropped from the
+    front as new ones are created. When ``max_sessions`` is reached the least
+    recently used session is evicted. Every operation is O(1).
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = MAX_SESSIONS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._clock = clock
+        self._sessions: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self, role: str, user_id: str) -> str:
+        """Start a session and return its token."""
+        token = secrets.token_urlsafe(32)
+        now = self._clock()
+        with self._lock:
+            self._purge(now)
+            while len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+            self._sessions[token] = (role, user_id, now + self.ttl)
+        return token
+
+    def get(self, token: str) -> Optional[Dict[str, str]]:
+        """Return the session for ``token`` and extend it, or None."""
+        now = self._clock()
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+            role, user_id, expires = session
+            if expires <= now:
+                del self._sessions[token]
+                return None
+            self._sessions[token] = (role, user_id, now + self.ttl)
+            self._sessions.move_to_end(token)
+        return {'role': role, 'user_id': user_id}
+
+    def revoke(self, token: str) -> None:
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def _purge(self, now: float) -> None:
+        while self._sessions:
+            token, (_, _, expires) = next(iter(self._sessions.items()))
+            if expires > now:
+                break
+            del self._sessions[token]
@@ -1,133 +1,1141 @@
-import csv
-import os
-from datetime import datetime
-from typing import List, Optional
-from models import Book, Member, Loan
-
-class Storage:
-    def __init__(self, data_dir: str = './data'):
-        self.data_dir = data_dir
-        os.makedirs(data_dir, exist_ok=True)
-        self.books_file = os.path.join(data_dir, 'books.csv')
-        self.members_file = os.path.join(data_dir, 'members.csv')
-        self.loans_file = os.path.join(data_dir, 'loans.csv')
-        self._initialize_files()
-
-    def _initialize_files(self):
-        # Initialize books.csv
-        if not os.path.exists(self.books_file):
-            with open(self.books_file, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['ISBN', 'Title', 'Author', 'CopiesTotal', 'CopiesAvailable'])
-
-        # Initialize members.csv
-        if not os.path.exists(self.members_file):
-            with open(self.members_file, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['MemberID', 'Name', 'PasswordHash', 'Email', 'JoinDate'])
-
-        # Initialize loans.csv
-        if not os.path.exists(self.loans_file):
-            with open(self.loans_file, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['LoanID', 'MemberID', 'ISBN', 'IssueDate', 'DueDate', 'ReturnDate'])
-
-    def get_all_books(self) -> List[Book]:
-        books = []
-        with open(self.books_file, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                books.append(Book(
-                    isbn=row['ISBN'],
-                    title=row['Title'],
-                    author=row['Author'],
-                    copies_total=int(row['CopiesTotal']),
-                    copies_available=int(row['CopiesAvailable'])
-                ))
-        return books
-
-    def add_book(self, book: Book) -> None:
-        books = self.get_all_books()
-        books.append(book)
-        self._save_books(books)
-
-    def _save_books(self, books: List[Book]) -> None:
-        with open(self.books_file, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['ISBN', 'Title', 'Author', 'CopiesTotal', 'CopiesAvailable'])
-            for book in books:
-                writer.writerow([book.isbn, book.title, book.author, book.copies_total, book.copies_available])
-
-    def get_member_by_id(self, member_id: str) -> Optional[Member]:
-        with open(self.members_file, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row['MemberID'] == member_id:
-                    return Member(
-                        member_id=row['MemberID'],
-                        name=row['Name'],
-                        password_hash=row['PasswordHash'],
-                        email=row['Email'],
-                        join_date=datetime.strptime(row['JoinDate'], '%Y-%m-%d')
-                    )
-        return None
-
-    def add_member(self, member: Member) -> None:
-        with open(self.members_file, 'a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                member.member_id,
-                member.name,
-                member.password_hash,
-                member.email,
-                member.join_date.strftime('%Y-%m-%d')
-            ])
-
-    def add_loan(self, loan: Loan) -> None:
-        with open(self.loans_file, 'a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                loan.loan_id,
-                loan.member_id,
-                loan.isbn,
-                loan.issue_date.strftime('%Y-%m-%d'),
-                loan.due_date.strftime('%Y-%m-%d'),
-                loan.return_date.strftime('%Y-%m-%d') if loan.return_date else ''
-            ])
-
-    def get_member_loans(self, member_id: str) -> List[Loan]:
-        loans = []
-        with open(self.loans_file, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row['MemberID'] == member_id:
-                    return_date = None
-                    if row['ReturnDate']:
-                        return_date = datetime.strptime(row['ReturnDate'], '%Y-%m-%d')
-                    loans.append(Loan(
-                        loan_id=row['LoanID'],
-                        member_id=row['MemberID'],
-                        isbn=row['ISBN'],
-                        issue_date=datetime.strptime(row['IssueDate'], '%Y-%m-%d'),
-                        due_date=datetime.strptime(row['DueDate'], '%Y-%m-%d'),
-                        return_date=return_date
-                    ))
-        return loans
-
-    def get_overdue_loans(self) -> List[Loan]:
-        today = datetime.now()
-        overdue_loans = []
-        with open(self.loans_file, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if not row['ReturnDate']:
-                    due_date = datetime.strptime(row['DueDate'], '%Y-%m-%d')
-                    if due_date < today:
-                        overdue_loans.append(Loan(
-                            loan_id=row['LoanID'],
-                            member_id=row['MemberID'],
-                            isbn=row['ISBN'],
-                            issue_date=datetime.strptime(row['IssueDate'], '%Y-%m-%d'),
-                            due_date=due_date
-                        ))
-        return overdue_loans
\ No newline at end of file
+import copy
+import csv
+import functools
+import itertools
+import os
+import sys
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from models import Book, CompactLoan, Member, Loan, OverdueEntry, Page
+from journal import BookJournal
+from indexes import DueDateIndex
+from importer import IMPORT_BATCH_SIZE, KINDS, ImportReport, run_import
+from locking import FileLock, atomic_write, read_appended_lines
+from groupcommit import FLUSH_MS, FLUSH_RECORDS, AppendBuffer, append_rows
+from loantable import LoanTable
+
+# Fold the book journal back into books.csv once it grows past this size
+JOURNAL_MAX_BYTES = 1 << 20
+
+BOOK_FIELDS = ['ISBN', 'Title', 'Author', 'CopiesTotal', 'CopiesAvailable']
+MEMBER_FIELDS = ['MemberID', 'Name', 'PasswordHash', 'Email', 'JoinDate']
+LOAN_FIELDS = ['LoanID', 'MemberID', 'ISBN', 'IssueDate', 'DueDate', 'ReturnDate']
+RETURN_FIELDS = ['LoanID', 'ReturnDate']
+
+# A data directory holding this file keeps its catalogue in a binary book
+# store (see bookstore.py) rather than books.csv
+BOOK_STORE_FILE = 'books.dat'
+
+# A data directory holding this directory keeps its loan history in monthly
+# partitions (see partitions.py) rather than loans.csv
+LOAN_PARTITIONS_DIR = 'loans'
+
+# Loan representations for CachedStorage(compact=...): CompactLoan objects,
+# or a columnar LoanTable
+COMPACT_MODES = ('slots', 'columnar')
+
+# Seeded into a new librarians.csv. The hash of the default password
+# (LibAdmin@2024) is precomputed so that no process pays for it at startup.
+DEFAULT_LIBRARIAN = ('admin', '$2b$12$QbalBIk//GwP108WnVhvTOMLM0VgmpwHS98FW3hdXrSlplB8mX5P6')
+
+@functools.lru_cache(maxsize=None)
+def _day_number(text: str) -> int:
+    """The day ordinal of a ``YYYY-MM-DD`` date.
+
+    Cached so that loans on the same day share one int object; there are
+    only a few thousand distinct dates in a loan history.
+    """
+    return date.fromisoformat(text).toordinal()
+
+def _take_copies(books: Dict[str, Book], isbns: List[str], all_or_nothing: bool) -> List[bool]:
+    """Take one copy per entry of ``isbns`` from ``books`` in memory.
+
+    Returns whether each copy was taken; with ``all_or_nothing`` the counts
+    are put back unless every copy was.
+    """
+    taken = []
+    for isbn in isbns:
+        book = books.get(isbn)
+        ok = book is not None and book.copies_available > 0
+        if ok:
+            book.copies_available -= 1
+        taken.append(ok)
+    if all_or_nothing and not all(taken):
+        for isbn, ok in zip(isbns, taken):
+            if ok:
+                books[isbn].copies_available += 1
+        taken = [False] * len(isbns)
+    return taken
+
+class Storage:
+    def __init__(self, data_dir: str = './data', journal: bool = False,
+                 journal_max_bytes: int = JOURNAL_MAX_BYTES):
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+        self.books_file = os.path.join(data_dir, 'books.csv')
+        self.members_file = os.path.join(data_dir, 'members.csv')
+        self.loans_file = os.path.join(data_dir, 'loans.csv')
+        # Return dates of loans recorded as open in loans.csv, so that a
+        # return appends a row instead of rewriting the loan history
+        self.returns_file = os.path.join(data_dir, 'returns.csv')
+        self.librarians_file = os.path.join(data_dir, 'librarians.csv')
+        # The journal is always replayed on read so that a data directory
+        # written in journaled mode reads correctly without it
+        self.journal = BookJournal(os.path.join(data_dir, 'books.journal'))
+        self.use_journal = journal
+        self.journal_max_bytes = journal_max_bytes
+        # Called with each book passed to add_book, e.g. to update a search index
+        self.book_listeners: List[Callable[[Book], None]] = []
+        # Open loans by due date, built on first use (see _refresh_due_index)
+        self._due_index: Optional[DueDateIndex] = None
+        self._due_index_offset = 0
+        # Loan ID -> return date from returns.csv, read incrementally
+        self._returns: Dict[str, str] = {}
+        self._returns_offset = 0
+        self._returns_inode = None
+        # Advisory locks shared with other processes using this directory.
+        # Reads hold them shared, writes exclusive; when a write needs more
+        # than one, they are taken in the order books, members, loans.
+        self._books_lock = FileLock(os.path.join(data_dir, '.books.lock'))
+        self._members_lock = FileLock(os.path.join(data_dir, '.members.lock'))
+        self._loans_lock = FileLock(os.path.join(data_dir, '.loans.lock'))
+        self._initialize_files()
+        # New members and loans; written at once unless buffer_appends is called
+        self._members_buffer = AppendBuffer(self._members_lock,
+                                            functools.partial(append_rows, self.members_file))
+        self._loans_buffer = AppendBuffer(self._loans_lock, self._write_loan_rows)
+
+    def _initialize_files(self):
+        # Initialize books.csv
+        if not os.path.exists(self.books_file):
+            with open(self.books_file, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(BOOK_FIELDS)
+
+        # Initialize members.csv
+        if not os.path.exists(self.members_file):
+            with open(self.members_file, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(MEMBER_FIELDS)
+
+        # Initialize loans.csv
+        if not os.path.exists(self.loans_file):
+            with open(self.loans_file, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(LOAN_FIELDS)
+
+        # Initialize returns.csv
+        if not os.path.exists(self.returns_file):
+            with open(self.returns_file, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(RETURN_FIELDS)
+
+        # Initialize librarians.csv
+        if not os.path.exists(self.librarians_file):
+            with open(self.librarians_file, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['Username', 'PasswordHash'])
+                writer.writerow(DEFAULT_LIBRARIAN)
+
+    @staticmethod
+    def _book_from_row(row: Dict[str, str]) -> Book:
+        return Book(
+            isbn=row['ISBN'],
+            title=row['Title'],
+            # Authors, member IDs and ISBNs repeat across rows; interning
+            # them keeps one copy of each in memory
+            author=sys.intern(row['Author']),
+            copies_total=int(row['CopiesTotal']),
+            copies_available=int(row['CopiesAvailable'])
+        )
+
+    @staticmethod
+    def _member_from_row(row: Dict[str, str]) -> Member:
+        return Member(
+            member_id=row['MemberID'],
+            name=row['Name'],
+            password_hash=row['PasswordHash'],
+            email=row['Email'],
+            join_date=datetime.strptime(row['JoinDate'], '%Y-%m-%d')
+        )
+
+    @staticmethod
+    def _loan_from_row(row: Dict[str, str]) -> Loan:
+        return_date = None
+        if row['ReturnDate']:
+            return_date = datetime.strptime(row['ReturnDate'], '%Y-%m-%d')
+        return Loan(
+            loan_id=row['LoanID'],
+            member_id=sys.intern(row['MemberID']),
+            isbn=sys.intern(row['ISBN']),
+            issue_date=datetime.strptime(row['IssueDate'], '%Y-%m-%d'),
+            due_date=datetime.strptime(row['DueDate'], '%Y-%m-%d'),
+            return_date=return_date
+        )
+
+    @staticmethod
+    def _compact_loan_from_row(row: Dict[str, str]) -> CompactLoan:
+        return CompactLoan(
+            row['LoanID'],
+            sys.intern(row['MemberID']),
+            sys.intern(row['ISBN']),
+            _day_number(row['IssueDate']),
+            _day_number(row['DueDate']),
+            _day_number(row['ReturnDate']) if row['ReturnDate'] else 0
+        )
+
+    @staticmethod
+    def _book_row(book: Book) -> list:
+        return [book.isbn, book.title, book.author, book.copies_total, book.copies_available]
+
+    @staticmethod
+    def _member_row(member: Member) -> list:
+        return [
+            member.member_id,
+            member.name,
+            member.password_hash,
+            member.email,
+            member.join_date.strftime('%Y-%m-%d')
+        ]
+
+    @staticmethod
+    def _loan_row(loan: Loan) -> list:
+        return [
+            loan.loan_id,
+            loan.member_id,
+            loan.isbn,
+            loan.issue_date.strftime('%Y-%m-%d'),
+            loan.due_date.strftime('%Y-%m-%d'),
+            loan.return_date.strftime('%Y-%m-%d') if loan.return_date else ''
+        ]
+
+    def get_all_books(self) -> List[Book]:
+        books = []
+        with self._books_lock.shared():
+            with open(self.books_file, 'r') as f:
+                reader = csv.DictReader(f)
+                for row in reader:
+                    books.append(self._book_from_row(row))
+            return self.journal.replay(books)
+
+    def get_book_by_isbn(self, isbn: str) -> Optional[Book]:
+        books = []
+        with self._books_lock.shared():
+            with open(self.books_file, 'r') as f:
+                reader = csv.DictReader(f)
+                for row in reader:
+                    if row['ISBN'] == isbn:
+                        books.append(self._book_from_row(row))
+                        break
+            books = self.journal.replay(books, isbn)
+        return books[0] if books else None
+
+    def get_books_by_isbns(self, isbns: Iterable[str]) -> Dict[str, Book]:
+        wanted = set(isbns)
+        found: Dict[str, Book] = {}
+        for book in self.get_all_books():
+            if book.isbn in wanted:
+                found.setdefault(book.isbn, book)
+        return found
+
+    def add_book(self, book: Book) -> None:
+        with self._books_lock.exclusive():
+            if self.use_journal:
+                self.journal.append_book(book)
+                self._maybe_compact()
+            else:
+                books = self.get_all_books()
+                books.append(book)
+                self._save_books(books)
+        self._notify_book_added(book)
+
+    def _notify_book_added(self, book: Book) -> None:
+        for listener in self.book_listeners:
+            listener(book)
+
+    def adjust_availability(self, isbn: str, delta: int) -> bool:
+        """Change a book's available copies by ``delta``.
+
+        Returns False, writing nothing, if the book does not exist or the
+        change would take the count outside 0..copies_total. The check and
+        the write happen under the exclusive books lock, so concurrent
+        checkouts from several processes cannot hand out the same copy.
+        """
+        with self._books_lock.exclusive():
+            if self.use_journal:
+                book = self.get_book_by_isbn(isbn)
+                if not book or not 0 <= book.copies_available + delta <= book.copies_total:
+                    return False
+                self.journal.append_delta(isbn, delta)
+                self._maybe_compact()
+                return True
+
+            books = self.get_all_books()
+            book = next((b for b in books if b.isbn == isbn), None)
+            if not book or not 0 <= book.copies_available + delta <= book.copies_total:
+                return False
+            book.copies_available += delta
+            self._save_books(books)
+            return True
+
+    def checkout(self, loan: Loan) -> bool:
+        """Take one available copy of ``loan.isbn`` and record the loan.
+
+        Returns False, recording nothing, if no copy is available.
+        """
+        with self._books_lock.exclusive(), self._loans_lock.exclusive():
+            if not self.adjust_availability(loan.isbn, -1):
+                return False
+            self.add_loan(loan)
+            # Not buffered: other processes must see the copy and the loan together
+            self._loans_buffer.write_locked()
+            return True
+
+    def take_copies(self, isbns: List[str], all_or_nothing: bool = False) -> List[bool]:
+        """Take one available copy for each entry of ``isbns``.
+
+        An ISBN listed twice takes two copies. Returns whether each copy was
+        taken. The catalogue is read and written once for the whole list;
+        with ``all_or_nothing`` nothing is written unless every copy can be
+        taken.
+        """
+        with self._books_lock.exclusive():
+            if self.use_journal:
+                books = self.get_books_by_isbns(isbns)
+            else:
+                all_books = self.get_all_books()
+                books = {}
+                for book in all_books:
+                    books.setdefault(book.isbn, book)
+            taken = _take_copies(books, isbns, all_or_nothing)
+            if any(taken):
+                if self.use_journal:
+                    self.journal.append_deltas(Counter(i for i, ok in zip(isbns, taken) if ok), -1)
+                    self._maybe_compact()
+                else:
+                    self._save_books(all_books)
+            return taken
+
+    def checkout_many(self, loans: List[Loan], all_or_nothing: bool = False) -> List[bool]:
+        """Take a copy for each loan and record the loans that got one.
+
+        Like ``checkout`` for a stack of books, with one catalogue write and
+        one append to loans.csv however many loans there are. Returns
+        whether each loan was recorded.
+        """
+        with self._books_lock.exclusive(), self._loans_lock.exclusive():
+            taken = self.take_copies([loan.isbn for loan in loans], all_or_nothing)
+            lent = [loan for loan, ok in zip(loans, taken) if ok]
+            if lent:
+                self.add_loans(lent)
+                self._loans_buffer.write_locked()
+            return taken
+
+    def _save_books(self, books: List[Book]) -> None:
+        with self._books_lock.exclusive():
+            with atomic_write(self.books_file) as f:
+                writer = csv.writer(f)
+                writer.writerow(BOOK_FIELDS)
+                for book in books:
+                    writer.writerow(self._book_row(book))
+            # books now holds everything the journal recorded
+            self.journal.clear()
+
+    def compact(self) -> None:
+        """Fold the book journal into books.csv."""
+        with self._books_lock.exclusive():
+            self._save_books(self.get_all_books())
+
+    def _maybe_compact(self) -> None:
+        if self.journal.size() >= self.journal_max_bytes:
+            self.compact()
+
+    def bulk_import(self, kind: str, rows: Iterable[Dict[str, str]],
+                    batch_size: int = IMPORT_BATCH_SIZE,
+                    hash_passwords: Optional[Callable[[List[str]], List[str]]] = None) -> ImportReport:
+        """Stream ``rows`` into the books, members or loans file.
+
+        New records are appended one batch at a time through a single open
+        file handle. Copies for ISBNs that were already in the catalogue are
+        merged in one streaming pass over books.csv at the end. See
+        ``importer.run_import`` for validation and deduplication.
+        """
+        if kind not in KINDS:
+            raise ValueError(f'Unknown import kind: {kind}')
+        path, lock, key_field, to_row = {
+            'books': (self.books_file, self._books_lock, 'ISBN', self._book_row),
+            'members': (self.members_file, self._members_lock, 'MemberID', self._member_row),
+            'loans': (self.loans_file, self._loans_lock, None, self._loan_row),
+        }[kind]
+
+        with lock.exclusive():
+            if kind == 'books' and self.journal.size():
+                self.compact()
+            keys = set()
+            if key_field:
+                with open(path, 'r', newline='') as f:
+                    keys = {row[key_field] for row in csv.DictReader(f)}
+
+            merges: Dict[str, List[int]] = {}
+            with open(path, 'a', newline='') as f:
+                writer = csv.writer(f)
+
+                def write_batch(records, batch_merges):
+                    writer.writerows(to_row(r) for r in records)
+                    for isbn, (total, available) in batch_merges.items():
+                        merged = merges.setdefault(isbn, [0, 0])
+                        merged[0] += total
+                        merged[1] += available
+                    if kind == 'books':
+                        for book in records:
+                            self._notify_book_added(book)
+
+                report = run_import(kind, rows, keys, write_batch, batch_size, hash_passwords)
+
+            if merges:
+                self._merge_copies(merges)
+        return report
+
+    def _merge_copies(self, merges: Dict[str, List[int]]) -> None:
+        with open(self.books_file, 'r', newline='') as src, \
+                atomic_write(self.books_file) as dst:
+            reader = csv.reader(src)
+            writer = csv.writer(dst)
+            writer.writerow(next(reader))
+            for row in reader:
+                extra = merges.pop(row[0], None)
+                if extra:
+                    row[3] = int(row[3]) + extra[0]
+                    row[4] = int(row[4]) + extra[1]
+                writer.writerow(row)
+
+    def get_all_members(self) -> List[Member]:
+        with self._members_lock.shared(), open(self.members_file, 'r') as f:
+            return [self._member_from_row(row) for row in csv.DictReader(f)]
+
+    def get_member_by_id(self, member_id: str) -> Optional[Member]:
+        with self._members_lock.shared(), open(self.members_file, 'r') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                if row['MemberID'] == member_id:
+                    return self._member_from_row(row)
+        return None
+
+    def get_members_by_ids(self, member_ids: Iterable[str]) -> Dict[str, Member]:
+        """Resolve any number of members with a single pass over members.csv."""
+        wanted = set(member_ids)
+        found: Dict[str, Member] = {}
+        with self._members_lock.shared(), open(self.members_file, 'r') as f:
+            for row in csv.DictReader(f):
+                if row['MemberID'] in wanted and row['MemberID'] not in found:
+                    found[row['MemberID']] = self._member_from_row(row)
+                    if len(found) == len(wanted):
+                        break
+        return found
+
+    def add_member(self, member: Member) -> None:
+        self._members_buffer.append([self._member_row(member)])
+
+    def add_members(self, members: List[Member]) -> None:
+        """Append several members with a single write."""
+        self._members_buffer.append([self._member_row(m) for m in members])
+
+    def get_librarian_hash(self, username: str) -> Optional[str]:
+        with open(self.librarians_file, 'r') as f:
+            for row in csv.DictReader(f):
+                if row['Username'] == username:
+                    return row['PasswordHash']
+        return None
+
+    def add_librarian(self, username: str, password_hash: str) -> None:
+        with open(self.librarians_file, 'a', newline='') as f:
+            csv.writer(f).writerow([username, password_hash])
+
+    def add_loan(self, loan: Loan) -> None:
+        self._loans_buffer.append([self._loan_row(loan)])
+
+    def add_loans(self, loans: List[Loan]) -> None:
+        """Append several loans with a single write."""
+        self._loans_buffer.append([self._loan_row(loan) for loan in loans])
+
+    def _write_loan_rows(self, rows: List[list], sync: bool) -> None:
+        # Called by the loans buffer with the loans lock held
+        append_rows(self.loans_file, rows, sync)
+
+    def buffer_appends(self, max_records: int = FLUSH_RECORDS, max_ms: Optional[float] = FLUSH_MS,
+                       durability: str = 'batch') -> None:
+        """Group new members and loans into batches before writing them.
+
+        A batch is written once ``max_records`` rows are waiting or the
+        oldest has waited ``max_ms`` milliseconds, and before any read of
+        the same file in this process. ``durability`` is ``'none'`` (no
+        fsync), ``'batch'`` (one fsync per batch) or ``'record'`` (every
+        add is written and fsynced before it returns). Only plain adds are
+        buffered: checkouts write their loans with the copies they take.
+        Call ``flush`` before exiting; see groupcommit.py.
+        """
+        for buffer in (self._members_buffer, self._loans_buffer):
+            buffer.configure(max_records, max_ms, durability)
+
+    def flush(self) -> None:
+        """Write out any buffered members and loans."""
+        self._members_buffer.flush()
+        self._loans_buffer.flush()
+
+    def get_all_loans(self) -> List[Loan]:
+        with self._loans_lock.shared(), open(self.loans_file, 'r') as f:
+            self._sync_returns()
+            return [self._loan_from_row(self._with_return(row)) for row in csv.DictReader(f)]
+
+    def get_member_loans(self, member_id: str) -> List[Loan]:
+        loans = []
+        with self._loans_lock.shared(), open(self.loans_file, 'r') as f:
+            self._sync_returns()
+            reader = csv.DictReader(f)
+            for row in reader:
+                if row['MemberID'] == member_id:
+                    loans.append(self._loan_from_row(self._with_return(row)))
+        return loans
+
+    def get_loans_issued(self, start: datetime, end: datetime) -> List[Loan]:
+        """Loans issued from ``start`` up to but not including ``end``."""
+        return list(self.iter_loans(lambda l: start <= l.issue_date < end))
+
+    def get_loan_by_id(self, loan_id: str) -> Optional[Loan]:
+        """Find a loan; open loans come from the due-date index, others need a scan."""
+        loan = self._refresh_due_index().get(loan_id)
+        if loan is not None:
+            return loan
+        return next(self.iter_loans(lambda l: l.loan_id == loan_id), None)
+
+    def return_loan(self, loan_id: str, when: Optional[datetime] = None) -> Optional[Loan]:
+        """Close an open loan and give its copy back.
+
+        The loan is found through the open-loan index and its return date is
+        appended to returns.csv, so neither loans.csv nor the index is
+        rebuilt and a return costs the same however long the history is.
+        Availability and the return are written under the exclusive books
+        and loans locks, so other processes see both or neither. Returns the
+        closed loan, or None if no open loan has this ID.
+        """
+        with self._books_lock.exclusive(), self._loans_lock.exclusive():
+            loan = self._refresh_due_index().get(loan_id)
+            if loan is None:
+                return None
+            loan.return_date = when or datetime.now()
+            # The copy goes back first: repeating a half-done return cannot
+            # push availability past copies_total
+            self.adjust_availability(loan.isbn, 1)
+            with open(self.returns_file, 'a', newline='') as f:
+                csv.writer(f).writerow([loan_id, loan.return_date.strftime('%Y-%m-%d')])
+            self._sync_returns()
+        return loan
+
+    def _appended_returns(self) -> List[List[str]]:
+        """Rows appended to returns.csv since the last call; the caller holds the loans lock."""
+        st = os.stat(self.returns_file)
+        if st.st_ino != self._returns_inode or st.st_size < self._returns_offset:
+            # First read, or rewritten by PartitionedStorage
+            self._returns_inode = st.st_ino
+            self._returns_offset = 0
+            self._returns.clear()
+        first = self._returns_offset == 0
+        lines, self._returns_offset = read_appended_lines(self.returns_file, self._returns_offset)
+        return [row for row in csv.reader(lines[1:] if first else lines) if row]
+
+    def _sync_returns(self) -> None:
+        # Caller holds the loans lock
+        for loan_id, return_date in self._appended_returns():
+            self._returns[loan_id] = return_date
+            if self._due_index is not None:
+                self._due_index.discard(loan_id)
+
+    def _with_return(self, row: Dict[str, str]) -> Dict[str, str]:
+        if not row['ReturnDate']:
+            row['ReturnDate'] = self._returns.get(row['LoanID'], '')
+        return row
+
+    def _refresh_due_index(self) -> DueDateIndex:
+        """Bring the due-date index up to date with loans.csv.
+
+        loans.csv is only ever appended to, so the index is built on first use
+        and later calls parse just the rows appended since, including rows
+        written by other processes.
+        """
+        with self._loans_lock.shared():
+            if self._due_index is None or os.path.getsize(self.loans_file) < self._due_index_offset:
+                self._due_index = DueDateIndex()
+                self._due_index_offset = 0
+            first = self._due_index_offset == 0
+            lines, self._due_index_offset = read_appended_lines(self.loans_file, self._due_index_offset)
+            # Read with the loans so that no return precedes its loan
+            self._sync_returns()
+        for row in csv.reader(lines[1:] if first else lines):
+            # Only open loans are indexed, so returned ones are not parsed
+            if row and not row[5] and row[0] not in self._returns:
+                self._due_index.add(self._loan_from_row(dict(zip(LOAN_FIELDS, row))))
+        return self._due_index
+
+    def get_overdue_loans(self, as_of: Optional[datetime] = None) -> List[Loan]:
+        """Open loans due before ``as_of`` (default now), earliest first."""
+        return self._refresh_due_index().due_before(as_of or datetime.now())
+
+    def get_loans_due_soon(self, days: int, as_of: Optional[datetime] = None) -> List[Loan]:
+        """Open loans falling due within ``days`` of ``as_of`` (default now)."""
+        start = as_of or datetime.now()
+        return self._refresh_due_index().due_between(start, start + timedelta(days=days))
+
+    def get_overdue_report(self, as_of: Optional[datetime] = None) -> List[OverdueEntry]:
+        """Overdue loans joined with their member and book.
+
+        Members and books are resolved in bulk, so each file is read at most
+        once however many loans are overdue.
+        """
+        loans = self.get_overdue_loans(as_of)
+        if not loans:
+            return []
+        members = self.get_members_by_ids(l.member_id for l in loans)
+        books = self.get_books_by_isbns(l.isbn for l in loans)
+        return [OverdueEntry(loan, members.get(loan.member_id), books.get(loan.isbn))
+                for loan in loans]
+
+    # Streaming and paginated reads. ``where`` filters records; pages hold
+    # up to ``limit`` matching records.
+
+    def _scan(self, path: str, lock: FileLock, fields: List[str],
+              offset: int = 0) -> Iterator[Tuple[Dict[str, str], int]]:
+        """Yield each row of an append-only CSV file with the offset just past it.
+
+        Only rows present when the scan starts are read. The lock is held
+        just while the file is opened, so slow consumers do not block writers.
+        """
+        with lock.shared():
+            f = open(path, 'rb')
+            end = os.fstat(f.fileno()).st_size
+        with f:
+            if offset:
+                f.seek(offset)
+            else:
+                f.readline()
+            pos = f.tell()
+
+            def lines():
+                nonlocal pos
+                for line in f:
+                    if pos + len(line) > end:
+                        return
+                    pos += len(line)
+                    yield line.decode()
+
+            for row in csv.reader(lines()):
+                if row:
+                    yield dict(zip(fields, row)), pos
+
+    @staticmethod
+    def _page(records: Iterable[Tuple[object, object]], limit: int,
+              where: Optional[Callable]) -> Page:
+        # records yields (record, cursor just past it)
+        items = []
+        for record, cursor in records:
+            if where is None or where(record):
+                items.append(record)
+                if len(items) == limit:
+                    return Page(items, str(cursor))
+        return Page(items, None)
+
+    def iter_books(self, where: Optional[Callable[[Book], bool]] = None) -> Iterator[Book]:
+        """Stream the catalogue in file order without building a list."""
+        with self._books_lock.shared():
+            # books.csv is replaced by rename, so this handle stays consistent
+            # with the journal read alongside it
+            f = open(self.books_file, 'r', newline='')
+            books = self.journal.stream(self._book_from_row(row) for row in csv.DictReader(f))
+            # Starting the stream reads the journal
+            first = next(books, None)
+        with f:
+            if first is None:
+                return
+            for book in itertools.chain([first], books):
+                if where is None or where(book):
+                    yield book
+
+    def page_books(self, limit: int, cursor: Optional[str] = None,
+                   where: Optional[Callable[[Book], bool]] = None) -> Page:
+        """A page of books in catalogue order.
+
+        The cursor is ``offset:isbn``, where the row of the last book returned
+        starts in books.csv, or ``+inode:n`` once n books added through the
+        journal have been returned. A page seeks straight to its cursor. If
+        books.csv was rewritten since and the ISBN is no longer at that
+        offset, the book is looked up from the top instead. A cursor that no
+        longer resolves raises ValueError.
+        """
+        offset, isbn, skip_added = 0, None, 0
+        if cursor is not None:
+            try:
+                if cursor.startswith('+'):
+                    inode, _, added = cursor[1:].partition(':')
+                    inode, skip_added = int(inode), int(added)
+                else:
+                    offset, _, isbn = cursor.partition(':')
+                    offset = int(offset)
+            except ValueError:
+                raise ValueError(f'Invalid cursor: {cursor!r}') from None
+
+        # Held for the whole page so that books.csv and the journal match
+        with self._books_lock.shared(), open(self.books_file, 'rb') as f:
+            if cursor is not None and cursor.startswith('+'):
+                if os.fstat(f.fileno()).st_ino != inode:
+                    raise ValueError(f'Stale cursor: {cursor!r} (the journal was compacted)')
+                rows = iter(())
+            else:
+                rows = self._book_rows(f, offset)
+                if isbn is not None and not self._at_row(f, offset, isbn):
+                    # Rewritten since: find the book again from the top
+                    rows = self._book_rows(f)
+                    if not any(row[0] == isbn for row, _ in rows):
+                        raise ValueError(f'Stale cursor: {cursor!r} (no such book)')
+                elif isbn is not None:
+                    # Step over the book the cursor points at
+                    next(rows)
+            inode = os.fstat(f.fileno()).st_ino
+            last = {}
+
+            def csv_books():
+                for row, start in rows:
+                    last['cursor'] = f'{start}:{row[0]}'
+                    yield self._book_from_row(dict(zip(BOOK_FIELDS, row)))
+                last.clear()
+
+            def records():
+                added = 0
+                for book in self.journal.stream(csv_books()):
+                    if last:
+                        yield book, last['cursor']
+                        continue
+                    added += 1
+                    if added > skip_added:
+                        yield book, f'+{inode}:{added}'
+                if added < skip_added:
+                    raise ValueError(f'Stale cursor: {cursor!r} (no such book)')
+            return self._page(records(), limit, where)
+
+    @staticmethod
+    def _book_rows(f, offset: int = 0) -> Iterator[Tuple[List[str], int]]:
+        """Rows of books.csv (open in binary) from ``offset``, each with the offset it starts at."""
+        f.seek(offset)
+        pos = offset
+
+        def lines():
+            nonlocal pos
+            for line in f:
+                pos += len(line)
+                yield line.decode()
+
+        reader = csv.reader(lines())
+        if offset == 0:
+            next(reader, None)
+            offset = pos
+        for row in reader:
+            if row:
+                yield row, offset
+            offset = pos
+
+    @staticmethod
+    def _at_row(f, offset: int, isbn: str) -> bool:
+        """Whether a row for ``isbn`` starts at ``offset`` of books.csv."""
+        if offset <= 0:
+            return False
+        f.seek(offset - 1)
+        line = f.readline()
+        return line == b'\n' and next(csv.reader([f.readline().decode()]), [''])[0] == isbn
+
+    def iter_members(self, where: Optional[Callable[[Member], bool]] = None) -> Iterator[Member]:
+        for row, _ in self._scan(self.members_file, self._members_lock, MEMBER_FIELDS):
+            member = self._member_from_row(row)
+            if where is None or where(member):
+                yield member
+
+    def page_members(self, limit: int, cursor: Optional[str] = None,
+                     where: Optional[Callable[[Member], bool]] = None) -> Page:
+        """A page of members in file order; the cursor is a byte offset into members.csv."""
+        rows = self._scan(self.members_file, self._members_lock, MEMBER_FIELDS, int(cursor or 0))
+        return self._page(((self._member_from_row(r), pos) for r, pos in rows), limit, where)
+
+    def iter_loans(self, where: Optional[Callable[[Loan], bool]] = None) -> Iterator[Loan]:
+        with self._loans_lock.shared():
+            self._sync_returns()
+        for row, _ in self._scan(self.loans_file, self._loans_lock, LOAN_FIELDS):
+            loan = self._loan_from_row(self._with_return(row))
+            if where is None or where(loan):
+                yield loan
+
+    def page_loans(self, limit: int, cursor: Optional[str] = None,
+                   where: Optional[Callable[[Loan], bool]] = None) -> Page:
+        """A page of loans in file order; the cursor is a byte offset into loans.csv.
+
+        Each page seeks straight to its cursor, so paging costs the same at
+        the end of the history as at the start.
+        """
+        with self._loans_lock.shared():
+            self._sync_returns()
+        rows = self._scan(self.loans_file, self._loans_lock, LOAN_FIELDS, int(cursor or 0))
+        return self._page(((self._loan_from_row(self._with_return(r)), pos) for r, pos in rows),
+                          limit, where)
+
+
+class CachedStorage(Storage):
+    """CSV storage that serves reads from in-memory hash indexes.
+
+    The files are parsed once on construction. Every write goes to the CSV
+    files first and then updates the indexes, so the files stay the source
+    of truth and remain readable by a plain ``Storage``. Records are handed
+    out as copies; mutate them and save them back as with ``Storage``.
+
+    Before answering, each read checks whether another process has changed
+    the files. Appended members, loans and journal rows are read
+    incrementally; a rewritten books.csv is reloaded. New members and loans
+    are indexed the same way, on the next read, so a buffered add (see
+    ``buffer_appends``) is not written out early.
+
+    ``compact`` trades a little CPU per read for a much smaller loan cache:
+    ``'slots'`` holds ``CompactLoan`` objects and ``'columnar'`` a
+    ``LoanTable``. Loans are still handed out as ``Loan`` objects.
+    """
+
+    def __init__(self, data_dir: str = './data', journal: bool = False,
+                 journal_max_bytes: int = JOURNAL_MAX_BYTES, compact: Optional[str] = None):
+        if compact is not None and compact not in COMPACT_MODES:
+            raise ValueError(f'compact must be one of {COMPACT_MODES}, not {compact!r}')
+        super().__init__(data_dir, journal, journal_max_bytes)
+        self.compact_mode = compact
+        self._lock = threading.RLock()
+        self._books: Dict[str, Book] = {}
+        self._members: Dict[str, Member] = {}
+        # Loan ID -> Loan, or CompactLoan when compact
+        self._loans = LoanTable() if compact == 'columnar' else {}
+        self._export_loan = CompactLoan.to_loan if compact else copy.copy
+        self._member_loans: Dict[str, List[str]] = {}
+        self._books_version = None
+        self._journal_offset = 0
+        self._members_offset = 0
+        self._loans_offset = 0
+        self._load()
+
+    @staticmethod
+    def _file_version(path: str) -> tuple:
+        st = os.stat(path)
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _load(self) -> None:
+        with self._lock:
+            self._members.clear()
+            self._loans.clear()
+            self._member_loans.clear()
+            self._due_index = None
+            self._members_offset = 0
+            self._loans_offset = 0
+            self._returns_offset = 0
+            with self._books_lock.shared():
+                self._reload_books()
+            self._sync_members()
+            self._sync_loans()
+
+    def _reload_books(self) -> None:
+        # Caller holds the books lock
+        self._books = {}
+        self._books_version = self._file_version(self.books_file)
+        for book in Storage.get_all_books(self):
+            self._books.setdefault(book.isbn, book)
+        self._journal_offset = self.journal.size()
+
+    def _sync_books(self) -> None:
+        with self._books_lock.shared():
+            journal_size = self.journal.size()
+            if (self._file_version(self.books_file) != self._books_version
+                    or journal_size < self._journal_offset):
+                self._reload_books()
+            elif journal_size > self._journal_offset:
+                lines, self._journal_offset = read_appended_lines(self.journal.path, self._journal_offset)
+                self.journal.apply(csv.reader(lines), self._books)
+
+    def _sync_members(self) -> None:
+        with self._members_lock.shared():
+            first = self._members_offset == 0
+            lines, self._members_offset = read_appended_lines(self.members_file, self._members_offset)
+        for row in csv.reader(lines[1:] if first else lines):
+            if row:
+                member = self._member_from_row(dict(zip(MEMBER_FIELDS, row)))
+                self._members.setdefault(member.member_id, member)
+
+    def _sync_loans(self) -> None:
+        with self._loans_lock.shared():
+            first = self._loans_offset == 0
+            lines, self._loans_offset = read_appended_lines(self.loans_file, self._loans_offset)
+            for row in csv.reader(lines[1:] if first else lines):
+                if row:
+                    row = dict(zip(LOAN_FIELDS, row))
+                    loan = self._compact_loan_from_row(row) if self.compact_mode else self._loan_from_row(row)
+                    self._index_loan(loan)
+                    if self._due_index is not None:
+                        self._due_index.add(loan)
+            # Under the same lock hold, so every return finds its loan
+            self._sync_returns()
+
+    def _sync_returns(self) -> None:
+        # Returns update the cached loans in place instead of filling _returns
+        for loan_id, return_date in self._appended_returns():
+            loan = self._loans.get(loan_id)
+            if loan is None or loan.return_date is not None:
+                continue
+            loan.return_date = datetime.strptime(return_date, '%Y-%m-%d')
+            # A LoanTable hands out views, so the change is written back
+            self._loans[loan_id] = loan
+            if self._due_index is not None:
+                self._due_index.discard(loan_id)
+
+    def _index_loan(self, loan: Loan) -> None:
+        if loan.loan_id not in self._loans:
+            self._member_loans.setdefault(loan.member_id, []).append(loan.loan_id)
+        self._loans[loan.loan_id] = loan
+
+    def reload(self) -> None:
+        """Discard the indexes and re-read the CSV files."""
+        self._load()
+
+    def get_all_books(self) -> List[Book]:
+        with self._lock:
+            self._sync_books()
+            return [copy.copy(b) for b in self._books.values()]
+
+    def get_book_by_isbn(self, isbn: str) -> Optional[Book]:
+        with self._lock:
+            self._sync_books()
+            book = self._books.get(isbn)
+            return copy.copy(book) if book else None
+
+    def get_books_by_isbns(self, isbns: Iterable[str]) -> Dict[str, Book]:
+        with self._lock:
+            self._sync_books()
+            return {isbn: copy.copy(self._books[isbn])
+                    for isbn in isbns if isbn in self._books}
+
+    def add_book(self, book: Book) -> None:
+        with self._lock, self._books_lock.exclusive():
+            self._sync_books()
+            if self.use_journal:
+                self.journal.append_book(book)
+                self._journal_offset = self.journal.size()
+            else:
+                # The file content is known, so appending is equivalent to a rewrite
+                with open(self.books_file, 'a', newline='') as f:
+                    csv.writer(f).writerow(self._book_row(book))
+                self._books_version = self._file_version(self.books_file)
+            self._books.setdefault(book.isbn, copy.copy(book))
+            self._maybe_compact()
+        self._notify_book_added(book)
+
+    def adjust_availability(self, isbn: str, delta: int) -> bool:
+        with self._lock, self._books_lock.exclusive():
+            self._sync_books()
+            book = self._books.get(isbn)
+            if not book or not 0 <= book.copies_available + delta <= book.copies_total:
+                return False
+            book.copies_available += delta
+            if self.use_journal:
+                self.journal.append_delta(isbn, delta)
+                self._journal_offset = self.journal.size()
+                self._maybe_compact()
+            else:
+                self._save_availability()
+            return True
+
+    def take_copies(self, isbns: List[str], all_or_nothing: bool = False) -> List[bool]:
+        with self._lock, self._books_lock.exclusive():
+            self._sync_books()
+            taken = _take_copies(self._books, isbns, all_or_nothing)
+            if any(taken):
+                if self.use_journal:
+                    self.journal.append_deltas(Counter(i for i, ok in zip(isbns, taken) if ok), -1)
+                    self._journal_offset = self.journal.size()
+                    self._maybe_compact()
+                else:
+                    self._save_availability()
+            return taken
+
+    def checkout(self, loan: Loan) -> bool:
+        # The in-process lock is always taken before the file locks
+        with self._lock:
+            return super().checkout(loan)
+
+    def checkout_many(self, loans: List[Loan], all_or_nothing: bool = False) -> List[bool]:
+        with self._lock:
+            return super().checkout_many(loans, all_or_nothing)
+
+    def return_loan(self, loan_id: str, when: Optional[datetime] = None) -> Optional[Loan]:
+        with self._lock:
+            return super().return_loan(loan_id, when)
+
+    def compact(self) -> None:
+        with self._lock:
+            super().compact()
+
+    def _save_availability(self) -> None:
+        """Rewrite books.csv with the cached counts; the caller holds both locks.
+
+        The cache keeps the first row of a repeated ISBN, as lookups do, so
+        the file is rewritten from its own rows to keep the repeats.
+        """
+        books = Storage.get_all_books(self)
+        seen = set()
+        for book in books:
+            if book.isbn not in seen:
+                seen.add(book.isbn)
+                book.copies_available = self._books[book.isbn].copies_available
+        self._save_books(books)
+
+    def _save_books(self, books: List[Book]) -> None:
+        with self._lock, self._books_lock.exclusive():
+            super()._save_books(books)
+            self._books = {}
+            for book in books:
+                self._books.setdefault(book.isbn, copy.copy(book))
+            self._books_version = self._file_version(self.books_file)
+            self._journal_offset = 0
+
+    def bulk_import(self, kind: str, rows: Iterable[Dict[str, str]],
+                    batch_size: int = IMPORT_BATCH_SIZE,
+                    hash_passwords: Optional[Callable[[List[str]], List[str]]] = None) -> ImportReport:
+        with self._lock:
+            report = super().bulk_import(kind, rows, batch_size, hash_passwords)
+            self._load()
+            return report
+
+    def get_all_members(self) -> List[Member]:
+        with self._lock:
+            self._sync_members()
+            return [copy.copy(m) for m in self._members.values()]
+
+    def get_member_by_id(self, member_id: str) -> Optional[Member]:
+        with self._lock:
+            self._sync_members()
+            member = self._members.get(member_id)
+            return copy.copy(member) if member else None
+
+    def get_members_by_ids(self, member_ids: Iterable[str]) -> Dict[str, Member]:
+        with self._lock:
+            self._sync_members()
+            return {member_id: copy.copy(self._members[member_id])
+                    for member_id in member_ids if member_id in self._members}
+
+    def get_loan_by_id(self, loan_id: str) -> Optional[Loan]:
+        with self._lock:
+            self._sync_loans()
+            loan = self._loans.get(loan_id)
+            return self._export_loan(loan) if loan else None
+
+    def get_all_loans(self) -> List[Loan]:
+        with self._lock:
+            self._sync_loans()
+            return [self._export_loan(l) for l in self._loans.values()]
+
+    def get_member_loans(self, member_id: str) -> List[Loan]:
+        with self._lock:
+            self._sync_loans()
+            return [self._export_loan(self._loans[loan_id])
+                    for loan_id in self._member_loans.get(member_id, [])]
+
+    def _refresh_due_index(self) -> DueDateIndex:
+        # The loans are already in memory and _sync_loans keeps the index current
+        self._sync_loans()
+        if self._due_index is None:
+            self._due_index = DueDateIndex(self._export_loan)
+            for loan in self._loans.values():
+                self._due_index.add(loan)
+        return self._due_index
+
+    def get_overdue_loans(self, as_of: Optional[datetime] = None) -> List[Loan]:
+        with self._lock:
+            return super().get_overdue_loans(as_of)
+
+    def get_loans_due_soon(self, days: int, as_of: Optional[datetime] = None) -> List[Loan]:
+        with self._lock:
+            return super().get_loans_due_soon(days, as_of)
+
+    # Iteration works on a snapshot of references, so it neither holds the
+    # lock while the caller consumes records nor sees later changes (a
+    # LoanTable is read lazily, as its columns only grow). Pages count
+    # positions in insertion order.
+
+    def _iter_cached(self, sync: Callable[[], None], records: Dict[str, object],
+                     where: Optional[Callable], export: Callable = copy.copy) -> Iterator:
+        with self._lock:
+            sync()
+            snapshot = records.values() if isinstance(records, LoanTable) else list(records.values())
+        for record in snapshot:
+            if where is None or where(record):
+                yield export(record)
+
+    def _page_cached(self, sync: Callable[[], None], records: Dict[str, object], limit: int,
+                     cursor: Optional[str], where: Optional[Callable],
+                     export: Callable = copy.copy) -> Page:
+        start = int(cursor or 0)
+        with self._lock:
+            sync()
+            page = self._page(((r, pos) for pos, r in
+                               enumerate(itertools.islice(records.values(), start, None), start + 1)),
+                              limit, where)
+        page.items = [export(r) for r in page.items]
+        return page
+
+    def iter_books(self, where: Optional[Callable[[Book], bool]] = None) -> Iterator[Book]:
+        return self._iter_cached(self._sync_books, self._books, where)
+
+    def page_books(self, limit: int, cursor: Optional[str] = None,
+                   where: Optional[Callable[[Book], bool]] = None) -> Page:
+        return self._page_cached(self._sync_books, self._books, limit, cursor, where)
+
+    def iter_members(self, where: Optional[Callable[[Member], bool]] = None) -> Iterator[Member]:
+        return self._iter_cached(self._sync_members, self._members, where)
+
+    def page_members(self, limit: int, cursor: Optional[str] = None,
+                     where: Optional[Callable[[Member], bool]] = None) -> Page:
+        return self._page_cached(self._sync_members, self._members, limit, cursor, where)
+
+    def iter_loans(self, where: Optional[Callable[[Loan], bool]] = None) -> Iterator[Loan]:
+        return self._iter_cached(self._sync_loans, self._loans, where, self._export_loan)
+
+    def page_loans(self, limit: int, cursor: Optional[str] = None,
+                   where: Optional[Callable[[Loan], bool]] = None) -> Page:
+        return self._page_cached(self._sync_loans, self._loans, limit, cursor, where,
+                                 self._export_loan)
+
+
+def open_storage(data_dir: str = './data', cached: bool = False,
+                 journal: bool = False, compact: Optional[str] = None) -> Storage:
+    """Open the storage engine for ``data_dir``.
+
+    A ``sqlite:///path.db`` URL selects the SQLite backend; anything else is
+    a directory of CSV files. ``compact`` implies ``cached``. A directory
+    with a binary book store is always opened with ``MappedStorage``, which
+    reads members and loans from CSV uncached and has no book journal. One
+    with partitioned loans is always opened with ``PartitionedStorage``,
+    which is uncached too.
+    """
+    if data_dir.startswith('sqlite:///'):
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage(data_dir[len('sqlite:///'):])
+    has_book_store = os.path.exists(os.path.join(data_dir, BOOK_STORE_FILE))
+    if os.path.isdir(os.path.join(data_dir, LOAN_PARTITIONS_DIR)):
+        if has_book_store:
+            raise ValueError(f'{data_dir} has both {BOOK_STORE_FILE} and partitioned loans')
+        from partitions import PartitionedStorage
+        return PartitionedStorage(data_dir, journal=journal)
+    if has_book_store:
+        from bookstore import MappedStorage
+        return MappedStorage(data_dir)
+    if cached or compact:
+        return CachedStorage(data_dir, journal=journal, compact=compact)
+    return Storage(data_dir, journal=journal)
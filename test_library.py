@@ -1,102 +1,1015 @@
-import pytest
-from datetime import datetime, timedelta
-from models import Book, Member, Loan
-from storage import Storage
-from auth import Auth
-from main import LibrarySystem
-import os
-import shutil
-
-@pytest.fixture
-def test_data_dir():
-    test_dir = './test_data'
-    os.makedirs(test_dir, exist_ok=True)
-    yield test_dir
-    shutil.rmtree(test_dir)
-
-@pytest.fixture
-def library_system(test_data_dir):
-    return LibrarySystem(test_data_dir)
-
-@pytest.fixture
-def sample_book():
-    return Book(
-        isbn='1234567890',
-        title='Test Book',
-        author='Test Author',
-        copies_total=3,
-        copies_available=3
-    )
-
-@pytest.fixture
-def sample_member():
-    return {
-        'member_id': 'TEST001',
-        'name': 'Test User',
-        'password': 'testpass123',
-        'email': 'test@example.com'
-    }
-
-def test_add_book(library_system, sample_book):
-    library_system.storage.add_book(sample_book)
-    books = library_system.storage.get_all_books()
-    assert any(b.isbn == sample_book.isbn for b in books)
-
-def test_register_member(library_system, sample_member):
-    result = library_system.auth.register_member(
-        sample_member['member_id'],
-        sample_member['name'],
-        sample_member['password'],
-        sample_member['email']
-    )
-    assert result == True
-
-def test_member_login(library_system, sample_member):
-    library_system.auth.register_member(
-        sample_member['member_id'],
-        sample_member['name'],
-        sample_member['password'],
-        sample_member['email']
-    )
-    result = library_system.auth.login('member', sample_member['member_id'], sample_member['password'])
-    assert result == True
-
-def test_issue_book(library_system, sample_book, sample_member):
-    # Setup
-    library_system.storage.add_book(sample_book)
-    library_system.auth.register_member(
-        sample_member['member_id'],
-        sample_member['name'],
-        sample_member['password'],
-        sample_member['email']
-    )
-    
-    # Issue book
-    library_system.auth.login('librarian', 'admin', 'admin')
-    initial_copies = sample_book.copies_available
-    
-    # Create loan
-    issue_date = datetime.now()
-    due_date = issue_date + timedelta(days=14)
-    loan = Loan(
-        loan_id='TEST_LOAN_001',
-        member_id=sample_member['member_id'],
-        isbn=sample_book.isbn,
-        issue_date=issue_date,
-        due_date=due_date
-    )
-    library_system.storage.add_loan(loan)
-    
-    # Verify
-    books = library_system.storage.get_all_books()
-    updated_book = next(b for b in books if b.isbn == sample_book.isbn)
-    assert updated_book.copies_available == initial_copies - 1
-
-def test_search_catalogue(library_system, sample_book):
-    library_system.storage.add_book(sample_book)
-    books = library_system.storage.get_all_books()
-    matches = [book for book in books
-              if sample_book.title.lower() in book.title.lower() or 
-              sample_book.author.lower() in book.author.lower()]
-    assert len(matches) > 0
-    assert matches[0].isbn == sample_book.isbn
\ No newline at end of file
+import pytest
+from datetime import datetime, timedelta
+from models import Book, CompactLoan, LibraryError, Member, Loan
+from storage import Storage, CachedStorage, open_storage
+from sqlite_storage import SQLiteStorage
+from bookstore import BookStore, MappedStorage
+from holds import HoldQueue, HoldQueues
+from partitions import PartitionedStorage, migrate, export
+from auth import Auth
+from sessions import SessionStore
+from main import LibrarySystem
+from server import LibraryServer
+from datagen import REFERENCE_DATE, generate
+from benchmark import compare_results
+from metrics import Metrics
+import os
+import shutil
+import sys
+import time
+import threading
+import multiprocessing
+import asyncio
+import json
+from collections import Counter
+
+@pytest.fixture
+def test_data_dir():
+    test_dir = './test_data'
+    os.makedirs(test_dir, exist_ok=True)
+    yield test_dir
+    shutil.rmtree(test_dir)
+
+@pytest.fixture
+def library_system(test_data_dir):
+    return LibrarySystem(test_data_dir)
+
+@pytest.fixture
+def sample_book():
+    return Book(
+        isbn='1234567890',
+        title='Test Book',
+        author='Test Author',
+        copies_total=3,
+        copies_available=3
+    )
+
+@pytest.fixture
+def sample_member():
+    return {
+        'member_id': 'TEST001',
+        'name': 'Test User',
+        'password': 'testpass123',
+        'email': 'test@example.com'
+    }
+
+def test_add_book(library_system, sample_book):
+    library_system.storage.add_book(sample_book)
+    books = library_system.storage.get_all_books()
+    assert any(b.isbn == sample_book.isbn for b in books)
+
+def test_register_member(library_system, sample_member):
+    result = library_system.auth.register_member(
+        sample_member['member_id'],
+        sample_member['name'],
+        sample_member['password'],
+        sample_member['email']
+    )
+    assert result == True
+
+def test_member_login(library_system, sample_member):
+    library_system.auth.register_member(
+        sample_member['member_id'],
+        sample_member['name'],
+        sample_member['password'],
+        sample_member['email']
+    )
+    result = library_system.auth.login('member', sample_member['member_id'], sample_member['password'])
+    assert result == True
+
+def test_issue_book(library_system, sample_book, sample_member):
+    # Setup
+    library_system.storage.add_book(sample_book)
+    library_system.auth.register_member(
+        sample_member['member_id'],
+        sample_member['name'],
+        sample_member['password'],
+        sample_member['email']
+    )
+    
+    # Issue book
+    library_system.auth.login('librarian', 'admin', 'admin')
+    initial_copies = sample_book.copies_available
+    
+    # Create loan
+    issue_date = datetime.now()
+    due_date = issue_date + timedelta(days=14)
+    loan = Loan(
+        loan_id='TEST_LOAN_001',
+        member_id=sample_member['member_id'],
+        isbn=sample_book.isbn,
+        issue_date=issue_date,
+        due_date=due_date
+    )
+    library_system.storage.add_loan(loan)
+    
+    # Verify
+    books = library_system.storage.get_all_books()
+    updated_book = next(b for b in books if b.isbn == sample_book.isbn)
+    assert updated_book.copies_available == initial_copies - 1
+
+def test_search_catalogue(library_system, sample_book):
+    library_system.storage.add_book(sample_book)
+    books = library_system.storage.get_all_books()
+    matches = [book for book in books
+              if sample_book.title.lower() in book.title.lower() or 
+              sample_book.author.lower() in book.author.lower()]
+    assert len(matches) > 0
+    assert matches[0].isbn == sample_book.isbn
+
+def test_cached_storage_write_through(test_data_dir, sample_book):
+    cached = CachedStorage(test_data_dir)
+    cached.add_book(sample_book)
+    cached.add_loan(Loan(
+        loan_id='TEST_LOAN_002',
+        member_id='TEST001',
+        isbn=sample_book.isbn,
+        issue_date=datetime.now() - timedelta(days=20),
+        due_date=datetime.now() - timedelta(days=6)
+    ))
+
+    assert cached.get_book_by_isbn(sample_book.isbn).title == sample_book.title
+    assert [l.loan_id for l in cached.get_member_loans('TEST001')] == ['TEST_LOAN_002']
+    assert [l.loan_id for l in cached.get_overdue_loans()] == ['TEST_LOAN_002']
+
+    # Changes are visible to a plain CSV reader
+    plain = Storage(test_data_dir)
+    assert plain.get_book_by_isbn(sample_book.isbn) == sample_book
+    assert len(plain.get_member_loans('TEST001')) == 1
+
+def test_cached_storage_returns_copies(test_data_dir, sample_book):
+    cached = CachedStorage(test_data_dir)
+    cached.add_book(sample_book)
+    book = cached.get_book_by_isbn(sample_book.isbn)
+    book.copies_available = 0
+    assert cached.get_book_by_isbn(sample_book.isbn).copies_available == 3
+
+def test_cached_storage_keeps_repeated_isbns(test_data_dir, sample_book):
+    plain = Storage(test_data_dir)
+    plain.add_book(sample_book)
+    plain.add_book(Book(sample_book.isbn, 'Second Copy Row', 'Author', 2, 2))
+    plain.add_book(Book('OTHER', 'Other', 'Author', 1, 1))
+    cached = CachedStorage(test_data_dir)
+    assert cached.adjust_availability(sample_book.isbn, -1)
+    assert cached.take_copies([sample_book.isbn, 'OTHER']) == [True, True]
+    assert [(b.title, b.copies_available) for b in Storage(test_data_dir).get_all_books()] == \
+        [(sample_book.title, 1), ('Second Copy Row', 2), ('Other', 0)]
+
+@pytest.mark.parametrize('storage_class', [Storage, CachedStorage])
+def test_journaled_availability(test_data_dir, sample_book, storage_class):
+    storage = storage_class(test_data_dir, journal=True)
+    storage.add_book(sample_book)
+    assert storage.adjust_availability(sample_book.isbn, -1)
+    assert storage.adjust_availability(sample_book.isbn, -2)
+    assert not storage.adjust_availability(sample_book.isbn, -1)
+    assert not storage.adjust_availability('missing', -1)
+
+    # books.csv is untouched until compaction; a plain reader replays the log
+    assert Storage(test_data_dir).get_all_books() == [
+        Book(sample_book.isbn, sample_book.title, sample_book.author, 3, 0)]
+    storage.compact()
+    assert not os.path.exists(storage.journal.path)
+    assert Storage(test_data_dir).get_book_by_isbn(sample_book.isbn).copies_available == 0
+
+def test_journal_compacts_at_threshold(test_data_dir, sample_book):
+    storage = Storage(test_data_dir, journal=True, journal_max_bytes=64)
+    storage.add_book(sample_book)
+    for _ in range(3):
+        storage.adjust_availability(sample_book.isbn, -1)
+        storage.adjust_availability(sample_book.isbn, 1)
+    assert storage.journal.size() < 64
+    assert storage.get_book_by_isbn(sample_book.isbn).copies_available == 3
+
+def test_sqlite_storage(test_data_dir, sample_book):
+    storage = open_storage(f'sqlite:///{test_data_dir}/library.db')
+    storage.add_book(sample_book)
+    loans = [Loan(loan_id=f'L{i}', member_id='TEST001', isbn=sample_book.isbn,
+                  issue_date=datetime.now() - timedelta(days=20),
+                  due_date=datetime.now() + timedelta(days=days))
+             for i, days in enumerate([-3, -1, 5, 14])]
+    assert all(storage.checkout(loan) for loan in loans[:3])
+    assert not storage.checkout(loans[3])
+    assert storage.get_book_by_isbn(sample_book.isbn).copies_available == 0
+    assert [l.loan_id for l in storage.get_member_loans('TEST001')] == ['L0', 'L1', 'L2']
+    assert [l.loan_id for l in storage.get_overdue_loans()] == ['L0', 'L1']
+    storage.close()
+
+def test_sqlite_migration(test_data_dir, sample_book):
+    csv_storage = Storage(test_data_dir)
+    csv_storage.add_book(sample_book)
+    auth = Auth(csv_storage)
+    auth.register_member('TEST001', 'Test User', 'testpass123', 'test@example.com')
+
+    db = SQLiteStorage(os.path.join(test_data_dir, 'library.db'))
+    assert db.migrate_from_csv(test_data_dir) == {'books': 1, 'members': 1, 'loans': 0}
+    assert db.get_all_books() == [sample_book]
+    assert Auth(db).login('member', 'TEST001', 'testpass123')
+    db.close()
+
+def test_mapped_book_store(test_data_dir, sample_book):
+    csv_storage = Storage(test_data_dir, journal=True)
+    csv_storage.add_book(sample_book)
+    csv_storage.add_book(Book('978-2', 'Ünïcode Title', 'Författare', 1, 1))
+    csv_storage.adjust_availability(sample_book.isbn, -1)
+    BookStore(test_data_dir).create(csv_storage.iter_books())
+
+    storage = open_storage(test_data_dir, cached=True)
+    assert isinstance(storage, MappedStorage)
+    assert storage.get_all_books() == csv_storage.get_all_books()
+    loan = Loan('L1', 'TEST001', sample_book.isbn, datetime.now(), datetime.now() + timedelta(days=14))
+    assert storage.checkout(loan)
+    assert storage.adjust_availability(sample_book.isbn, -1)
+    assert not storage.adjust_availability(sample_book.isbn, -1)
+    assert not storage.adjust_availability('missing', 1)
+    assert [l.loan_id for l in storage.get_member_loans('TEST001')] == ['L1']
+
+    # Appends grow the files past their first mapping; another instance
+    # sees counter updates and appends on its next call
+    other = MappedStorage(test_data_dir)
+    assert other.get_book_by_isbn(sample_book.isbn).copies_available == 0
+    for i in range(2000):
+        storage.add_book(Book(f'X{i}', f'Extra {i}' * 10, 'Someone', 1, 1))
+    assert other.get_book_by_isbn('X1999') == Book('X1999', 'Extra 1999' * 10, 'Someone', 1, 1)
+    assert other.adjust_availability('978-2', -1)
+    assert storage.get_books_by_isbns(['978-2', 'missing']) == {
+        '978-2': Book('978-2', 'Ünïcode Title', 'Författare', 1, 0)}
+    with pytest.raises(ValueError):
+        storage.add_book(Book('9' * 41, 'Too Long', 'ISBN', 1, 1))
+
+    storage.book_store.export_csv(storage.books_file)
+    storage.journal.clear()
+    assert Storage(test_data_dir).get_all_books() == other.get_all_books()
+    assert len(other.get_all_books()) == 2002
+
+    # A rebuild that crashed before renaming books.dat left only its heap
+    # behind, which the live store does not read
+    with open(os.path.join(test_data_dir, 'books.2.heap'), 'wb') as f:
+        f.write(b'garbage' * 100)
+    assert len(MappedStorage(test_data_dir).get_all_books()) == 2002
+    BookStore(test_data_dir).create([Book('N1', 'New Title', 'New Author', 1, 1)])
+    assert other.get_all_books() == [Book('N1', 'New Title', 'New Author', 1, 1)]
+    assert sorted(n for n in os.listdir(test_data_dir) if n.endswith('.heap')) == ['books.2.heap']
+
+def test_catalogue_search_ranking(library_system):
+    books = [
+        Book('1', 'Gardens of the Moon', 'Steven Erikson', 1, 1),
+        Book('2', 'Moon Garden Moon', 'Ann Gardener', 1, 1),
+        Book('3', 'Night Sky', 'Luna Moon', 1, 1),
+        Book('4', 'Dune', 'Frank Herbert', 1, 1),
+    ]
+    for book in books[:3]:
+        library_system.storage.add_book(book)
+    catalogue = library_system.catalogue
+    assert [b.isbn for b in catalogue.search('moon')] == ['2', '1', '3']
+    assert [b.isbn for b in catalogue.search('moon', limit=1, offset=1)] == ['1']
+    assert [b.isbn for b in catalogue.search('MOON luna')] == ['3']
+
+    # Index follows add_book; partial words fall back to substring matching
+    library_system.storage.add_book(books[3])
+    assert [b.isbn for b in catalogue.search('herb')] == ['4']
+    assert catalogue.search('frank dune')[0] == books[3]
+    assert catalogue.search('nothing here') == []
+
+    # Searches on one thread while another adds books see whole postings
+    errors = []
+    def search_moons():
+        try:
+            for _ in range(100):
+                catalogue.search('moo', limit=10)
+                catalogue.search('moon author', limit=10)
+        except RuntimeError as e:
+            errors.append(e)
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        searcher = threading.Thread(target=search_moons)
+        searcher.start()
+        for i in range(5000):
+            catalogue._on_book_added(Book(f'M{i}', f'Moon w{i}', 'Author', 1, 1))
+        searcher.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+
+def test_catalogue_type_ahead(library_system):
+    storage = library_system.storage
+    storage.add_book(Book('9780000000017', 'Moonlight Garden', 'Ann Gardener', 1, 1))
+    storage.add_book(Book('9780000000024', 'Garden of Moons', 'Steven Erikson', 1, 1))
+    storage.add_book(Book('9791000000005', 'The Moon', 'Luna Moore', 1, 1))
+    catalogue = library_system.catalogue
+    isbns = lambda query, limit=10: [isbn for isbn, _, _ in catalogue.suggest(query, limit)]
+    catalogue.index
+    assert not catalogue.ready
+    catalogue.prepare()
+    assert catalogue.ready
+
+    assert catalogue.suggest('moonl') == [('9780000000017', 'Moonlight Garden', 'Ann Gardener')]
+    # Shortest completion first: moon, moore, moons, moonlight
+    assert isbns('moo') == ['9791000000005', '9780000000024', '9780000000017']
+    assert isbns('moo', limit=2) == ['9791000000005', '9780000000024']
+    # Earlier words must match whole words; a trailing space ends the prefix
+    assert isbns('garden mo') == ['9780000000017', '9780000000024']
+    assert isbns('moon ') == ['9791000000005']
+    assert isbns('978-0') == ['9780000000017', '9780000000024']
+    assert isbns('xyz') == []
+
+    # Books added after the index is built are suggested too
+    storage.add_book(Book('9780000000031', 'Moonraker', 'Ian Fleming', 1, 1))
+    assert isbns('moonr') == ['9780000000031']
+
+@pytest.mark.parametrize('spec', ['csv', 'cached', 'sqlite'])
+def test_due_date_queries(test_data_dir, spec):
+    if spec == 'sqlite':
+        storage = open_storage(f'sqlite:///{test_data_dir}/library.db')
+    else:
+        storage = open_storage(test_data_dir, cached=spec == 'cached')
+    now = datetime(2026, 10, 18, 12, 0)
+    for loan_id, due_in in [('L1', 3), ('L2', -10), ('L3', 20), ('L4', -1)]:
+        storage.add_loan(Loan(loan_id=loan_id, member_id='TEST001', isbn='1',
+                              issue_date=now - timedelta(days=14),
+                              due_date=now + timedelta(days=due_in)))
+    assert [l.loan_id for l in storage.get_overdue_loans(now)] == ['L2', 'L4']
+    assert [l.loan_id for l in storage.get_loans_due_soon(7, now)] == ['L1']
+
+    # Loans appended after the index was built are picked up
+    storage.add_loan(Loan(loan_id='L5', member_id='TEST002', isbn='1',
+                          issue_date=now - timedelta(days=30),
+                          due_date=now - timedelta(days=16)))
+    assert [l.loan_id for l in storage.get_overdue_loans(now)] == ['L5', 'L2', 'L4']
+
+@pytest.mark.parametrize('spec', ['csv', 'cached', 'sqlite'])
+def test_overdue_report(test_data_dir, sample_book, spec, capsys):
+    if spec == 'sqlite':
+        library = LibrarySystem(f'sqlite:///{test_data_dir}/library.db')
+    else:
+        library = LibrarySystem(test_data_dir, cached=spec == 'cached')
+    storage = library.storage
+    storage.add_book(sample_book)
+    library.auth.register_member('TEST001', 'Test User', 'testpass123', 'test@example.com')
+    due = datetime.now() - timedelta(days=3)
+    for loan_id, member_id in [('L1', 'TEST001'), ('L2', 'GHOST')]:
+        storage.add_loan(Loan(loan_id=loan_id, member_id=member_id, isbn=sample_book.isbn,
+                              issue_date=due - timedelta(days=14), due_date=due))
+
+    assert set(storage.get_members_by_ids(['TEST001', 'GHOST'])) == {'TEST001'}
+    report = storage.get_overdue_report()
+    assert [(e.loan.loan_id, e.member and e.member.name, e.book.title) for e in report] == [
+        ('L1', 'Test User', 'Test Book'), ('L2', None, 'Test Book')]
+
+    library.auth.login('librarian', 'admin', 'LibAdmin@2024')
+    library.show_overdue_list()
+    out = capsys.readouterr().out
+    assert 'Member: Test User (ID: TEST001)' in out
+    assert 'Member: Unknown member (ID: GHOST)' in out
+
+@pytest.mark.parametrize('spec', ['csv', 'cached', 'sqlite', 'mapped'])
+def test_bulk_import(test_data_dir, sample_book, spec):
+    if spec == 'mapped':
+        BookStore(test_data_dir).create([])
+    if spec == 'sqlite':
+        library = LibrarySystem(f'sqlite:///{test_data_dir}/library.db')
+    else:
+        library = LibrarySystem(test_data_dir, cached=spec == 'cached')
+    storage = library.storage
+    storage.add_book(sample_book)
+    rows = [
+        {'ISBN': '1', 'Title': 'One', 'Author': 'A', 'CopiesTotal': '2'},
+        {'ISBN': '2', 'Title': 'Two', 'Author': 'B', 'CopiesTotal': '1', 'CopiesAvailable': '0'},
+        {'ISBN': '1', 'Title': 'One', 'Author': 'A', 'CopiesTotal': '3'},
+        {'ISBN': sample_book.isbn, 'Title': 'Test Book', 'Author': 'Test Author', 'CopiesTotal': '2'},
+        {'ISBN': '3', 'Title': '', 'Author': 'C', 'CopiesTotal': '1'},
+        {'ISBN': '4', 'Title': 'Four', 'Author': 'D', 'CopiesTotal': 'x'},
+    ]
+    report = storage.bulk_import('books', iter(rows), batch_size=1)
+    assert (report.imported, report.merged, report.rejected) == (2, 2, 2)
+    assert len(report.errors) == 2
+    books = {b.isbn: b for b in storage.get_all_books()}
+    assert (books['1'].copies_total, books['1'].copies_available) == (5, 5)
+    assert (books['2'].copies_total, books['2'].copies_available) == (1, 0)
+    assert books[sample_book.isbn].copies_total == 5
+    assert [b.isbn for b in library.catalogue.search('two')] == ['2']
+
+    members = [
+        {'MemberID': 'M1', 'Name': 'Ann', 'Email': 'a@x.org', 'Password': 'pw1'},
+        {'MemberID': 'M1', 'Name': 'Dup', 'Email': 'd@x.org', 'Password': 'pw2'},
+    ]
+    report = storage.bulk_import('members', iter(members),
+                                 hash_passwords=library.auth.hash_passwords)
+    assert (report.imported, report.rejected) == (1, 1)
+    assert library.auth.login('member', 'M1', 'pw1')
+
+def test_register_members_batch(library_system, sample_member):
+    library_system.auth.register_member(
+        sample_member['member_id'],
+        sample_member['name'],
+        sample_member['password'],
+        sample_member['email']
+    )
+    library_system.auth.rounds = 4
+    library_system.auth.hash_workers = 2
+    results = library_system.auth.register_members([
+        {'member_id': 'M1', 'name': 'Ann', 'password': 'pw1', 'email': 'a@x.org'},
+        {'member_id': sample_member['member_id'], 'name': 'Dup', 'password': 'pw', 'email': 'd@x.org'},
+        {'member_id': 'M2', 'name': 'Bob', 'password': 'pw2', 'email': 'b@x.org'},
+        {'member_id': 'M1', 'name': 'Again', 'password': 'pw', 'email': 'c@x.org'},
+        {'member_id': 'M3', 'name': 'NoPass', 'password': '', 'email': 'e@x.org'},
+    ])
+    assert [(r.member_id, r.registered) for r in results] == [
+        ('M1', True), (sample_member['member_id'], False), ('M2', True), ('M1', False), ('M3', False)]
+    assert library_system.auth.login('member', 'M2', 'pw2')
+    assert library_system.storage.get_member_by_id('M1').name == 'Ann'
+
+@pytest.mark.parametrize('spec', ['csv', 'sqlite'])
+def test_librarian_accounts(test_data_dir, spec):
+    if spec == 'sqlite':
+        storage = open_storage(f'sqlite:///{test_data_dir}/library.db')
+    else:
+        storage = open_storage(test_data_dir)
+    auth = Auth(storage, rounds=4)
+    assert auth._librarian_hashes == {}
+    assert not auth.login('librarian', 'admin', 'admin')
+    assert auth.login('librarian', 'admin', 'LibAdmin@2024')
+    assert auth.is_librarian()
+
+    assert auth.register_librarian('clerk', 'desk-pass')
+    assert not auth.register_librarian('clerk', 'other')
+    # Accounts persist for later processes
+    assert Auth(storage).login('librarian', 'clerk', 'desk-pass')
+
+def test_session_tokens(library_system, sample_member):
+    auth = library_system.auth
+    auth.register_member(sample_member['member_id'], sample_member['name'],
+                         sample_member['password'], sample_member['email'])
+    member_token = auth.authenticate('member', sample_member['member_id'], sample_member['password'])
+    librarian_token = auth.authenticate('librarian', 'admin', 'LibAdmin@2024')
+    assert auth.authenticate('member', sample_member['member_id'], 'wrong') is None
+
+    assert auth.is_member(member_token) and not auth.is_librarian(member_token)
+    assert auth.is_librarian(librarian_token)
+    assert auth.get_current_user(member_token)['user_id'] == sample_member['member_id']
+    assert auth.get_current_user() is None
+    auth.logout(member_token)
+    assert not auth.is_member(member_token)
+    assert auth.is_librarian(librarian_token)
+
+def test_session_store_expiry_and_eviction():
+    now = [0.0]
+    store = SessionStore(ttl=10, max_sessions=2, clock=lambda: now[0])
+    a = store.create('member', 'A')
+    b = store.create('member', 'B')
+    now[0] = 8
+    assert store.get(a)['user_id'] == 'A'   # refreshes A, so B is now least recent
+    c = store.create('member', 'C')
+    assert store.get(b) is None and len(store) == 2
+    now[0] = 17
+    assert store.get(a) is not None
+    now[0] = 30
+    assert store.get(c) is None and store.get(a) is None
+
+def _checkout_worker(data_dir, cached, journal, worker, attempts):
+    storage = open_storage(data_dir, cached=cached, journal=journal)
+    taken = 0
+    for i in range(attempts):
+        now = datetime.now()
+        taken += storage.checkout(Loan(loan_id=f'W{worker}-{i}', member_id=f'M{worker}',
+                                       isbn='1234567890', issue_date=now,
+                                       due_date=now + timedelta(days=14)))
+    return taken
+
+@pytest.mark.parametrize('cached,journal', [(False, False), (True, False), (False, True), (True, True)])
+def test_concurrent_checkouts_do_not_lose_updates(test_data_dir, sample_book, cached, journal):
+    sample_book.copies_total = sample_book.copies_available = 25
+    open_storage(test_data_dir, cached=cached, journal=journal).add_book(sample_book)
+    with multiprocessing.Pool(4) as pool:
+        taken = pool.starmap(_checkout_worker,
+                             [(test_data_dir, cached, journal, w, 10) for w in range(4)])
+    assert sum(taken) == 25
+    storage = Storage(test_data_dir)
+    assert storage.get_book_by_isbn(sample_book.isbn).copies_available == 0
+    assert len(storage.get_all_loans()) == 25
+
+async def _http(port, method, path, body=None, token=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    payload = json.dumps(body).encode() if body is not None else b''
+    headers = f'Content-Length: {len(payload)}\r\nConnection: close\r\n'
+    if token:
+        headers += f'Authorization: Bearer {token}\r\n'
+    writer.write(f'{method} {path} HTTP/1.1\r\n{headers}\r\n'.encode() + payload)
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+def test_http_service(library_system, sample_book, sample_member):
+    library_system.storage.add_book(sample_book)
+    library_system.auth.register_member(sample_member['member_id'], sample_member['name'],
+                                        sample_member['password'], sample_member['email'])
+
+    async def scenario():
+        server = LibraryServer(library_system, port=0, max_concurrency=4)
+        await server.start()
+        port = server.port
+        try:
+            status, body = await _http(port, 'POST', '/login', {
+                'role': 'member', 'username': sample_member['member_id'],
+                'password': sample_member['password']})
+            assert status == 200
+            token = body['token']
+            status, body = await _http(port, 'GET', '/books?q=test')
+            assert [b['isbn'] for b in body['books']] == [sample_book.isbn]
+            assert (await _http(port, 'POST', '/borrow', {'isbn': sample_book.isbn}))[0] == 401
+            status, body = await _http(port, 'POST', '/borrow', {'isbn': sample_book.isbn}, token)
+            assert status == 200 and body['loan']['isbn'] == sample_book.isbn
+            assert (await _http(port, 'POST', '/borrow', {'isbn': 'missing'}, token)) == \
+                (400, {'error': 'Book not found'})
+            status, body = await _http(port, 'GET', '/loans', token=token)
+            assert len(body['loans']) == 1
+            loan_id = body['loans'][0]['loan_id']
+            assert (await _http(port, 'GET', '/overdue', token=token))[0] == 403
+            assert (await _http(port, 'GET', '/nowhere'))[0] == 404
+            for length in ('abc', '-5', '²'):
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(f'GET /books HTTP/1.1\r\nContent-Length: {length}\r\n\r\n'
+                             .encode('latin-1'))
+                head, _, body = (await reader.read()).partition(b'\r\n\r\n')
+                writer.close()
+                assert (int(head.split()[1]), json.loads(body)) == \
+                    (400, {'error': 'Invalid Content-Length'})
+
+            assert (await _http(port, 'POST', '/return', {'loan_id': loan_id}, token))[0] == 403
+            status, body = await _http(port, 'POST', '/login', {
+                'role': 'librarian', 'username': 'admin', 'password': 'LibAdmin@2024'})
+            librarian = body['token']
+            status, body = await _http(port, 'POST', '/return', {'loan_id': loan_id}, librarian)
+            assert status == 200 and body['loan']['return_date']
+            assert (await _http(port, 'POST', '/return', {'loan_id': loan_id}, librarian)) == \
+                (400, {'error': 'No open loan with that ID'})
+
+            # Only librarians set hold priorities, for a member they name
+            library_system.storage.add_book(Book('OUT1', 'All Out', 'Author', 0, 0))
+            hold = {'isbn': 'OUT1', 'member_id': sample_member['member_id'], 'priority': 2}
+            assert (await _http(port, 'POST', '/holds', hold, token))[0] == 403
+            assert (await _http(port, 'POST', '/holds', dict(hold, member_id='NOBODY'),
+                                librarian)) == (400, {'error': 'Member not found'})
+            status, body = await _http(port, 'POST', '/holds', hold, librarian)
+            assert status == 200 and body['hold']['priority'] == 2 and body['position'] == 1
+        finally:
+            await server.close()
+
+    asyncio.run(scenario())
+    assert library_system.storage.get_book_by_isbn(sample_book.isbn).copies_available == 3
+
+def test_generated_data_is_deterministic(test_data_dir):
+    first, second = os.path.join(test_data_dir, 'a'), os.path.join(test_data_dir, 'b')
+    generate(first, books=200, members=20, loans=2000, seed=7)
+    generate(second, books=200, members=20, loans=2000, seed=7)
+    for name in ('books.csv', 'members.csv', 'loans.csv'):
+        with open(os.path.join(first, name)) as a, open(os.path.join(second, name)) as b:
+            assert a.read() == b.read()
+
+    storage = Storage(first)
+    assert len(storage.get_all_books()) == 200
+    assert len(storage.get_all_loans()) == 2000
+    assert all(b.copies_available >= 0 for b in storage.get_all_books())
+    assert storage.get_overdue_loans(REFERENCE_DATE)
+
+def test_benchmark_compare_flags_regressions():
+    baseline = {'10k/csv/add_book': {'median_ms': 10.0}, '10k/csv/login': {'median_ms': 300.0}}
+    current = {'10k/csv/add_book': {'median_ms': 14.0}, '10k/csv/login': {'median_ms': 310.0},
+               '10k/csv/checkout': {'median_ms': 5.0}}
+    assert compare_results(baseline, current, threshold=0.25) == ['10k/csv/add_book']
+
+def test_metrics_instrumentation(test_data_dir, sample_book, sample_member):
+    metrics = Metrics()
+    library = LibrarySystem(test_data_dir, metrics=metrics)
+    library.storage.add_book(sample_book)
+    library.auth.register_member(sample_member['member_id'], sample_member['name'],
+                                 sample_member['password'], sample_member['email'])
+    assert library.auth.login('member', sample_member['member_id'], sample_member['password'])
+    library.lend_book(sample_member['member_id'], sample_book.isbn)
+
+    counters = metrics.to_dict()['counters']
+    assert counters['library_calls_total{operation="storage.checkout"}'] == 1
+    assert counters['library_rows_parsed_total{kind="books"}'] >= 1
+    assert metrics.histograms['library_bcrypt_duration_ms', ''].count == 1
+    trace = metrics.traces[-1]
+    assert trace['name'] == 'lend_book'
+    assert 'storage.checkout' in [child['name'] for child in trace['children']]
+
+    library.write_metrics()
+    with open(os.path.join(test_data_dir, 'metrics.prom')) as f:
+        assert 'library_calls_total{operation="storage.checkout"} 1' in f.read()
+    # Without metrics nothing is wrapped
+    plain = LibrarySystem(test_data_dir)
+    assert 'add_book' not in vars(plain.storage)
+
+@pytest.mark.parametrize('spec', ['csv', 'cached', 'journal', 'sqlite', 'slots', 'columnar', 'mapped',
+                                  'partitioned'])
+def test_streaming_and_paging(test_data_dir, spec):
+    generate(test_data_dir, books=120, members=15, loans=700, seed=3)
+    if spec == 'partitioned':
+        migrate(test_data_dir, codec='gzip')
+    if spec == 'mapped':
+        BookStore(test_data_dir).create(Storage(test_data_dir).iter_books())
+    if spec == 'sqlite':
+        storage = open_storage(f'sqlite:///{test_data_dir}/library.db')
+        storage.migrate_from_csv(test_data_dir)
+    elif spec in ('slots', 'columnar'):
+        storage = open_storage(test_data_dir, compact=spec)
+    else:
+        storage = open_storage(test_data_dir, cached=spec == 'cached', journal=spec == 'journal')
+    storage.add_book(Book('NEW1', 'Added Later', 'Someone', 2, 2))
+    storage.adjust_availability('NEW1', -1)
+
+    for kind in ('books', 'members', 'loans'):
+        expected = getattr(storage, f'get_all_{kind}')()
+        assert list(getattr(storage, f'iter_{kind}')()) == expected
+        paged, cursor = [], None
+        while True:
+            page = getattr(storage, f'page_{kind}')(50, cursor)
+            paged.extend(page.items)
+            cursor = page.cursor
+            if cursor is None:
+                break
+        assert paged == expected
+
+    open_loans = [l for l in storage.get_all_loans() if l.return_date is None]
+    assert list(storage.iter_loans(lambda l: l.return_date is None)) == open_loans
+    page = storage.page_loans(3, where=lambda l: l.return_date is None)
+    assert page.items == open_loans[:3]
+    assert storage.page_loans(3, page.cursor, lambda l: l.return_date is None).items == open_loans[3:6]
+    assert storage.get_book_by_isbn('NEW1') in list(storage.iter_books())
+
+def test_book_cursors(test_data_dir):
+    storage = Storage(test_data_dir)
+    for i in range(30):
+        storage.add_book(Book(f'B{i:02}', f'Title {i}', 'Author', 10, 10))
+    page = storage.page_books(10)
+    # books.csv is rewritten a byte shorter, so the cursor's offset moves
+    storage.adjust_availability('B00', -1)
+    assert [b.isbn for b in storage.page_books(10, page.cursor).items] == \
+        [f'B{i}' for i in range(10, 20)]
+    for cursor in (f'{page.cursor.split(":")[0]}:GONE', 'junk', '+1:1'):
+        with pytest.raises(ValueError):
+            storage.page_books(10, cursor)
+
+@pytest.mark.parametrize('compact', ['slots', 'columnar'])
+def test_compact_loan_cache(test_data_dir, compact):
+    generate(test_data_dir, books=50, members=10, loans=400, seed=5)
+    plain = Storage(test_data_dir)
+    storage = CachedStorage(test_data_dir, compact=compact)
+
+    # Same answers as the CSV engine, as ordinary Loan objects
+    assert storage.get_all_loans() == plain.get_all_loans()
+    assert storage.get_member_loans('M0000003') == plain.get_member_loans('M0000003')
+    assert storage.get_overdue_loans(REFERENCE_DATE) == plain.get_overdue_loans(REFERENCE_DATE)
+    assert all(type(loan) is Loan for loan in storage.iter_loans())
+
+    issue_date = datetime(2025, 2, 3)
+    loan = Loan('NEWLOAN', 'M0000003', '9780000000007', issue_date, issue_date + timedelta(days=14))
+    storage.add_loan(loan)
+    assert storage.get_loan_by_id('NEWLOAN') == loan
+    assert storage.get_member_loans('M0000003')[-1] == loan
+
+    # Strings repeated across rows are shared
+    first, *rest = [l for l in storage.get_all_loans() if l.isbn == '9780000000007']
+    assert all(l.isbn is first.isbn for l in rest)
+
+    compact_loan = CompactLoan.from_loan(loan)
+    assert compact_loan.due_date == datetime(2025, 2, 17) and compact_loan.return_date is None
+    compact_loan.return_date = datetime(2025, 2, 10)
+    assert compact_loan.to_loan() == Loan('NEWLOAN', 'M0000003', '9780000000007', issue_date,
+                                          datetime(2025, 2, 17), datetime(2025, 2, 10))
+    with pytest.raises(ValueError):
+        CachedStorage(test_data_dir, compact='tiny')
+
+@pytest.mark.parametrize('spec', ['csv', 'cached', 'columnar', 'mapped', 'partitioned', 'sqlite'])
+def test_loan_returns(test_data_dir, sample_book, spec):
+    if spec == 'partitioned':
+        migrate(test_data_dir)
+    if spec == 'sqlite':
+        open_engine = lambda: open_storage(f'sqlite:///{test_data_dir}/library.db')
+    else:
+        if spec == 'mapped':
+            BookStore(test_data_dir).create([])
+        open_engine = lambda: open_storage(test_data_dir, cached=spec == 'cached',
+                                           compact='columnar' if spec == 'columnar' else None)
+    storage, other = open_engine(), open_engine()
+    storage.add_book(sample_book)
+    now = datetime.now()
+    loans = [Loan(f'L{i}', 'TEST001', sample_book.isbn, now - timedelta(days=30),
+                  now - timedelta(days=days)) for i, days in enumerate([16, 2, -5])]
+    assert all(storage.checkout(loan) for loan in loans)
+    assert [l.loan_id for l in other.get_overdue_loans()] == ['L0', 'L1']
+    loans_size = os.path.getsize(storage.loans_file) if spec not in ('sqlite', 'partitioned') else None
+
+    returned = storage.return_loan('L0', now)
+    assert (returned.loan_id, returned.return_date) == ('L0', now)
+    assert storage.return_loan('L0') is None
+    assert storage.return_loan('missing') is None
+    assert other.return_loan('L1') is not None
+    if loans_size is not None:
+        # The history is never rewritten
+        assert os.path.getsize(storage.loans_file) == loans_size
+
+    for engine in (storage, other, open_engine()):
+        assert engine.get_book_by_isbn(sample_book.isbn).copies_available == 2
+        assert engine.get_overdue_loans() == []
+        assert [l.loan_id for l in engine.get_loans_due_soon(7)] == ['L2']
+        history = {l.loan_id: l.return_date for l in engine.get_member_loans('TEST001')}
+        assert history['L0'].date() == now.date() and history['L1'] and history['L2'] is None
+        assert [l.loan_id for l in engine.iter_loans(lambda l: l.return_date is None)] == ['L2']
+        assert engine.page_loans(5).items == engine.get_all_loans()
+        assert engine.get_loan_by_id('L0').return_date.date() == now.date()
+
+    library = LibrarySystem(test_data_dir) if spec == 'csv' else None
+    if library is not None:
+        assert library.receive_return(' L2 ').loan_id == 'L2'
+        with pytest.raises(LibraryError):
+            library.receive_return('L2')
+
+@pytest.mark.parametrize('spec', ['csv', 'journal', 'cached', 'mapped', 'partitioned', 'sqlite'])
+def test_batch_checkout(test_data_dir, spec):
+    if spec == 'partitioned':
+        migrate(test_data_dir)
+    if spec == 'sqlite':
+        open_engine = lambda: open_storage(f'sqlite:///{test_data_dir}/library.db')
+    else:
+        if spec == 'mapped':
+            BookStore(test_data_dir).create([])
+        open_engine = lambda: open_storage(test_data_dir, cached=spec == 'cached',
+                                           journal=spec == 'journal')
+    storage = open_engine()
+    for isbn, copies in [('B1', 2), ('B2', 1), ('B3', 0)]:
+        storage.add_book(Book(isbn, f'Title {isbn}', 'Author', copies, copies))
+    now = datetime.now()
+    loan = lambda i, isbn: Loan(f'L{i}', 'TEST001', isbn, now, now + timedelta(days=14))
+
+    # A failing item leaves the catalogue and the history untouched
+    assert storage.checkout_many([loan(0, 'B1'), loan(1, 'B3')], all_or_nothing=True) == \
+        [False, False]
+    assert storage.get_all_loans() == []
+    assert storage.get_book_by_isbn('B1').copies_available == 2
+
+    taken = storage.checkout_many([loan(2, 'B1'), loan(3, 'B1'), loan(4, 'B1'),
+                                   loan(5, 'B2'), loan(6, 'B3'), loan(7, 'NOPE')])
+    assert taken == [True, True, False, True, False, False]
+    for engine in (storage, open_engine()):
+        assert [l.loan_id for l in engine.get_all_loans()] == ['L2', 'L3', 'L5']
+        assert [engine.get_book_by_isbn(i).copies_available for i in ('B1', 'B2')] == [0, 0]
+
+def test_lend_books(test_data_dir):
+    library = LibrarySystem(test_data_dir)
+    library.storage.add_member(Member('TEST001', 'Test User', 'x', 'test@example.com',
+                                      datetime(2025, 1, 1)))
+    for isbn, copies in [('B1', 2), ('B2', 1), ('B3', 1)]:
+        library.storage.add_book(Book(isbn, f'Title {isbn}', 'Author', copies, copies))
+    member = 'TEST001'
+    with pytest.raises(LibraryError):
+        library.lend_books('NOBODY', ['B1'])
+
+    # B3 is set aside for the member's hold, so it comes from the hold shelf
+    hold = library.place_hold(member, 'B3')
+    outcomes = library.lend_books(member, ['B1', 'B2', 'B2', 'NOPE'], all_or_nothing=True)
+    assert [o.error for o in outcomes] == ['Not issued: another book could not be'] * 2 + \
+        ['No copies available', 'Book not found']
+    assert library.storage.get_all_loans() == []
+
+    outcomes = library.lend_books(member, [' B1 ', 'B2', 'B3', 'B2', ''])
+    assert [o.isbn for o in outcomes] == ['B1', 'B2', 'B3', 'B2']
+    assert [bool(o.loan) for o in outcomes] == [True, True, True, False]
+    assert outcomes[3].error == 'No copies available'
+    assert library.holds.get(hold.hold_id) is None
+    assert sorted(l.isbn for l in library.storage.get_member_loans(member)) == ['B1', 'B2', 'B3']
+    assert [library.storage.get_book_by_isbn(i).copies_available for i in ('B1', 'B2', 'B3')] == \
+        [1, 0, 0]
+
+def test_hold_queue_positions():
+    queue = HoldQueue()
+    for i in range(3000):
+        queue.push(f'H{i}', priority=1 if i % 1000 == 999 else 0)
+    assert [queue.position(h) for h in ('H999', 'H1999', 'H2999', 'H0', 'H2000')] == \
+        [1, 2, 3, 4, 2002]
+    assert queue.remove('H1000') and queue.remove('H0') and not queue.remove('H0')
+    assert queue.position('H1') == 4 and queue.position('H2000') == 2000
+    order = [queue.pop() for _ in range(len(queue))]
+    assert order[:4] == ['H999', 'H1999', 'H2999', 'H1'] and 'H1000' not in order
+    assert order[-1] == 'H2998' and queue.pop() is None
+
+def test_holds(test_data_dir, sample_book):
+    library = LibrarySystem(test_data_dir)
+    library.storage.add_book(Book('HOLD1', 'Popular', 'Author', 1, 1))
+    first = library.lend_book('M1', 'HOLD1', verify_member=False)
+    holds = [library.place_hold(m, 'HOLD1', verify_member=False) for m in ('M2', 'M3')]
+    urgent = library.place_hold('M4', 'HOLD1', 1, False)
+    with pytest.raises(LibraryError):
+        library.place_hold('M2', 'HOLD1', verify_member=False)
+    assert [library.holds.position(h.hold_id) for h in holds + [urgent]] == [2, 3, 1]
+    with pytest.raises(LibraryError):
+        library.lend_book('M2', 'HOLD1', verify_member=False)
+
+    # A returned copy goes to the front of the queue, not back on the shelf
+    library.receive_return(first.loan_id)
+    assert library.storage.get_book_by_isbn('HOLD1').copies_available == 0
+    assert library.holds.get(urgent.hold_id).expires is not None
+    with pytest.raises(LibraryError):
+        library.lend_book('M2', 'HOLD1', verify_member=False)
+    second = library.lend_book('M4', 'HOLD1', verify_member=False)
+    assert library.holds.get(urgent.hold_id) is None
+    assert library.storage.get_book_by_isbn('HOLD1').copies_available == 0
+    assert [p for _, p in library.member_holds('M3')] == [2]
+
+    # A copy not collected in time passes to the next hold
+    library.receive_return(second.loan_id)
+    assert library.member_holds('M2')[0][1] is None
+    library._expire_holds(datetime.now() + timedelta(days=4))
+    assert library.member_holds('M2') == []
+    assert library.holds.get(holds[1].hold_id).expires is not None
+
+    # Another process replays the same queues, and cancelling frees the copy
+    other = LibrarySystem(test_data_dir)
+    assert [p for _, p in other.member_holds('M3')] == [None]
+    other.cancel_hold('M3', holds[1].hold_id)
+    assert library.storage.get_book_by_isbn('HOLD1').copies_available == 1
+    assert library.holds.ready_holds('HOLD1') == []
+
+    # Compaction keeps the live holds and their order
+    queues = HoldQueues(test_data_dir, compact_rows=10)
+    placed = [queues.place(f'C{i}', 'HOLD2') for i in range(8)]
+    for hold in placed[:6]:
+        queues.close(hold.hold_id)
+    with open(queues.path) as f:
+        assert len(f.readlines()) < 14
+    assert [HoldQueues(test_data_dir).position(h.hold_id) for h in placed[6:]] == [1, 2]
+
+def test_loan_partitions(test_data_dir):
+    generate(test_data_dir, books=60, members=10, loans=1500, seed=5)
+    plain = Storage(test_data_dir)
+    by_id = lambda loans: sorted(loans, key=lambda l: l.loan_id)
+    loans = by_id(plain.get_all_loans())
+    overdue = plain.get_overdue_loans(REFERENCE_DATE)
+    member = loans[0].member_id
+    window = (REFERENCE_DATE - timedelta(days=75), REFERENCE_DATE - timedelta(days=20))
+    issued = by_id(plain.get_loans_issued(*window))
+    assert issued and len(issued) < len(loans) / 5
+
+    assert migrate(test_data_dir, codec='lzma') == len(loans)
+    assert not os.path.exists(os.path.join(test_data_dir, 'loans.csv'))
+    storage = open_storage(test_data_dir)
+    assert isinstance(storage, PartitionedStorage)
+    months = storage.partitions.months()
+    assert all(path.endswith('.csv.xz') for path in months.values())
+    assert by_id(storage.get_all_loans()) == loans
+    assert storage.get_overdue_loans(REFERENCE_DATE) == overdue
+    assert by_id(storage.get_member_loans(member)) == by_id(l for l in loans if l.member_id == member)
+    assert by_id(storage.get_loans_issued(*window)) == issued
+    assert len(storage.partitions.between(*window)) <= 3
+
+    # Loans land in the month they were issued, compressed or not
+    old = Loan('OLD', member, loans[0].isbn, datetime(2023, 6, 5), datetime(2023, 6, 19))
+    new = Loan('NEW', member, loans[0].isbn, datetime(2030, 1, 2), datetime(2030, 1, 16))
+    storage.add_loans([old, new])
+    assert storage.partitions.months()['2030-01'].endswith('.csv')
+    other = PartitionedStorage(test_data_dir)
+    assert other.get_loans_issued(datetime(2023, 6, 1), datetime(2023, 7, 1))[-1].loan_id == 'OLD'
+    assert other.get_loan_by_id('NEW').due_date == datetime(2030, 1, 16)
+
+    # Returns shrink the active partition once it is mostly returned loans
+    small = PartitionedStorage(test_data_dir, active_max_bytes=1)
+    open_ids = [l.loan_id for l in small.get_overdue_loans(datetime.max)]
+    for loan_id in open_ids[:-1]:
+        assert small.return_loan(loan_id) is not None
+    with open(small.loans_file) as f:
+        assert len(f.readlines()) < len(open_ids)
+    assert [l.loan_id for l in other.get_overdue_loans(datetime.max)] == open_ids[-1:]
+    assert other.return_loan(open_ids[-1]) is not None
+    assert other.get_overdue_loans(datetime.max) == []
+    # The returns left returns.csv with the loans, but history still has them
+    with open(small.returns_file) as f:
+        assert len(f.readlines()) < len(open_ids) / 2
+    assert os.path.exists(small.partitions.returns_path(REFERENCE_DATE.strftime('%Y-%m')))
+    returned = {l.loan_id: l.return_date for l in PartitionedStorage(test_data_dir).get_all_loans()}
+    assert all(returned[loan_id] for loan_id in open_ids)
+
+    assert export(test_data_dir) == len(loans) + 2
+    assert not os.path.isdir(os.path.join(test_data_dir, 'loans'))
+    exported = open_storage(test_data_dir).get_all_loans()
+    assert len(exported) == len(loans) + 2
+    assert all(l.return_date for l in exported if l.loan_id in open_ids)
+
+@pytest.mark.parametrize('spec', ['csv', 'cached', 'partitioned'])
+def test_buffered_appends(test_data_dir, sample_book, spec):
+    if spec == 'partitioned':
+        migrate(test_data_dir)
+    open_engine = lambda: open_storage(test_data_dir, cached=spec == 'cached')
+    storage = open_engine()
+    storage.add_book(sample_book)
+    storage.buffer_appends(max_records=3, max_ms=None, durability='none')
+    other = open_engine()
+    now = datetime.now()
+    loan = lambda i: Loan(f'L{i}', 'TEST001', sample_book.isbn, now, now + timedelta(days=14))
+
+    storage.add_loan(loan(1))
+    storage.add_loans([loan(2)])
+    # Waiting in the buffer, but read back here
+    assert other.get_all_loans() == []
+    assert [l.loan_id for l in storage.get_overdue_loans(now + timedelta(days=15))] == ['L1', 'L2']
+    assert [l.loan_id for l in other.get_all_loans()] == ['L1', 'L2']
+
+    # A full group is written without a read
+    storage.add_loans([loan(3), loan(4)])
+    assert len(other.get_all_loans()) == 2
+    storage.add_loan(loan(5))
+    assert [l.loan_id for l in other.get_all_loans()] == ['L1', 'L2', 'L3', 'L4', 'L5']
+    assert storage.return_loan('L5') is not None
+    assert other.get_loan_by_id('L5').return_date is not None
+
+    # A checkout writes its loan together with the copy it took
+    assert storage.checkout(loan(6)) and storage.checkout_many([loan(7)]) == [True]
+    assert [l.loan_id for l in other.get_all_loans()][-2:] == ['L6', 'L7']
+
+    storage.add_member(Member('M1', 'Buffered', 'hash', 'm1@example.com', now))
+    assert other.get_member_by_id('M1') is None
+    Auth(storage).logout()
+    assert other.get_member_by_id('M1').name == 'Buffered'
+
+def test_group_commit_durability(test_data_dir, monkeypatch):
+    fsyncs = []
+    monkeypatch.setattr(os, 'fsync', lambda fd: fsyncs.append(fd))
+    storage = Storage(test_data_dir)
+    members = lambda: len(Storage(test_data_dir).get_all_members())
+    member = lambda i: Member(f'M{i}', 'Name', 'hash', 'e@example.com', datetime.now())
+
+    # The default writes each member at once, without fsync
+    storage.add_member(member(0))
+    assert (members(), len(fsyncs)) == (1, 0)
+
+    storage.buffer_appends(max_records=2, max_ms=None, durability='record')
+    storage.add_member(member(1))
+    storage.add_member(member(2))
+    assert (members(), len(fsyncs)) == (3, 2)
+
+    storage.buffer_appends(max_records=2, max_ms=None, durability='batch')
+    storage.add_members([member(3), member(4), member(5)])
+    storage.add_member(member(6))
+    assert (members(), len(fsyncs)) == (6, 3)
+
+    with pytest.raises(ValueError):
+        storage.buffer_appends(durability='always')
+
+    # Reconfiguring writes what is waiting, and a partial group is
+    # written once its oldest row is max_ms old
+    storage.buffer_appends(max_records=100, max_ms=20, durability='batch')
+    assert (members(), len(fsyncs)) == (7, 4)
+    storage.add_member(member(7))
+    deadline = datetime.now() + timedelta(seconds=5)
+    while members() == 7 and datetime.now() < deadline:
+        time.sleep(0.01)
+    assert (members(), len(fsyncs)) == (8, 5)
+
+def test_circulation_analytics(test_data_dir):
+    analytics = pytest.importorskip('analytics')
+    generate(test_data_dir, books=40, members=8, loans=500, seed=9)
+    storage = Storage(test_data_dir)
+    loans = storage.get_all_loans()
+    # A quoted row takes the csv module path for its chunk
+    storage.add_loan(Loan('L,1', 'M0000001', '9780000000002', datetime(2024, 12, 1),
+                          datetime(2024, 12, 15), datetime(2024, 12, 30)))
+    loans.append(storage.get_all_loans()[-1])
+
+    columns, books = analytics.load(test_data_dir)
+    assert len(columns) == len(loans) == len(analytics.loans_from_records(loans))
+    per_isbn = {}
+    for loan in loans:
+        per_isbn[loan.isbn] = per_isbn.get(loan.isbn, 0) + 1
+    assert dict(analytics.loans_per_isbn(columns)) == per_isbn
+    assert sum(n for _, n in analytics.loans_per_member(columns, top=3)) == \
+        sum(sorted(Counter(l.member_id for l in loans).values())[-3:])
+    assert sum(n for _, n in analytics.loans_per_month(columns)) == len(loans)
+
+    returned = [l for l in loans if l.return_date]
+    duration = analytics.loan_duration(columns)
+    assert duration['returned'] == len(returned)
+    assert duration['mean_days'] == pytest.approx(
+        sum((l.return_date - l.issue_date).days for l in returned) / len(returned))
+    lateness = analytics.lateness(columns, REFERENCE_DATE)
+    assert lateness['15-30 days'] == 1
+    assert lateness['open, overdue'] == len(storage.get_overdue_loans(REFERENCE_DATE))
+
+    isbn, _, on_loan, total, share = analytics.utilization(books, top=1)[0]
+    book = storage.get_book_by_isbn(isbn)
+    assert (on_loan, total) == (book.copies_total - book.copies_available, book.copies_total)
+
+    # Appended rows are added to the cached columns
+    assert os.path.exists(os.path.join(test_data_dir, analytics.COLUMNS_CACHE))
+    storage.add_loan(Loan('L2', 'NEWMEMBER', '9780000000002', datetime(2025, 1, 2),
+                          datetime(2025, 1, 16)))
+    columns, _ = analytics.load(test_data_dir)
+    assert len(columns) == len(loans) + 1
+    assert ('NEWMEMBER', 1) in analytics.loans_per_member(columns)
+    assert dict(analytics.loans_per_isbn(columns))['9780000000002'] == per_isbn['9780000000002'] + 1
+
+    # Returns recorded in returns.csv are applied on top of the cached columns
+    assert storage.return_loan('L2', datetime(2025, 1, 20))
+    columns, _ = analytics.load(test_data_dir)
+    assert analytics.loan_duration(columns)['returned'] == len(returned) + 1